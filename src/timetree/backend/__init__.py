@@ -7,11 +7,14 @@ Different backends may support different levels of persistence, from partial
 to full to confluent persistence.
 """
 
+from .base import DELETED
 from .base import BaseBackend
 from .bsearch_linearized_full import BsearchLinearizedFullBackend
 from .bsearch_partial import BsearchPartialBackend
+from .bsearch_partial import CompactBsearchPartialBackend
 from .bst_linearized_full import BSTLinearizedFullBackend
 from .copy import CopyBackend
+from .copy_on_write import CopyOnWriteBackend
 from .nop import NopBackend
 from .split_linearized_full import SplitLinearizedFullBackend
 from .split_partial import SplitPartialBackend
@@ -21,7 +24,10 @@ __all__ = [
     'BsearchLinearizedFullBackend',
     'BsearchPartialBackend',
     'BSTLinearizedFullBackend',
+    'CompactBsearchPartialBackend',
     'CopyBackend',
+    'CopyOnWriteBackend',
+    'DELETED',
     'NopBackend',
     'SplitLinearizedFullBackend',
     'SplitPartialBackend',
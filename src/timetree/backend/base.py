@@ -2,7 +2,7 @@ from abc import ABCMeta
 from abc import abstractmethod
 from collections import defaultdict
 
-__all__ = ['BaseBackend', 'BaseVersion', 'BaseVnode']
+__all__ = ['BaseBackend', 'BaseVersion', 'BaseVnode', 'NodeIdentity', 'DELETED']
 
 
 class BaseBackend(metaclass=ABCMeta):
@@ -204,6 +204,15 @@ class BaseVnode(metaclass=ABCMeta):
         """ Return the backend of this vnode """
         return self.version.backend
 
+    @property
+    @abstractmethod
+    def identity(self):
+        """ Return the :py:class:`NodeIdentity` of this vnode's node
+
+        Every vnode of a node shares it, across all versions, so code outside
+        the backend can key unversioned per-node data on it.
+        """
+
     @abstractmethod
     def get(self, field):
         """ Get a field of a vnode
@@ -213,6 +222,43 @@ class BaseVnode(metaclass=ABCMeta):
         :raises KeyError: Field not found in vnode
         """
 
+    def get_many(self, fields):
+        """ Get several fields of a vnode at once
+
+        Equivalent to calling :py:meth:`.get` on each field, but backends
+        may override it to look them all up in one pass.
+
+        :param fields: Iterable of field names
+        :return: Dict mapping each field name to its value
+        :raises KeyError: Field not found in vnode
+        """
+        return {field: self.get(field) for field in fields}
+
+    @abstractmethod
+    def items(self):
+        """ Get every field of a vnode
+
+        :return: List of (field name, value) pairs of all fields present in
+            the vnode, in no particular order
+        """
+
+    @abstractmethod
+    def history(self, field):
+        """ Iterate over the changes to a field, up to this vnode's version
+
+        Yields (version, value) pairs, oldest first: from `version` on, the
+        field had `value` until the next pair's version. Value is
+        :py:data:`DELETED` where the field was deleted, and vnodes are bound
+        to the pair's version. Only versions along the history of this
+        vnode's version appear; partial and linearized full backends make
+        new commit objects for them, and backends may leave out versions
+        which have been garbage collected. Don't modify the backend while
+        iterating.
+
+        :param field: Field name
+        :return: Generator of (version, value) pairs
+        """
+
     @abstractmethod
     def set(self, field, value):
         """ Set a field of a vnode
@@ -240,6 +286,31 @@ class BaseVnode(metaclass=ABCMeta):
         if not self.version.is_head:
             raise ValueError("Can only delete from head versions")
 
+    def set_many(self, mapping):
+        """ Set several fields of a vnode at once
+
+        Equivalent to calling :py:meth:`.set` on each item in order, but
+        backends may override it to validate and store the batch in one pass.
+
+        :param mapping: Mapping (or iterable of pairs) of field names to values
+        :return: None
+        :raises ValueError: A value is a vnode but isn't at the same version
+        """
+        for field, value in dict(mapping).items():
+            self.set(field, value)
+
+    def delete_many(self, fields):
+        """ Delete several fields of a vnode at once
+
+        Equivalent to calling :py:meth:`.delete` on each field in order.
+
+        :param fields: Iterable of field names
+        :return: None
+        :raises KeyError: Field not found in vnode
+        """
+        for field in fields:
+            self.delete(field)
+
     def commit(self):
         """ Commit this vnode and return the new vnode
 
@@ -257,3 +328,25 @@ class BaseVnode(metaclass=ABCMeta):
         """
         new_version, [new_vnode] = self.backend.branch([self])
         return new_vnode
+
+
+class _Deleted:
+    """ Type of :py:data:`DELETED` """
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'DELETED'
+
+
+DELETED = _Deleted()
+""" Value reported by :py:meth:`BaseVnode.history` for a deleted field """
+
+
+class NodeIdentity:
+    """ Token identifying a node across all of its versions
+
+    Backends create one per new node and hand it on to every vnode (or dnode)
+    which represents the same node. It can be weakly referenced, so side
+    tables keyed on it go away with the node.
+    """
+    __slots__ = ('__weakref__',)
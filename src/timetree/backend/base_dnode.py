@@ -1,19 +1,73 @@
+import weakref
 from abc import ABCMeta
 from abc import abstractmethod
 
+from .base import DELETED
+from .base import NodeIdentity
 from .base_util import BaseCopyableVnode
 
 
 class BaseDnode(metaclass=ABCMeta):
-    __slots__ = ('backend',)
+    """ A node's fields over the versions it covers
 
-    def __init__(self, backend):
+    Subclasses keep each field's mods in `mods_dict`, and read them with
+    :py:meth:`_value_at`, which returns `_deleted_marker` where the field is
+    absent.
+    """
+    __slots__ = ('backend', 'identity',)
+
+    def __init__(self, backend, identity=None):
         self.backend = backend
+        self.identity = NodeIdentity() if identity is None else identity
 
     @abstractmethod
     def get(self, field, version_num):
         pass
 
+    def get_many(self, fields, version_num):
+        """ Get each field in fields as a dict; dnodes may batch this """
+        mods_dict = self.mods_dict
+        deleted_marker = self._deleted_marker
+        value_at = self._value_at
+
+        result = {}
+        for field in fields:
+            mods = mods_dict.get(field)
+            value = value_at(mods, version_num) if mods is not None else deleted_marker
+            if value is deleted_marker:
+                raise KeyError(field)
+            result[field] = value
+        return result
+
+    def items(self, version_num):
+        """ List the (field, value) pairs of every field present at version_num """
+        deleted_marker = self._deleted_marker
+        value_at = self._value_at
+
+        result = []
+        for field, mods in self.mods_dict.items():
+            value = value_at(mods, version_num)
+            if value is not deleted_marker:
+                result.append((field, value))
+        return result
+
+    @abstractmethod
+    def _value_at(self, mods, version_num):
+        """ Value of a field's mods at version_num, or the deleted marker if
+        the field didn't exist then
+        """
+        pass
+
+    @abstractmethod
+    def history(self, field, version_num):
+        """ Iterate over (version_num, value) for each of field's mods at or
+        before version_num, in version order
+
+        Deletions are reported as :py:data:`.DELETED`. Mods may repeat the
+        previous value, and on full backends may belong to other branches.
+        """
+        pass
+
     @abstractmethod
     def set(self, field, value, version_num):
         pass
@@ -22,14 +76,59 @@ class BaseDnode(metaclass=ABCMeta):
     def delete(self, field, version_num):
         pass
 
+    def set_many(self, items, version_num):
+        """ Set each (field, value) pair in items; dnodes may batch this """
+        for field, value in items:
+            self.set(field, value, version_num)
+
+    def delete_many(self, fields, version_num):
+        """ Delete each field in fields; dnodes may batch this """
+        for field in fields:
+            self.delete(field, version_num)
+
+
+class VnodeCache(dict):
+    """ A version's interned vnodes, as weak references by node identity
+
+    Rather than each vnode removing itself with a callback as it dies, dead
+    entries are swept out whenever the cache has doubled in size.
+    """
+    __slots__ = ('sweep_at',)
+
+    def __init__(self):
+        super().__init__()
+        self.sweep_at = 64
+
+    def add(self, vnode):
+        """ Intern vnode, replacing any vnode of the same node """
+        self[vnode.dnode.identity] = weakref.ref(vnode)
+        if len(self) >= self.sweep_at:
+            self.sweep()
+
+    def sweep(self):
+        """ Drop the entries of dead vnodes """
+        for identity, vnode_ref in list(self.items()):
+            if vnode_ref() is None:
+                del self[identity]
+        self.sweep_at = max(64, 2 * len(self))
+
 
 class BaseDnodeBackedVnode(BaseCopyableVnode):
-    __slots__ = ('dnode', )
+    """ Vnode of a version, backed by a dnode
+
+    Vnodes are interned per version and node in the version's
+    `vnode_cache`, a :py:class:`VnodeCache`, so walking a structure reuses
+    the handles still alive from last time, and equal vnodes are almost
+    always the same object.
+    """
+    __slots__ = ('dnode', '__weakref__',)
 
     dnode_cls = BaseDnode  # Illegal
 
     def __init__(self, version, *, dnode=None):
-        super().__init__(version)
+        # OPTIMIZATION: Set the version here rather than through super(),
+        # since a vnode is made whenever a dereference misses the cache
+        self.version = version
 
         if dnode is not None:
             # Restore an old vnode
@@ -37,14 +136,71 @@ class BaseDnodeBackedVnode(BaseCopyableVnode):
             return
 
         self.dnode = self.dnode_cls(self.backend)
+        version.vnode_cache.add(self)
+
+    @classmethod
+    def _interned(cls, version, dnode):
+        """ The vnode of dnode's node at version, reusing a live one """
+        cache = version.vnode_cache
+        identity = dnode.identity
+        vnode_ref = cache.get(identity)
+        if vnode_ref is not None:
+            vnode = vnode_ref()
+            # A vnode left with another dnode of the node (say by a read
+            # racing a split) gets replaced, so reads keep using the dnode
+            # just found
+            if vnode is not None and vnode.dnode is dnode:
+                return vnode
+
+        # OPTIMIZATION: Inlines VnodeCache.add, since walking a structure
+        # without keeping its handles misses every time
+        vnode = cls(version, dnode=dnode)
+        cache[identity] = weakref.ref(vnode)
+        if len(cache) >= cache.sweep_at:
+            cache.sweep()
+        return vnode
+
+    @property
+    def identity(self):
+        return self.dnode.identity
 
     def get(self, field):
         super().get(field)
         result = self.dnode.get(field, self.version.version_num)
         if isinstance(result, self.dnode_cls):
-            result = self.__class__(self.version, dnode=result)
+            result = self._interned(self.version, result)
+        return result
+
+    def get_many(self, fields):
+        result = self.dnode.get_many(fields, self.version.version_num)
+        for field, value in result.items():
+            if isinstance(value, self.dnode_cls):
+                result[field] = self._interned(self.version, value)
         return result
 
+    def items(self):
+        return [
+            (field, self._interned(self.version, value) if isinstance(value, self.dnode_cls) else value)
+            for field, value in self.dnode.items(self.version.version_num)
+        ]
+
+    def history(self, field):
+        version = self.version
+        last = DELETED
+        for version_num, value in version._history(self.dnode.history(field, version.version_num)):
+            # Skip mods which don't change the value, counting different
+            # dnodes of the same node (made by splits) as the same value
+            if value is last or (
+                    isinstance(value, BaseDnode) and isinstance(last, BaseDnode)
+                    and value.identity is last.identity):
+                continue
+            last = value
+
+            at = version._ancestor(version_num)
+            if isinstance(value, self.dnode_cls):
+                value = self._interned(at, value)
+            yield at, value
+
     def set(self, field, value):
         super().set(field, value)
         if self.backend.is_vnode(value):
@@ -55,11 +211,35 @@ class BaseDnodeBackedVnode(BaseCopyableVnode):
         super().delete(field)
         self.dnode.delete(field, self.version.version_num)
 
+    def set_many(self, mapping):
+        if not self.version.is_head:
+            raise ValueError("Can only set in head versions")
+
+        items = []
+        for field, value in dict(mapping).items():
+            if self.backend.is_vnode(value):
+                if self.version != value.version:
+                    raise ValueError("Mismatched versions")
+                value = value.dnode
+            items.append((field, value))
+        self.dnode.set_many(items, self.version.version_num)
+
+    def delete_many(self, fields):
+        if not self.version.is_head:
+            raise ValueError("Can only delete from head versions")
+        self.dnode.delete_many(list(fields), self.version.version_num)
+
     def copy(self, version):
-        return self.__class__(version, dnode=self.dnode)
+        return self._interned(version, self.dnode)
 
+    # Compare by identity rather than dnode, which splitting backends may
+    # swap out from under a vnode
     def __eq__(self, other):
-        return (self.version, self.dnode) == (other.version, other.dnode)
+        # OPTIMIZATION: Interned vnodes are equal only if they're the same
+        # object, barring races between threads making them
+        return self is other or (
+            isinstance(other, BaseDnodeBackedVnode)
+            and self.version is other.version and self.dnode.identity is other.dnode.identity)
 
     def __hash__(self):
-        return hash((self.version, self.dnode))
+        return hash(self.dnode.identity)
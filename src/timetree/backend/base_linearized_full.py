@@ -1,23 +1,192 @@
+import time
+import weakref
 from abc import ABCMeta
 
 from .base import BaseVersion
+from .base_dnode import BaseDnodeBackedVnode
+from .base_dnode import VnodeCache
 from .base_util import BaseCopyableVnode
 from .base_util import BaseDivergentBackend
 from .util.order_maintenance import FastLabelerList
-from .util.order_maintenance import FastLabelerNode
 
 
 class BaseLinearizedFullBackend(BaseDivergentBackend):
-    __slots__ = ('version_list', 'v_0', 'v_inf')
+    """ (Optional) base class for fully persistent backends which linearize
+    the version tree into an order-maintenance list
+
+    :param version_list_cls: Order-maintenance list class to use for
+        versions, e.g. :py:class:`.BucketLabelerList`; defaults to the
+        class's version_list_cls
+
+    Writes to heads (and new versions, which relabel the version list)
+    rewrite history that commits share, so they bump `write_seq` before and
+    after. Reads of commits through :py:class:`BaseLinearizedFullVnode` run
+    optimistically and retry if a write overlapped them, letting other
+    threads read commits while one thread writes.
+
+    The list order alone doesn't say which versions a version descends
+    from, so `parents` maps each version number to its parent's. Children
+    are inserted right after their parent, so each version's descendants
+    come right after it in the list, up to the version which followed it
+    when it was inserted; `ends` maps each version number to that one.
+    `jumps` maps each one to a (jump, depth) pair of a further ancestor and
+    its own depth, skew-binary jump pointers (Myers, "An applicative
+    random-access stack") with which an ancestor is found in time
+    logarithmic in the depth. `commits` weakly maps version numbers to the
+    live commit at them.
+
+    Versions are garbage collected: `versions` weakly tracks the live head
+    and commit objects, and :py:meth:`compact` drops every other version
+    from the version list, rewriting the dnodes (weakly tracked in
+    `dnodes`) to match. The value of each field at each live version is
+    kept, but a field's history no longer shows the dropped versions.
+    """
+    __slots__ = ('version_list', 'v_0', 'v_inf', 'parents', 'ends', 'jumps', 'write_seq', 'reader_waiting',
+                 'versions', 'commits', 'dnodes', 'next_compaction',)
 
     vnode_cls = BaseCopyableVnode  # Type of vnodes to create, should be Copyable
+    version_list_cls = FastLabelerList  # Type of order-maintenance list for versions
 
-    def __init__(self):
-        self.version_list = FastLabelerList()
-        self.v_0 = FastLabelerNode()
-        self.v_inf = FastLabelerNode()
+    # Versions at which to compact automatically, at the least; compacting
+    # walks every dnode, so shouldn't run too often
+    compaction_interval = 256
+
+    def __init__(self, version_list_cls=None):
+        if version_list_cls is None:
+            version_list_cls = self.version_list_cls
+        self.version_list = version_list_cls()
+        self.v_0 = self.version_list.node_cls()
+        self.v_inf = self.version_list.node_cls()
         self.version_list.insert_after(None, self.v_0)
         self.version_list.insert_after(self.v_0, self.v_inf)
+        self.parents = {}
+        self.ends = {self.v_0: self.v_inf}
+        self.jumps = {self.v_0: (self.v_0, 0)}
+        self.write_seq = 0
+        self.reader_waiting = False
+        self.versions = weakref.WeakSet()
+        self.commits = weakref.WeakValueDictionary()
+        self.dnodes = weakref.WeakSet()
+        self.next_compaction = self.compaction_interval
+
+    def _begin_write(self):
+        """ Mark the start of a write, which readers of commits must not
+        overlap; every call must be paired with :py:meth:`_end_write` """
+        self.write_seq += 1
+
+    def _end_write(self):
+        self.write_seq += 1
+        if self.reader_waiting:
+            # Hand over to the reader, or a busy writer could starve it
+            self.reader_waiting = False
+            time.sleep(0)
+
+    def _wait_for_write(self):
+        """ Called by readers which found a write in progress """
+        self.reader_waiting = True
+        time.sleep(0)
+
+    def _read_committed(self, fn, *args):
+        """ Run the read fn(*args) of a commit, retrying until no write
+        overlapped it
+
+        fn must not modify anything: it may be run concurrently with other
+        readers, and against half-finished writes.
+        """
+        while True:
+            seq = self.write_seq
+            if seq & 1:
+                self._wait_for_write()
+                continue
+            try:
+                result = fn(*args)
+            except Exception:
+                if self.write_seq == seq:
+                    raise
+                continue
+            if self.write_seq == seq:
+                return result
+
+    def compact(self):
+        """ Drop every version which no live head or commit is at
+
+        Each dnode moves the mods of dropped versions onto the next version
+        left, then merges mods which don't change the value. This takes time
+        linear in the size of all the dnodes, so commits and branches only
+        call it once the number of versions has doubled; call it directly to
+        collect heads and commits which have just died.
+        """
+        live = {version.version_num for version in list(self.versions)}
+        live.add(self.v_0)
+        live.add(self.v_inf)
+
+        # Walk backwards, mapping each dropped version to the next one kept
+        survivors = {}
+        survivor = None
+        for version_num in reversed(self.version_list):
+            if version_num in live:
+                survivor = version_num
+            else:
+                survivors[version_num] = survivor
+
+        if survivors:
+            self._begin_write()
+            try:
+                self._compact_dnodes(survivors)
+
+                # Reparent kept versions onto their nearest kept ancestor;
+                # parents come before their children in the list
+                parents = self.parents
+                kept_ancestors = {}
+                new_parents = {}
+                new_jumps = {self.v_0: (self.v_0, 0)}
+                for version_num in self.version_list:
+                    parent = parents.get(version_num)
+                    if parent is not None and parent in survivors:
+                        parent = kept_ancestors[parent]
+                    if version_num in survivors:
+                        kept_ancestors[version_num] = parent
+                    elif parent is not None:
+                        new_parents[version_num] = parent
+                        new_jumps[version_num] = _child_jump(new_jumps, parent)
+                self.parents = new_parents
+                self.jumps = new_jumps
+
+                # The next version kept after a version's descendants is the
+                # survivor of the one which followed them
+                self.ends = {
+                    version_num: survivors.get(end, end)
+                    for version_num, end in self.ends.items() if version_num not in survivors
+                }
+
+                for version_num in survivors:
+                    version_num.remove_self()
+            finally:
+                self._end_write()
+
+        self.next_compaction = max(self.compaction_interval, 2 * len(self.parents))
+
+    def _compact_dnodes(self, survivors):
+        """ Have every dnode move its mods off the versions being dropped """
+        for dnode in list(self.dnodes):
+            dnode.compact(survivors)
+
+    def _new_version(self, version_num):
+        """ Insert a child of version_num into the version list """
+        if len(self.parents) >= self.next_compaction:
+            self.compact()
+
+        # Inserting into the version list may relabel versions of commits
+        self._begin_write()
+        try:
+            new_version_num = self.version_list.node_cls()
+            self.version_list.insert_after(version_num, new_version_num)
+            self.parents[new_version_num] = version_num
+            self.ends[new_version_num] = new_version_num.next
+            self.jumps[new_version_num] = _child_jump(self.jumps, version_num)
+        finally:
+            self._end_write()
+        return new_version_num
 
     def _commit(self, vnodes):
         """ Default just makes a shallow copy of vnodes and returns it """
@@ -34,9 +203,7 @@ class BaseLinearizedFullBackend(BaseDivergentBackend):
             new_vnode = vnode.copy(commit)
             result.append(new_vnode)
 
-        new_version_num = FastLabelerNode()
-        self.version_list.insert_after(version_num, new_version_num)
-        head.version_num = new_version_num
+        head.version_num = self._new_version(version_num)
 
         return commit, result
 
@@ -45,11 +212,7 @@ class BaseLinearizedFullBackend(BaseDivergentBackend):
 
         version_num = vnodes[0].version.version_num if vnodes else self.v_0
 
-        # Make new versions (and un-version)
-        new_version_num = FastLabelerNode()
-        self.version_list.insert_after(version_num, new_version_num)
-
-        head = LinearizedFullHead(self, new_version_num, self.vnode_cls)
+        head = LinearizedFullHead(self, self._new_version(version_num), self.vnode_cls)
 
         result = []
         for vnode in vnodes:
@@ -59,11 +222,193 @@ class BaseLinearizedFullBackend(BaseDivergentBackend):
         return head, result
 
 
-class BaseLinearizedFullVersion(BaseVersion, metaclass=ABCMeta):
+class BaseLinearizedFullVnode(BaseDnodeBackedVnode):
+    """ (Optional) base class for dnode-backed vnodes of linearized full
+    backends, making writes and reads of commits safe to run concurrently """
     __slots__ = ()
 
+    def get(self, field):
+        # OPTIMIZATION: This is the hot path, so it reads the dnode directly
+        # rather than going through super() and _read_committed
+        version = self.version
+        if version.is_head:
+            result = self.dnode.get(field, version.version_num)
+            if isinstance(result, self.dnode_cls):
+                result = self._interned(version, result)
+            return result
+
+        backend = version.backend
+        while True:
+            seq = backend.write_seq
+            if seq & 1:
+                backend._wait_for_write()
+                continue
+            try:
+                result = self.dnode.get(field, version.version_num)
+                # Wrap before validating, since making a vnode may register
+                # it with the dnode
+                if isinstance(result, self.dnode_cls):
+                    result = self._interned(version, result)
+            except Exception:
+                if backend.write_seq == seq:
+                    raise
+                continue
+            if backend.write_seq == seq:
+                return result
+
+    def get_many(self, fields):
+        if self.version.is_head:
+            return super().get_many(fields)
+        return self.backend._read_committed(super().get_many, list(fields))
+
+    def items(self):
+        if self.version.is_head:
+            return super().items()
+        return self.backend._read_committed(super().items)
+
+    # Writes bump write_seq themselves, rather than through _begin_write and
+    # _end_write, to keep them cheap
+
+    def set(self, field, value):
+        backend = self.version.backend
+        backend.write_seq += 1
+        try:
+            super().set(field, value)
+        finally:
+            backend._end_write()
+
+    def delete(self, field):
+        backend = self.version.backend
+        backend.write_seq += 1
+        try:
+            super().delete(field)
+        finally:
+            backend._end_write()
+
+    def set_many(self, mapping):
+        backend = self.version.backend
+        backend.write_seq += 1
+        try:
+            super().set_many(mapping)
+        finally:
+            backend._end_write()
+
+    def delete_many(self, fields):
+        backend = self.version.backend
+        backend.write_seq += 1
+        try:
+            super().delete_many(fields)
+        finally:
+            backend._end_write()
+
+
+def _child_jump(jumps, parent):
+    """ The (jump, depth) pair of a new child of parent
+
+    The child jumps as far as its parent's jump does again, if the parent
+    jumps as far as its own jump does, and otherwise to its parent.
+    """
+    jump, depth = jumps[parent]
+    jump_jump, jump_depth = jumps[jump]
+    if depth - jump_depth == jump_depth - jumps[jump_jump][1]:
+        return jump_jump, depth + 1
+    return parent, depth + 1
+
+
+def compact_mods(mods, survivors):
+    """ Move a field's (version_num, value) mods off dropped versions
+
+    Mods at a dropped version move to its survivor (the next version kept),
+    where later mods win; then mods which repeat the previous value are
+    merged into it. The first mod is always kept.
+
+    :param mods: The field's mods, in version order
+    :param survivors: Dict mapping each dropped version to its survivor
+    :return: List of the new (version_num, value) mods
+    """
+    result = []
+    for version_num, value in mods:
+        version_num = survivors.get(version_num, version_num)
+        if result and result[-1][0] is version_num:
+            result.pop()
+        if result and result[-1][1] is value:
+            continue
+        result.append((version_num, value))
+    return result
+
+
+class BaseLinearizedFullVersion(BaseVersion, metaclass=ABCMeta):
+    __slots__ = ('vnode_cache', '__weakref__',)
+
+    def __init__(self, backend, is_head):
+        super().__init__(backend, is_head)
+        self.vnode_cache = VnodeCache()
+        backend.versions.add(self)
+
+    def _history(self, mods):
+        """ Turn a dnode's (version_num, value) history of a field into
+        the field's values along this version's ancestors, oldest first
+
+        Other branches' mods are interleaved with the ancestors', and each
+        ancestor's value is that of the last mod at or before it, so every
+        mod is moved to the first ancestor at or after it, where later mods
+        win.
+        """
+        backend = self.backend
+        parents = backend.parents
+        ends = backend.ends
+        jumps = backend.jumps
+        target = self.version_num
+
+        # OPTIMIZATION: Only versions with mods are looked at, rather than
+        # every ancestor. They're taken newest first, so the ancestors they
+        # go to only get older, and each search climbs on from the last with
+        # the jump pointers; a mod at an ancestor takes constant time
+        pairs = []
+        at = None
+        for version_num, value in reversed(list(mods)):
+            if at is None:
+                ancestor = target
+            else:
+                ancestor = parents.get(at)
+                if ancestor is None or ancestor < version_num:
+                    # Goes to the same ancestor as a later mod, which wins
+                    continue
+
+            if target < ends[version_num]:
+                # Mods come at or before target, so only the end of the
+                # version's descendants says if it's an ancestor
+                at = version_num
+            else:
+                # Climb while staying at or after the mod
+                while True:
+                    jump = jumps[ancestor][0]
+                    if jump is not ancestor and version_num <= jump:
+                        ancestor = jump
+                        continue
+                    parent = parents.get(ancestor)
+                    if parent is None or parent < version_num:
+                        break
+                    ancestor = parent
+                at = ancestor
+            pairs.append((at, value))
+        return reversed(pairs)
+
+    def _ancestor(self, version_num):
+        """ Version object for one of this version's ancestors
+
+        Live commits are reused, so reading history doesn't make copies
+        of the versions it passes through.
+        """
+        if version_num is self.version_num:
+            return self
+        commit = self.backend.commits.get(version_num)
+        if commit is None:
+            commit = LinearizedFullCommit(self.backend, version_num)
+        return commit
+
 
-class LinearizedFullHead(BaseVersion):
+class LinearizedFullHead(BaseLinearizedFullVersion):
     __slots__ = ('vnode_cls', 'version_num',)
 
     def __init__(self, backend, version_num, vnode_cls):
@@ -78,12 +423,13 @@ class LinearizedFullHead(BaseVersion):
         return self.vnode_cls(self)
 
 
-class LinearizedFullCommit(BaseVersion):
+class LinearizedFullCommit(BaseLinearizedFullVersion):
     __slots__ = ('version_num',)
 
     def __init__(self, backend, version_num):
         super().__init__(backend, is_head=False)
         self.version_num = version_num
+        backend.commits[version_num] = self
 
     def new_node(self):
         raise ValueError("Can't create a node from a commit")
@@ -1,6 +1,8 @@
+import weakref
 from abc import ABCMeta
 
 from .base import BaseVersion
+from .base_dnode import VnodeCache
 from .base_util import BaseCopyableVnode
 from .base_util import BaseDivergentBackend
 
@@ -13,13 +15,38 @@ class BasePartialBackend(BaseDivergentBackend, metaclass=ABCMeta):
 
     _commit just uses shallow copies to clone vnodes; if this isn't correct,
     override _commit.
+
+    Versions are garbage collected: `commits` weakly tracks the live commit
+    objects, and no version from before `collected_before` (the oldest one
+    live when :py:meth:`compact` last ran) can be read any more, so dnodes
+    may drop mods which only those versions see.
     """
-    __slots__ = ('head')
+    __slots__ = ('head', 'commits', 'collected_before', 'next_compaction',)
 
     vnode_cls = BaseCopyableVnode  # Type of vnodes to create, should be Copyable
 
+    # Commits between automatic compactions, at the least
+    compaction_interval = 64
+
     def __init__(self):
         self.head = PartialHead(self, self.vnode_cls)
+        self.commits = weakref.WeakSet()
+        self.collected_before = 0
+        self.next_compaction = self.compaction_interval
+
+    def compact(self):
+        """ Garbage collect the versions from before the oldest live commit
+
+        Dnodes drop the mods of collected versions as they're next written
+        to, keeping each field's value at the oldest live version. Commits
+        call this every so often, so it only needs to be called to collect
+        commits which have just died.
+        """
+        live = [commit.version_num for commit in list(self.commits)]
+        self.collected_before = min(live, default=self.head.version_num)
+        # OPTIMIZATION: Wait for as many commits as are live, so finding the
+        # oldest costs O(1) per commit
+        self.next_compaction = self.head.version_num + max(self.compaction_interval, len(live))
 
     def _commit(self, vnodes):
         """ Default just makes a shallow copy of vnodes and returns it """
@@ -32,6 +59,8 @@ class BasePartialBackend(BaseDivergentBackend, metaclass=ABCMeta):
             result.append(new_vnode)
 
         self.head.version_num += 1
+        if self.head.version_num >= self.next_compaction:
+            self.compact()
 
         return commit, result
 
@@ -45,7 +74,38 @@ class BasePartialBackend(BaseDivergentBackend, metaclass=ABCMeta):
 
 
 class BasePartialVersion(BaseVersion, metaclass=ABCMeta):
-    __slots__ = ()
+    __slots__ = ('vnode_cache',)
+
+    def __init__(self, backend, is_head):
+        super().__init__(backend, is_head)
+        self.vnode_cache = VnodeCache()
+
+    def _history(self, mods):
+        """ Filter a dnode's (version_num, value) history of a field
+
+        Every earlier version is in a partial version's history, but mods
+        from before the backend's collected versions are folded into one at
+        the oldest version that's left, whose value they determine.
+        """
+        collected_before = self.backend.collected_before
+        missing = pending = object()
+        for version_num, value in mods:
+            if version_num < collected_before:
+                pending = value
+                continue
+            if pending is not missing:
+                if version_num != collected_before:
+                    yield collected_before, pending
+                pending = missing
+            yield version_num, value
+        if pending is not missing:
+            yield collected_before, pending
+
+    def _ancestor(self, version_num):
+        """ Version object for a version number in this version's history """
+        if version_num == self.version_num:
+            return self
+        return PartialCommit(self.backend, version_num)
 
 
 class PartialHead(BasePartialVersion):
@@ -61,11 +121,12 @@ class PartialHead(BasePartialVersion):
 
 
 class PartialCommit(BasePartialVersion):
-    __slots__ = ('version_num', )
+    __slots__ = ('version_num', '__weakref__', )
 
     def __init__(self, backend, version_num):
         super().__init__(backend, is_head=False)
         self.version_num = version_num
+        backend.commits.add(self)
 
     def new_node(self):
         raise ValueError("Can't create a node from a commit")
@@ -1,94 +1,128 @@
-from collections import defaultdict
-from collections import namedtuple
+from bisect import bisect_right
 
+from .base import DELETED
 from .base_dnode import BaseDnode
-from .base_dnode import BaseDnodeBackedVnode
 from .base_linearized_full import BaseLinearizedFullBackend
-
-Mod = namedtuple('Mod', ['version_num', 'value'])
+from .base_linearized_full import BaseLinearizedFullVnode
+from .base_linearized_full import compact_mods
 
 
 class BsearchLinearizedFullDnode(BaseDnode):
-    __slots__ = ('mods_dict',)
+    """ Linearized full dnode storing each field's history as parallel lists
+
+    mods_dict maps each field to a pair (versions, values): the version
+    nodes at which its value changes, in version-list order, and the values
+    from those versions on. Version nodes compare by their integer labels,
+    and their relative order never changes, so we can bisect the versions.
+    """
+    __slots__ = ('mods_dict', '__weakref__',)
 
     _deleted_marker = object()
 
-    def __init__(self, backend):
-        super().__init__(backend)
-        self.mods_dict = defaultdict(list)
+    def __init__(self, backend, identity=None):
+        super().__init__(backend, identity)
+        self.mods_dict = {}
+        backend.dnodes.add(self)
 
     def get(self, field, version_num):
-        super().get(field, version_num)
-
-        if field not in self.mods_dict:
+        mods = self.mods_dict.get(field)
+        if mods is None:
             raise KeyError('Never created')
-        mods = self.mods_dict[field]
-
-        assert mods, "Mods shouldn't be empty if it's in the dict"
+        versions, values = mods
 
         # OPTIMIZATION: Fast-path for present-time queries
-        if mods[-1].version_num <= version_num:
-            result = mods[-1].value
+        if versions[-1] <= version_num:
+            result = values[-1]
         else:
-            # Binary search to find the last mod <= self.version_num
-            mi = -1
-            ma = len(mods)
-            while ma - mi > 1:
-                md = (mi + ma) // 2
-                if mods[md].version_num <= version_num:
-                    mi = md
-                else:
-                    ma = md
-
-            if mi == -1:
+            index = bisect_right(versions, version_num)
+            if index == 0:
                 raise KeyError('Not created yet')
-
-            assert mi == -1 or mods[mi].version_num <= version_num
-            assert ma == len(mods) or mods[ma].version_num > version_num
-
-            result = mods[mi].value
+            result = values[index - 1]
 
         if result is self._deleted_marker:
             raise KeyError('Field deleted')
 
         return result
 
-    def set(self, field, value, version_num):
-        super().set(field, value, version_num)
+    def _value_at(self, mods, version_num):
+        """ Value of the last mod at or before version_num
 
-        new_mod = Mod(version_num, value)
-        mods = self.mods_dict[field]
+        Returns the deleted marker if the field didn't exist yet.
+        """
+        versions, values = mods
 
-        mi = -1
-        ma = len(mods)
-        while ma - mi > 1:
-            md = (mi + ma) // 2
-            if mods[md].version_num <= version_num:
-                mi = md
+        # OPTIMIZATION: Fast-path for present-time queries
+        if versions[-1] <= version_num:
+            return values[-1]
+
+        index = bisect_right(versions, version_num)
+        if index == 0:
+            return self._deleted_marker
+        return values[index - 1]
+
+    def history(self, field, version_num):
+        mods = self.mods_dict.get(field)
+        if mods is None:
+            return
+        versions, values = mods
+        deleted_marker = self._deleted_marker
+        for index in range(bisect_right(versions, version_num)):
+            value = values[index]
+            yield versions[index], DELETED if value is deleted_marker else value
+
+    def compact(self, survivors):
+        """ Move mods off the versions being dropped, as in
+        :py:func:`.compact_mods` """
+        deleted_marker = self._deleted_marker
+        for field, mods in list(self.mods_dict.items()):
+            new_mods = compact_mods(zip(*mods), survivors)
+            if len(new_mods) == 1 and new_mods[0][1] is deleted_marker:
+                del self.mods_dict[field]
             else:
-                ma = md
-        assert mi == -1 or mods[mi].version_num <= version_num
-        assert ma == len(mods) or mods[ma].version_num > version_num
-        assert ma == mi + 1
-
-        if ma == len(mods) or mods[ma].version_num > version_num.next:
-            prev_value = mods[mi].value if mi >= 0 else self._deleted_marker
-            succ_mod = Mod(version_num.next, prev_value)
-            mods.insert(ma, succ_mod)
-
-        assert mods[ma].version_num == version_num.next
+                # Swap in new lists, so concurrent readers see either all
+                # of the old mods or all of the new ones
+                versions, values = zip(*new_mods)
+                self.mods_dict[field] = (list(versions), list(values))
 
-        if mi >= 0 and mods[mi].version_num == version_num:
-            mods[mi] = new_mod
-        else:
-            mods.insert(ma, new_mod)
+    def set(self, field, value, version_num):
+        self._set_mod(field, value, version_num, version_num.next)
 
     def delete(self, field, version_num):
-        super().delete(field, version_num)
-        self.set(field, self._deleted_marker, version_num)
+        self._set_mod(field, self._deleted_marker, version_num, version_num.next)
+
+    def set_many(self, items, version_num):
+        # Look up the successor version once for the whole batch
+        next_version_num = version_num.next
+        for field, value in items:
+            self._set_mod(field, value, version_num, next_version_num)
+
+    def delete_many(self, fields, version_num):
+        self.set_many([(field, self._deleted_marker) for field in fields], version_num)
+
+    def _set_mod(self, field, value, version_num, next_version_num):
+        """ Write value into field over [version_num, next_version_num) """
+        mods = self.mods_dict.get(field)
+        if mods is None:
+            mods = self.mods_dict[field] = ([], [])
+        versions, values = mods
+
+        # versions[index - 1] <= version_num < versions[index]
+        index = bisect_right(versions, version_num)
+
+        # Every version after version_num is at least next_version_num
+        if index == len(versions) or versions[index] is not next_version_num:
+            # Keep the old value from next_version_num on
+            versions.insert(index, next_version_num)
+            values.insert(index, values[index - 1] if index > 0 else self._deleted_marker)
+
+        if index > 0 and versions[index - 1] is version_num:
+            values[index - 1] = value
+        else:
+            versions.insert(index, version_num)
+            values.insert(index, value)
 
 
-class BsearchLinearizedFullVnode(BaseDnodeBackedVnode):
+class BsearchLinearizedFullVnode(BaseLinearizedFullVnode):
     __slots__ = ()
 
     dnode_cls = BsearchLinearizedFullDnode
@@ -1,63 +1,123 @@
-from collections import defaultdict
-from collections import namedtuple
+from array import array
+from bisect import bisect_right
 
+from .base import DELETED
 from .base_dnode import BaseDnode
 from .base_dnode import BaseDnodeBackedVnode
 from .base_partial import BasePartialBackend
 
-Mod = namedtuple('Mod', ['version_num', 'value'])
-
 
 class BsearchPartialDnode(BaseDnode):
+    """ Partial dnode storing each field's history as parallel sequences
+
+    mods_dict maps each field to a pair (versions, values): the version
+    numbers of its mods in increasing order, searched with bisect, and the
+    values they set. Repeated writes at the same version overwrite the last
+    mod instead of appending another, and mods which only garbage collected
+    versions can see are pruned as more are written.
+    """
     __slots__ = ('mods_dict',)
 
     _deleted_marker = object()
 
-    def __init__(self, backend):
-        super().__init__(backend)
-        self.mods_dict = defaultdict(list)
+    # Type of the sequence of version numbers, constructed from a list
+    _versions_type = list
+
+    def __init__(self, backend, identity=None):
+        super().__init__(backend, identity)
+        self.mods_dict = {}
 
     def get(self, field, version_num):
-        if field not in self.mods_dict:
+        mods = self.mods_dict.get(field)
+        if mods is None:
             raise KeyError('Never created')
-        mods = self.mods_dict[field]
-
-        assert mods, "Mods shouldn't be empty if it's in the dict"
+        versions, values = mods
 
         # OPTIMIZATION: Fast-path for present-time queries
-        if mods[-1].version_num <= version_num:
-            result = mods[-1].value
+        if versions[-1] <= version_num:
+            result = values[-1]
         else:
-            # Binary search to find the last mod <= self.version_num
-            mi = -1
-            ma = len(mods)
-            while ma - mi > 1:
-                md = (mi + ma) // 2
-                if mods[md].version_num <= version_num:
-                    mi = md
-                else:
-                    ma = md
-
-            if mi == -1:
+            index = bisect_right(versions, version_num)
+            if index == 0:
                 raise KeyError('Not created yet')
-
-            result = mods[mi].value
+            result = values[index - 1]
 
         if result is self._deleted_marker:
             raise KeyError('Field deleted')
 
         return result
 
+    def _value_at(self, mods, version_num):
+        """ Value of the last mod at or before version_num
+
+        Returns the deleted marker if the field didn't exist yet.
+        """
+        versions, values = mods
+
+        # OPTIMIZATION: Fast-path for present-time queries
+        if versions[-1] <= version_num:
+            return values[-1]
+
+        index = bisect_right(versions, version_num)
+        if index == 0:
+            return self._deleted_marker
+        return values[index - 1]
+
+    def history(self, field, version_num):
+        mods = self.mods_dict.get(field)
+        if mods is None:
+            return
+        versions, values = mods
+        deleted_marker = self._deleted_marker
+        for index in range(bisect_right(versions, version_num)):
+            value = values[index]
+            yield versions[index], DELETED if value is deleted_marker else value
+
     def set(self, field, value, version_num):
-        mods = self.mods_dict[field]
-        if not mods or mods[-1].version_num <= version_num:
-            mods.append(Mod(version_num, value))
+        mods = self.mods_dict.get(field)
+        if mods is None:
+            self.mods_dict[field] = (self._versions_type([version_num]), [value])
+            return
+
+        versions, values = mods
+        if versions[-1] == version_num:
+            values[-1] = value
+        elif versions[-1] < version_num:
+            versions.append(version_num)
+            values.append(value)
+
+            # OPTIMIZATION: Only look for collected mods when the number of
+            # mods reaches a power of two, so pruning is amortized O(1)
+            num_mods = len(versions)
+            if num_mods >= 8 and not num_mods & (num_mods - 1):
+                self._prune(field)
         else:
             raise ValueError("Can only add mods at the end")
 
+    def _prune(self, field):
+        """ Drop field's mods which only collected versions can see
+
+        Waits until at least half of the mods are dead. The lists are
+        replaced rather than modified, so readers of commits in other
+        threads keep a consistent pair.
+        """
+        versions, values = self.mods_dict[field]
+        # The mod at index is the value at the oldest readable version
+        index = bisect_right(versions, self.backend.collected_before) - 1
+        if index * 2 >= len(versions):
+            self.mods_dict[field] = (versions[index:], values[index:])
+
     def delete(self, field, version_num):
         self.set(field, self._deleted_marker, version_num)
 
+    def set_many(self, items, version_num):
+        for field, value in items:
+            self.set(field, value, version_num)
+
+    def delete_many(self, fields, version_num):
+        for field in fields:
+            self.set(field, self._deleted_marker, version_num)
+
 
 class BsearchPartialVnode(BaseDnodeBackedVnode):
     __slots__ = ()
@@ -70,3 +130,29 @@ class BsearchPartialBackend(BasePartialBackend):
 
     # Set the vnode class of the backend
     vnode_cls = BsearchPartialVnode
+
+
+class CompactBsearchPartialDnode(BsearchPartialDnode):
+    """ Partial dnode keeping each field's version numbers in an array('q')
+
+    Each mod then costs a machine int and a reference to its value.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def _versions_type(versions):
+        return array('q', versions)
+
+
+class CompactBsearchPartialVnode(BaseDnodeBackedVnode):
+    __slots__ = ()
+
+    dnode_cls = CompactBsearchPartialDnode
+
+
+class CompactBsearchPartialBackend(BasePartialBackend):
+    """ BsearchPartialBackend with compact, array-backed mod storage """
+    __slots__ = ()
+
+    # Set the vnode class of the backend
+    vnode_cls = CompactBsearchPartialVnode
@@ -1,17 +1,21 @@
+from .base import DELETED
 from .base_dnode import BaseDnode
-from .base_dnode import BaseDnodeBackedVnode
 from .base_linearized_full import BaseLinearizedFullBackend
+from .base_linearized_full import BaseLinearizedFullVnode
+from .base_linearized_full import compact_mods
 from .util.predecessor import SplayPredecessorDict
 
 
 class BSTLinearizedFullDnode(BaseDnode):
-    __slots__ = ('mods_dict',)
+    """ Dnode keeping each field's mods in a search tree keyed by version """
+    __slots__ = ('mods_dict', '__weakref__',)
 
     _deleted_marker = object()
 
-    def __init__(self, backend):
-        super().__init__(backend)
+    def __init__(self, backend, identity=None):
+        super().__init__(backend, identity)
         self.mods_dict = {}
+        backend.dnodes.add(self)
 
     def get(self, field, version_num):
         super().get(field, version_num)
@@ -21,7 +25,7 @@ class BSTLinearizedFullDnode(BaseDnode):
         mods = self.mods_dict[field]
 
         try:
-            result = mods.get_pred(version_num)
+            result = self.backend.read_pred(mods, version_num)
         except KeyError as e:
             raise RuntimeError('No earliest version in mod_dict') from e
 
@@ -30,33 +34,93 @@ class BSTLinearizedFullDnode(BaseDnode):
 
         return result
 
+    def _value_at(self, mods, version_num):
+        # Every field's first mod is at v_0, so there's always a predecessor
+        return self.backend.read_pred(mods, version_num)
+
+    def history(self, field, version_num):
+        mods = self.mods_dict.get(field)
+        if mods is None:
+            return
+        deleted_marker = self._deleted_marker
+        for key, value in mods.items_between(None, version_num.next):
+            yield key, DELETED if value is deleted_marker else value
+
+    def compact(self, survivors):
+        """ Move mods off the versions being dropped, as in
+        :py:func:`.compact_mods` """
+        # Every field's first mod stays at v_0, where _set_mod put it
+        mods_cls = self.backend.mods_cls
+        for field, mods in list(self.mods_dict.items()):
+            new_mods = compact_mods(mods.items(), survivors)
+            if len(new_mods) == 1:
+                del self.mods_dict[field]
+            else:
+                self.mods_dict[field] = mods_cls.build_from_sorted(new_mods)
+
     def set(self, field, value, version_num):
         super().set(field, value, version_num)
-
-        if field not in self.mods_dict:
-            mods = SplayPredecessorDict()
-            mods.set(self.backend.v_0, self._deleted_marker)
-            self.mods_dict[field] = mods
-        else:
-            mods = self.mods_dict[field]
-
-        old_val = mods.get_pred(version_num.next)
-        mods.set(version_num, value)
-        mods.set(version_num.next, old_val)
+        self._set_mod(field, value, version_num, version_num.next)
 
     def delete(self, field, version_num):
         super().delete(field, version_num)
         self.set(field, self._deleted_marker, version_num)
 
+    def set_many(self, items, version_num):
+        # Look up the successor version once for the whole batch
+        next_version_num = version_num.next
+        for field, value in items:
+            self._set_mod(field, value, version_num, next_version_num)
+
+    def delete_many(self, fields, version_num):
+        self.set_many([(field, self._deleted_marker) for field in fields], version_num)
+
+    def _set_mod(self, field, value, version_num, next_version_num):
+        """ Write value into field over [version_num, next_version_num) """
+        mods = self.mods_dict.get(field)
+        if mods is None:
+            # OPTIMIZATION: Heads come strictly between v_0 and their next
+            # version, so a new field's history can be built in one go
+            self.mods_dict[field] = self.backend.mods_cls.build_from_sorted([
+                (self.backend.v_0, self._deleted_marker),
+                (version_num, value),
+                (next_version_num, self._deleted_marker),
+            ])
+            return
+
+        old_val = mods.get_pred(next_version_num)
+        mods.set(version_num, value)
+        mods.set(next_version_num, old_val)
+
 
-class BSTLinearizedFullVnode(BaseDnodeBackedVnode):
+class BSTLinearizedFullVnode(BaseLinearizedFullVnode):
     __slots__ = ()
 
     dnode_cls = BSTLinearizedFullDnode
 
 
 class BSTLinearizedFullBackend(BaseLinearizedFullBackend):
-    __slots__ = ()
+    """ Fully persistent backend keeping each field's history in a search tree
+
+    :param version_list_cls: As for :py:class:`.BaseLinearizedFullBackend`
+    :param splay_reads: Whether reads splay the version they find to the
+        root, as well as writes. Splaying makes skewed reads cheap, but
+        restructures the tree on every read; without it, every read
+        (including history) only walks the tree, so any number of threads
+        can read commits while one thread writes.
+    :param mods_cls: Predecessor dict class holding each field's history,
+        either :py:class:`.SplayPredecessorDict` (the default) or
+        :py:class:`.TreapPredecessorDict`. The treap is balanced whatever
+        order versions arrive in and never restructures on reads, so it
+        ignores `splay_reads`.
+    """
+    __slots__ = ('mods_cls', 'read_pred',)
 
     # Set the vnode class of the backend
     vnode_cls = BSTLinearizedFullVnode
+
+    def __init__(self, version_list_cls=None, splay_reads=True, mods_cls=None):
+        super().__init__(version_list_cls)
+        mods_cls = mods_cls or SplayPredecessorDict
+        self.mods_cls = mods_cls if splay_reads else mods_cls.peeking_cls()
+        self.read_pred = self.mods_cls.get_pred
@@ -1,6 +1,10 @@
+import weakref
+
+from .base import DELETED
 from .base import BaseBackend
 from .base import BaseVersion
 from .base import BaseVnode
+from .base import NodeIdentity
 
 
 class CopyBackend(BaseBackend):
@@ -25,29 +29,55 @@ class CopyBackend(BaseBackend):
         return head, self._clone(vnodes, head)
 
     def _clone(self, vnodes, version):
-        """ Clone vnodes under a new version
+        """ Clone vnodes, and every vnode reachable from them, under a new
+        version
 
         :param vnodes: Vnodes to clone
         :param version: New version
         :return: Mapping of vnodes
         """
-        old_versions = {vnode.version for vnode in vnodes}
-
-        node_maps = dict()
-        for old_version in old_versions:
-            node_map = {vnode: CopyVnode(version) for vnode in old_version.vnodes}
-            for vnode, new_vnode in node_map.items():
-                # Write in the new values
-                new_vnode.values = {
-                    k: node_map[v] if self.is_vnode(v) else v
-                    for k, v in vnode.values.items()
-                }
+        # Nodes which can't be reached from vnodes are left behind, so the
+        # cost tracks the live structure rather than every node ever made
+        node_map = dict()
+        stack = []
+        for vnode in vnodes:
+            if vnode not in node_map:
+                node_map[vnode] = CopyVnode(version, vnode.identity)
+                stack.append(vnode)
+        while stack:
+            vnode = stack.pop()
+            values = node_map[vnode].values
+            for k, v in vnode.values.items():
+                if self.is_vnode(v):
+                    new_v = node_map.get(v)
+                    if new_v is None:
+                        new_v = node_map[v] = CopyVnode(version, v.identity)
+                        stack.append(v)
+                    v = new_v
+                values[k] = v
+        if not version.is_head:
             version.vnodes.extend(node_map.values())
-            node_maps[old_version] = node_map
-        return [node_maps[vnode.version][vnode] for vnode in vnodes]
+
+        # Link up the history of each copy on its own, since a merge of
+        # several versions may copy the same node more than once: a copy of
+        # a head's vnode goes in between the vnode and what it was copied
+        # from
+        for vnode, new_vnode in node_map.items():
+            if vnode.version.is_head:
+                new_vnode.source = vnode.source
+                vnode.source = weakref.ref(new_vnode)
+            else:
+                new_vnode.source = weakref.ref(vnode)
+        return [node_map[vnode] for vnode in vnodes]
 
 
 class CopyVersion(BaseVersion):
+    """ Version holding a copy of every vnode in it
+
+    Commits list their vnodes, keeping them alive for the history of later
+    copies; heads don't, so the nodes they drop are collected as soon as
+    nothing refers to them.
+    """
     __slots__ = ('vnodes',)
 
     def __init__(self, backend, is_head):
@@ -56,17 +86,22 @@ class CopyVersion(BaseVersion):
 
     def new_node(self):
         super().new_node()
-        vnode = CopyVnode(self)
-        self.vnodes.append(vnode)
-        return vnode
+        return CopyVnode(self)
 
 
 class CopyVnode(BaseVnode):
-    __slots__ = ('values',)
+    """ Vnode holding a copy of its fields
 
-    def __init__(self, version):
+    `source` weakly references the vnode this one was copied from, if any,
+    so history goes back as far as those copies are still alive.
+    """
+    __slots__ = ('values', 'identity', 'source', '__weakref__',)
+
+    def __init__(self, version, identity=None):
         super().__init__(version)
         self.values = dict()
+        self.identity = NodeIdentity() if identity is None else identity
+        self.source = None
 
     def get(self, field):
         super().get(field)
@@ -74,6 +109,29 @@ class CopyVnode(BaseVnode):
             raise KeyError
         return self.values[field]
 
+    def items(self):
+        super().items()
+        return list(self.values.items())
+
+    def history(self, field):
+        vnodes = []
+        vnode = self
+        while vnode is not None:
+            vnodes.append(vnode)
+            vnode = vnode.source() if vnode.source is not None else None
+
+        # Copies of a node merged from several versions share its identity,
+        # so a reference is only unchanged if it's to the copy of what the
+        # older vnode referred to
+        last = DELETED
+        for vnode in reversed(vnodes):
+            value = vnode.values.get(field, DELETED)
+            unchanged = value is last or (
+                isinstance(value, CopyVnode) and value.source is not None and value.source() is last)
+            last = value
+            if not unchanged:
+                yield vnode.version, value
+
     def set(self, field, value):
         super().set(field, value)
         self.values[field] = value
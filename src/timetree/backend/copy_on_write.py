@@ -0,0 +1,413 @@
+import functools
+import itertools
+import weakref
+
+from .base import DELETED
+from .base import BaseBackend
+from .base import BaseVersion
+from .base import BaseVnode
+from .base import NodeIdentity
+from .util.persistent_map import PersistentIntMap
+
+
+class CopyOnWriteBackend(BaseBackend):
+    """ Confluently persistent backend sharing unchanged nodes between
+    versions
+
+    Like :py:class:`.CopyBackend`, each version has its own copy of every
+    node's fields, but copies are made lazily. Every node in a version has
+    an index, and the version maps indices to cells (dicts of fields) in a
+    :py:class:`.PersistentIntMap`, which it shares with the versions it was
+    made from. A head copies a node's cell, and the trie path to it, the
+    first time it writes the node after a commit, so commits and branches
+    take O(1) time, and writes O(log n) more the first time they touch a
+    node.
+
+    Branching from several versions at once mounts the nodes of each
+    version after the first as a space of its own, so they stay distinct
+    without being copied. A node is then addressed by the path of mounts to
+    its space and its index there, and writing it copies the spaces along
+    that path too. Mounts the new head's nodes can't reach are dropped
+    once they outnumber the nodes that were reachable last time, so
+    collecting them takes O(1) amortized time per mount.
+    """
+    __slots__ = ('indices',)
+
+    collection_interval = 64
+
+    def __init__(self):
+        super().__init__()
+        self.indices = itertools.count()
+
+    def _commit(self, vnodes):
+        super()._commit(vnodes)
+
+        if not vnodes:
+            return CopyOnWriteVersion(self, is_head=False), []
+
+        head = vnodes[0].version
+        commit = CopyOnWriteVersion(self, is_head=False)
+        commit.root = head.root
+        commit.mounts = head.mounts
+        commit.collect_at = head.collect_at
+
+        # Cells, spaces and trie nodes made so far now belong to the commit
+        # too
+        head.edit = object()
+
+        # A commit of a head goes in between the head and what it was
+        # copied from
+        for source_ref, prefix in list(head.sources):
+            source = source_ref()
+            if source is not None:
+                commit.sources.append(_source_entry(commit, source, prefix))
+        head.sources[:] = [_source_entry(head, commit, ())]
+
+        return commit, [CopyOnWriteVnode(commit, vnode.path, vnode.index) for vnode in vnodes]
+
+    def _branch(self, vnodes):
+        super()._branch(vnodes)
+
+        head = CopyOnWriteVersion(self, is_head=True)
+
+        # Nodes of the first version keep their addresses; the rest are
+        # mounted under a path of their own
+        prefixes = {}
+        for vnode in vnodes:
+            version = vnode.version
+            if version in prefixes:
+                continue
+            if not prefixes:
+                head.root = version.root
+                head.mounts = version.mounts
+                head.collect_at = version.collect_at
+                prefix = ()
+            else:
+                mount = next(self.indices)
+                root = head._writable_space(())
+                root.mounts = root.mounts.set(mount, version.root, head.edit)
+                head.mounts += 1
+                prefix = (mount,)
+            head.sources.append(_source_entry(head, version, prefix))
+            prefixes[version] = prefix
+
+        addresses = [(prefixes[vnode.version] + vnode.path, vnode.index) for vnode in vnodes]
+        if head.mounts >= head.collect_at:
+            self._collect_mounts(head, addresses)
+        return head, [CopyOnWriteVnode(head, path, index) for path, index in addresses]
+
+    def _collect_mounts(self, head, addresses):
+        """ Drop the spaces mounted in a new head that none of the nodes at
+        addresses can reach
+        """
+        reached = set()
+        live = {()}
+        stack = list(addresses)
+        while stack:
+            address = stack.pop()
+            if address in reached:
+                continue
+            reached.add(address)
+            path, index = address
+            live.update(path[:end] for end in range(1, len(path) + 1))
+            for value in head._get_cell(path, index).values.values():
+                cls = value.__class__
+                if cls is _NodeKey:
+                    stack.append((path, value.index))
+                elif cls is _Link:
+                    stack.append((path[:len(path) - value.up] + value.down, value.index))
+
+        root = head._writable_space(())
+        root.mounts = _prune_mounts(root, (), live, head.edit).mounts
+        head.mounts = sum(1 for path in live if len(path) == 1)
+        head.collect_at = max(self.collection_interval, 2 * head.mounts, len(reached))
+
+
+def _prune_mounts(space, path, live, edit):
+    """ The space at path without the mounts whose paths aren't in live,
+    which is space itself if it has none
+    """
+    mounts = PersistentIntMap()
+    changed = False
+    for mount, child in space.mounts.items():
+        child_path = path + (mount,)
+        if child_path not in live:
+            changed = True
+            continue
+        new_child = _prune_mounts(child, child_path, live, edit)
+        changed = changed or new_child is not child
+        mounts = mounts.set(mount, new_child, edit)
+    if not changed:
+        return space
+    return _Space(space.table, mounts, edit)
+
+
+def _source_entry(version, source, prefix):
+    """ Entry of version's `sources` for a version it was made from
+
+    The reference to source is weak, but if source dies, its own sources
+    are spliced in its place, so history can still reach them.
+    """
+    callback = functools.partial(_splice_source, weakref.ref(version), source.sources, prefix)
+    return weakref.ref(source, callback), prefix
+
+
+def _splice_source(version_ref, source_sources, prefix, source_ref):
+    """ Replace a dead source in a version's sources by the source's own """
+    version = version_ref()
+    if version is None:
+        return
+    sources = version.sources
+    for i, (entry_ref, _) in enumerate(sources):
+        if entry_ref is source_ref:
+            break
+    else:
+        return
+
+    spliced = []
+    for next_ref, next_prefix in list(source_sources):
+        next_source = next_ref()
+        if next_source is not None:
+            spliced.append(_source_entry(version, next_source, prefix + next_prefix))
+    sources[i:i + 1] = spliced
+
+
+class _NodeKey:
+    """ Reference to a node stored in a field, holding the node's index
+
+    Each node has one, shared by the copies of its cell, for references
+    from nodes in the same space.
+    """
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+
+class _Link:
+    """ Reference to a node in another space, stored in a field
+
+    The node's path is relative to the referring node's: `up` mounts up,
+    then down the mounts in `down`. Relative paths stay valid when the
+    whole version is mounted into another.
+    """
+    __slots__ = ('up', 'down', 'index',)
+
+    def __init__(self, up, down, index):
+        self.up = up
+        self.down = down
+        self.index = index
+
+
+class _Space:
+    """ The cells of one version's nodes, and the spaces mounted in it
+
+    `table` maps node indices to cells and `mounts` maps mount ids to
+    spaces, both shared between versions until a head writes them. `edit`
+    is the edit token of the head (and commit epoch) that made the space,
+    which alone may modify it.
+    """
+    __slots__ = ('table', 'mounts', 'edit',)
+
+    def __init__(self, table, mounts, edit):
+        self.table = table
+        self.mounts = mounts
+        self.edit = edit
+
+
+class _Cell:
+    """ The fields of a node, which versions share until one writes them
+
+    `edit` is the edit token of the head (and commit epoch) that made it,
+    which alone may modify it.
+    """
+    __slots__ = ('values', 'key', 'identity', 'edit',)
+
+    def __init__(self, values, key, identity, edit):
+        self.values = values
+        self.key = key
+        self.identity = identity
+        self.edit = edit
+
+
+class CopyOnWriteVersion(BaseVersion):
+    """ Version mapping node addresses to cells through persistent tries
+
+    Heads have an `edit` token, replaced on every commit, for the cells,
+    spaces and trie nodes they may modify in place; `copies` counts the
+    cells they've copied, so vnodes know when to look their cells up again.
+    `sources` weakly references the versions this one was made from, each
+    with the mount path their nodes are under here; it's only ever modified
+    in place, since dying sources splice into it. `mounts` counts the spaces
+    mounted in the root, which are collected once there are `collect_at`.
+    """
+    __slots__ = ('root', 'edit', 'copies', 'sources', 'mounts', 'collect_at', '__weakref__',)
+
+    def __init__(self, backend, is_head):
+        super().__init__(backend, is_head)
+        self.edit = object() if is_head else None
+        self.root = _Space(PersistentIntMap(), PersistentIntMap(), self.edit)
+        self.copies = 0
+        self.sources = []
+        self.mounts = 0
+        self.collect_at = backend.collection_interval
+
+    def new_node(self):
+        super().new_node()
+        key = _NodeKey(next(self.backend.indices))
+        cell = _Cell({}, key, NodeIdentity(), self.edit)
+        space = self._writable_space(())
+        space.table = space.table.set(key.index, cell, self.edit)
+        return CopyOnWriteVnode(self, (), key.index, cell)
+
+    def _get_cell(self, path, index):
+        """ The cell of the node at an address, or None if there's none """
+        space = self.root
+        for mount in path:
+            space = space.mounts.get(mount)
+            if space is None:
+                return None
+        return space.table.get(index)
+
+    def _writable_space(self, path):
+        """ The space at path, copying it and its parents first if the head
+        doesn't own them yet
+        """
+        edit = self.edit
+        space = self.root
+        if space.edit is not edit:
+            space = self.root = _Space(space.table, space.mounts, edit)
+        for mount in path:
+            child = space.mounts.get(mount)
+            if child.edit is not edit:
+                child = _Space(child.table, child.mounts, edit)
+                space.mounts = space.mounts.set(mount, child, edit)
+            space = child
+        return space
+
+    def _source(self, path, index):
+        """ The version and address a node was copied from, if it's still
+        alive
+
+        :return: (version, path, index), or (None, None, None) if there's
+            no such version
+        """
+        for source_ref, prefix in list(self.sources):
+            source = source_ref()
+            if source is None or path[:len(prefix)] != prefix:
+                continue
+            old_path = path[len(prefix):]
+            if source._get_cell(old_path, index) is not None:
+                return source, old_path, index
+        return None, None, None
+
+
+class CopyOnWriteVnode(BaseVnode):
+    """ Handle on a node of a version, caching the node's cell """
+    __slots__ = ('path', 'index', 'cell', 'copies',)
+
+    def __init__(self, version, path, index, cell=None):
+        super().__init__(version)
+        self.path = path
+        self.index = index
+        self.cell = cell
+        self.copies = version.copies if cell is not None else -1
+
+    def _cell(self):
+        # OPTIMIZATION: The cached cell is still ours unless the version has
+        # copied a cell since we looked it up
+        version = self.version
+        if self.copies != version.copies:
+            self.cell = version._get_cell(self.path, self.index)
+            self.copies = version.copies
+        return self.cell
+
+    def _writable_cell(self):
+        """ Our cell, copying it first if the head doesn't own it yet """
+        version = self.version
+        cell = self._cell()
+        if cell.edit is not version.edit:
+            cell = _Cell(dict(cell.values), cell.key, cell.identity, version.edit)
+            space = version._writable_space(self.path)
+            space.table = space.table.set(self.index, cell, version.edit)
+            version.copies += 1
+            self.cell = cell
+            self.copies = version.copies
+        return cell
+
+    def _wrap(self, value):
+        cls = value.__class__
+        if cls is _NodeKey:
+            return CopyOnWriteVnode(self.version, self.path, value.index)
+        if cls is _Link:
+            path = self.path
+            return CopyOnWriteVnode(self.version, path[:len(path) - value.up] + value.down, value.index)
+        return value
+
+    def _ref(self, vnode):
+        """ Reference to vnode to store in one of our fields """
+        path = self.path
+        other_path = vnode.path
+        if path == other_path:
+            return vnode._cell().key
+        common = 0
+        for mount, other_mount in zip(path, other_path):
+            if mount != other_mount:
+                break
+            common += 1
+        return _Link(len(path) - common, other_path[common:], vnode.index)
+
+    @property
+    def identity(self):
+        return self._cell().identity
+
+    def get(self, field):
+        super().get(field)
+        return self._wrap(self._cell().values[field])
+
+    def items(self):
+        super().items()
+        return [(field, self._wrap(value)) for field, value in self._cell().values.items()]
+
+    def history(self, field):
+        vnodes = []
+        vnode = self
+        while vnode is not None:
+            vnodes.append(vnode)
+            version, path, index = vnode.version._source(vnode.path, vnode.index)
+            vnode = CopyOnWriteVnode(version, path, index) if version is not None else None
+
+        # Copies of a node merged from several versions share its identity,
+        # so tell references apart by address: a reference is unchanged if it
+        # moved under the same mounts as the node holding it
+        last = DELETED
+        last_path = ()
+        for vnode in reversed(vnodes):
+            value = vnode._wrap(vnode._cell().values.get(field, DELETED))
+            unchanged = value is last
+            if isinstance(value, CopyOnWriteVnode) and isinstance(last, CopyOnWriteVnode):
+                prefix = vnode.path[:len(vnode.path) - len(last_path)]
+                unchanged = value.index == last.index and value.path == prefix + last.path
+            last, last_path = value, vnode.path
+            if not unchanged:
+                yield vnode.version, value
+
+    def set(self, field, value):
+        super().set(field, value)
+        if self.backend.is_vnode(value):
+            value = self._ref(value)
+        self._writable_cell().values[field] = value
+
+    def delete(self, field):
+        super().delete(field)
+        if field not in self._cell().values:
+            raise KeyError(field)
+        del self._writable_cell().values[field]
+
+    # Compare by node, since getting a field makes a new vnode each time
+    def __eq__(self, other):
+        return isinstance(other, CopyOnWriteVnode) and (
+            (self.version, self.path, self.index) == (other.version, other.path, other.index))
+
+    def __hash__(self):
+        return hash((self.version, self.path, self.index))
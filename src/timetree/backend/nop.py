@@ -1,6 +1,8 @@
+from .base import DELETED
 from .base import BaseBackend
 from .base import BaseVersion
 from .base import BaseVnode
+from .base import NodeIdentity
 
 
 class NopBackend(BaseBackend):
@@ -45,11 +47,12 @@ class NopVersion(BaseVersion):
 
 
 class NopVnode(BaseVnode):
-    __slots__ = ('values', )
+    __slots__ = ('values', 'identity', )
 
     def __init__(self, version):
         super().__init__(version)
         self.values = dict()
+        self.identity = NodeIdentity()
 
     def get(self, field):
         super().get(field)
@@ -57,6 +60,16 @@ class NopVnode(BaseVnode):
             raise KeyError
         return self.values[field]
 
+    def items(self):
+        super().items()
+        return list(self.values.items())
+
+    def history(self, field):
+        # There is only ever the one version
+        value = self.values.get(field, DELETED)
+        if value is not DELETED:
+            yield self.version, value
+
     def set(self, field, value):
         super().set(field, value)
         self.values[field] = value
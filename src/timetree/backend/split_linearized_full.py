@@ -1,8 +1,14 @@
+import threading
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
 from weakref import WeakSet
+from weakref import ref
 
+from .base import DELETED
 from .base_dnode import BaseDnode
-from .base_dnode import BaseDnodeBackedVnode
 from .base_linearized_full import BaseLinearizedFullBackend
+from .base_linearized_full import BaseLinearizedFullVnode
 
 
 class Mod:
@@ -18,17 +24,40 @@ class Mod:
 
 
 class SplitLinearizedFullDnode(BaseDnode):
-    __slots__ = ('start_version', 'end_version', 'mods_dict', 'backrefs', 'vnodes',)
+    """ Dnode covering the versions [start_version, end_version)
+
+    Each field's mods partition the dnode's version range; mods_dict[field]
+    lists them in version order, and starts_dict[field] is the parallel list
+    of their start versions, which we binary search with bisect. The dnodes
+    of a node are linked in version order through weak references `prev`
+    and `next`, so that dnodes no version can reach still get collected.
+    When compaction leaves neighbouring dnodes small, they're merged back.
+
+    To decide on splits quickly, `num_mods` counts our mods, and the start
+    versions of our mods and backrefs (where we may split) are kept as a
+    multiset: `split_points` lists them in order, and `split_counts` counts
+    each. Writes update them as they go; splits and compaction, which touch
+    every mod anyway, recount them with :py:meth:`_recount`.
+    """
+    __slots__ = ('start_version', 'end_version', 'mods_dict', 'starts_dict', 'backrefs', 'vnodes', 'prev', 'next',
+                 'num_mods', 'split_points', 'split_counts', '__weakref__',)
 
     _deleted_marker = object()
 
-    def __init__(self, backend):
-        super().__init__(backend)
+    def __init__(self, backend, identity=None):
+        super().__init__(backend, identity)
         self.start_version = backend.v_0
         self.end_version = backend.v_inf
         self.mods_dict = {}
+        self.starts_dict = {}
         self.backrefs = WeakSet()
         self.vnodes = WeakSet()
+        self.prev = None
+        self.next = None
+        self.num_mods = 0
+        self.split_points = []
+        self.split_counts = {}
+        backend.dnodes.add(self)
 
     def get(self, field, version_num):
         if not self.start_version <= version_num < self.end_version:
@@ -44,20 +73,72 @@ class SplitLinearizedFullDnode(BaseDnode):
         assert mods[0].start_version == self.start_version
         assert mods[-1].end_version == self.end_version
 
-        for ind, mod in enumerate(mods):
-            if mod.start_version <= version_num < mod.end_version:
-                break
-        else:
-            assert False
+        mod = mods[bisect_right(self.starts_dict[field], version_num) - 1]
+        assert mod.start_version <= version_num < mod.end_version
 
         if mod.value == self._deleted_marker:
             raise KeyError("Field doesn't exist")
         return mod.value
 
+    def get_many(self, fields, version_num):
+        if not self.start_version <= version_num < self.end_version:
+            raise ValueError('version_num was invalid for this dnode')
+        return super().get_many(fields, version_num)
+
+    def items(self, version_num):
+        if not self.start_version <= version_num < self.end_version:
+            raise ValueError('version_num was invalid for this dnode')
+        return super().items(version_num)
+
+    def _value_at(self, mods, version_num):
+        # Mods partition our versions, and all know their field
+        return mods[bisect_right(self.starts_dict[mods[0].field], version_num) - 1].value
+
+    def history(self, field, version_num):
+        # Walk back to the node's oldest dnode still alive, then forwards
+        # through each one's mods
+        dnodes = []
+        dnode = self
+        while dnode is not None:
+            dnodes.append(dnode)
+            dnode = dnode.prev() if dnode.prev is not None else None
+        deleted_marker = self._deleted_marker
+        for dnode in reversed(dnodes):
+            mods = dnode.mods_dict.get(field)
+            if mods is None:
+                continue
+            for mod in mods:
+                if version_num < mod.start_version:
+                    return
+                yield mod.start_version, DELETED if mod.value is deleted_marker else mod.value
+
     def set(self, field, value, version_num):
         if not self.start_version <= version_num < self.end_version:
             raise ValueError('version_num was invalid for this dnode')
 
+        split_set = set()
+        self._set_mod(field, value, version_num, split_set)
+        self._split_all(split_set)
+
+    def set_many(self, items, version_num):
+        if not self.start_version <= version_num < self.end_version:
+            raise ValueError('version_num was invalid for this dnode')
+
+        # Write every field first, so we only check for splits once per batch
+        split_set = set()
+        for field, value in items:
+            self._set_mod(field, value, version_num, split_set)
+        self._split_all(split_set)
+
+    def delete_many(self, fields, version_num):
+        self.set_many([(field, self._deleted_marker) for field in fields], version_num)
+
+    def _set_mod(self, field, value, version_num, split_set):
+        """ Write value into field over [version_num, version_num.next)
+
+        Dnodes which might now need to split are added to split_set; the
+        caller is responsible for splitting them.
+        """
         if field not in self.mods_dict:
             self.mods_dict[field] = [
                 Mod(
@@ -68,19 +149,20 @@ class SplitLinearizedFullDnode(BaseDnode):
                     self.end_version,
                 )
             ]
+            self.starts_dict[field] = [self.start_version]
+            self.num_mods += 1
+            self._add_split_point(self.start_version)
 
         mods = self.mods_dict[field]
+        starts = self.starts_dict[field]
 
         assert len(mods) >= 1
 
         assert mods[0].start_version == self.start_version
         assert mods[-1].end_version == self.end_version
 
-        for ind, old_mod in enumerate(mods):
-            if old_mod.start_version <= version_num < old_mod.end_version:
-                break
-        else:
-            assert False
+        ind = bisect_right(starts, version_num) - 1
+        old_mod = mods[ind]
 
         assert old_mod.start_version <= version_num < old_mod.end_version
 
@@ -90,28 +172,31 @@ class SplitLinearizedFullDnode(BaseDnode):
         st_ver = old_mod.start_version
         en_ver = old_mod.end_version
 
-        split_set = {self}
-
         # Helper methods to add or remove existing backrefs to dnodes
         def del_backref(mod):
             if isinstance(mod.value, SplitLinearizedFullDnode):
                 mod.value.backrefs.remove(mod)
+                mod.value._remove_split_point(mod.start_version)
 
         def add_backref(mod):
             if isinstance(mod.value, SplitLinearizedFullDnode):
                 mod.value.backrefs.add(mod)
+                mod.value._add_split_point(mod.start_version)
                 split_set.add(mod.value)
 
         if st_ver == version_num and en_ver == version_num.next:
-
             # We actually don't need to split ourselves
-            split_set.remove(self)
-
             del_backref(old_mod)
             old_mod.value = value
             add_backref(old_mod)
         elif st_ver == version_num:
+            split_set.add(self)
+            del_backref(old_mod)
+            self._remove_split_point(version_num)
             old_mod.start_version = version_num.next
+            starts[ind] = version_num.next
+            self._add_split_point(version_num.next)
+            add_backref(old_mod)
 
             new_mod = Mod(
                 value,
@@ -122,8 +207,12 @@ class SplitLinearizedFullDnode(BaseDnode):
             )
 
             mods.insert(ind, new_mod)
+            starts.insert(ind, version_num)
+            self.num_mods += 1
+            self._add_split_point(version_num)
             add_backref(new_mod)
         else:
+            split_set.add(self)
             old_mod.end_version = version_num
 
             new_mod = Mod(
@@ -135,6 +224,9 @@ class SplitLinearizedFullDnode(BaseDnode):
             )
 
             mods.insert(ind+1, new_mod)
+            starts.insert(ind+1, version_num)
+            self.num_mods += 1
+            self._add_split_point(version_num)
             add_backref(new_mod)
 
             if en_ver > version_num.next:
@@ -146,48 +238,91 @@ class SplitLinearizedFullDnode(BaseDnode):
                     en_ver,
                 )
                 mods.insert(ind+2, tail_mod)
+                starts.insert(ind+2, version_num.next)
+                self.num_mods += 1
+                self._add_split_point(version_num.next)
                 add_backref(tail_mod)
 
+    def _add_split_point(self, version_num):
+        """ Count a mod or backref starting at version_num """
+        counts = self.split_counts
+        count = counts.get(version_num, 0)
+        if not count:
+            insort(self.split_points, version_num)
+        counts[version_num] = count + 1
+
+    def _remove_split_point(self, version_num):
+        """ Uncount a mod or backref starting at version_num """
+        counts = self.split_counts
+        count = counts[version_num] - 1
+        if count:
+            counts[version_num] = count
+        else:
+            del counts[version_num]
+            points = self.split_points
+            del points[bisect_left(points, version_num)]
+
+    def _recount(self):
+        """ Recount our mods and split points from scratch
+
+        Points of backrefs which have since died (with the dnode they were
+        in) are dropped, which writes can't notice.
+        """
+        counts = {}
+        num_mods = 0
+        for mods in self.mods_dict.values():
+            num_mods += len(mods)
+            for mod in mods:
+                counts[mod.start_version] = counts.get(mod.start_version, 0) + 1
+        for mod in self.backrefs:
+            counts[mod.start_version] = counts.get(mod.start_version, 0) + 1
+        self.num_mods = num_mods
+        self.split_counts = counts
+        self.split_points = sorted(counts)
+
+    @staticmethod
+    def _split_all(split_set):
+        """ Split every dnode in split_set (and any they cascade into) """
         while split_set:
             cur = split_set.pop()
             cur._split(split_set)
 
     def _split(self, split_set):
         # Decide if we should split
-        num_fields = len(self.mods_dict)
-        num_mods = sum(map(len, self.mods_dict.values()))
+        num_mods = self.num_mods
         if num_mods <= 20:
             return
-        if num_mods <= 5 * num_fields:
+        if num_mods <= 5 * len(self.mods_dict):
             return
 
-        split_points = {self.start_version, self.end_version}.union(
-            mod.start_version for mods in self.mods_dict.values() for mod in mods
-        ).union(
-            mod.start_version for mod in self.backrefs
-        )
-        split_points = sorted(split_points)
-        assert len(split_points) >= 2
-        if len(split_points) == 2:
+        # OPTIMIZATION: Split at the median of our split points and the end
+        # version, which are kept in order as mods are written
+        split_points = self.split_points
+        if len(split_points) <= 1:
             # We only have the start and the end
             return
-
-        split_point = split_points[len(split_points) // 2]
+        split_point = split_points[(len(split_points) + 1) // 2]
         assert self.start_version < split_point < self.end_version
 
-        new_dnode = SplitLinearizedFullDnode(backend=self.backend)
+        new_dnode = SplitLinearizedFullDnode(backend=self.backend, identity=self.identity)
 
         new_dnode.end_version = self.end_version
         new_dnode.start_version = split_point
         self.end_version = split_point
 
+        new_dnode.prev = ref(self)
+        new_dnode.next = self.next
+        next_dnode = self.next() if self.next is not None else None
+        if next_dnode is not None:
+            next_dnode.prev = ref(new_dnode)
+        self.next = ref(new_dnode)
+
         for field in self.mods_dict:
             mods = self.mods_dict[field]
-            for ind, split_mod in enumerate(mods):
-                if split_mod.start_version <= split_point < split_mod.end_version:
-                    break
-            else:
-                assert False
+            starts = self.starts_dict[field]
+            ind = bisect_right(starts, split_point) - 1
+            split_mod = mods[ind]
+            assert split_mod.start_version <= split_point < split_mod.end_version
 
             if split_mod.start_version < split_point:
                 new_mod = Mod(
@@ -200,8 +335,10 @@ class SplitLinearizedFullDnode(BaseDnode):
                 split_mod.end_version = split_point
 
                 mods.insert(ind+1, new_mod)
+                starts.insert(ind+1, split_point)
                 if isinstance(new_mod.value, SplitLinearizedFullDnode):
                     new_mod.value.backrefs.add(new_mod)
+                    new_mod.value._add_split_point(split_point)
                     split_set.add(new_mod.value)
 
                 # Update split_mod for consistency
@@ -210,6 +347,8 @@ class SplitLinearizedFullDnode(BaseDnode):
 
             new_dnode.mods_dict[field] = mods[ind:]
             self.mods_dict[field] = mods[:ind]
+            new_dnode.starts_dict[field] = starts[ind:]
+            self.starts_dict[field] = starts[:ind]
 
             for mod in new_dnode.mods_dict[field]:
                 mod.source = new_dnode
@@ -234,25 +373,37 @@ class SplitLinearizedFullDnode(BaseDnode):
                 )
                 mod.end_version = split_point
 
+                # Start versions within a field are distinct, so bisect
+                # finds mod exactly
                 src_mods = mod.source.mods_dict[mod.field]
-                ind = src_mods.index(mod)
+                src_starts = mod.source.starts_dict[mod.field]
+                ind = bisect_left(src_starts, mod.start_version)
+                assert src_mods[ind] is mod
                 src_mods.insert(ind + 1, new_mod)
+                src_starts.insert(ind + 1, split_point)
+                mod.source.num_mods += 1
+                mod.source._add_split_point(split_point)
                 split_set.add(mod.source)
 
                 self.backrefs.add(mod)
                 new_dnode.backrefs.add(new_mod)
 
-        vnodes = self.vnodes
-        self.vnodes = WeakSet()
+        # Readers of commits may be registering vnodes concurrently
+        with self.backend.split_lock:
+            vnodes = self.vnodes
+            self.vnodes = WeakSet()
 
-        for vnode in vnodes:
-            assert vnode.dnode == self
-            assert self.start_version <= vnode.version.version_num < new_dnode.end_version
-            if vnode.version.version_num < split_point:
-                self.vnodes.add(vnode)
-            else:
-                vnode.dnode = new_dnode
-                new_dnode.vnodes.add(vnode)
+            for vnode in vnodes:
+                assert vnode.dnode == self
+                assert self.start_version <= vnode.version.version_num < new_dnode.end_version
+                if vnode.version.version_num < split_point:
+                    self.vnodes.add(vnode)
+                else:
+                    vnode.dnode = new_dnode
+                    new_dnode.vnodes.add(vnode)
+
+        self._recount()
+        new_dnode._recount()
 
         # Split again if necessary
         self._split(split_set)
@@ -263,19 +414,149 @@ class SplitLinearizedFullDnode(BaseDnode):
             raise ValueError('version_num was invalid for this dnode')
         self.set(field, self._deleted_marker, version_num)
 
+    def compact(self, survivors):
+        """ Move mod boundaries off the versions being dropped, dropping
+        mods left empty and merging mods which don't change the value
+
+        A dnode left with no versions at all is unlinked from its node's
+        other dnodes.
+        """
+        self.start_version = survivors.get(self.start_version, self.start_version)
+        self.end_version = survivors.get(self.end_version, self.end_version)
+
+        deleted_marker = self._deleted_marker
+        for field, mods in list(self.mods_dict.items()):
+            new_mods = []
+            for mod in mods:
+                start_version = survivors.get(mod.start_version, mod.start_version)
+                end_version = survivors.get(mod.end_version, mod.end_version)
+                if start_version is not end_version and new_mods and new_mods[-1].value is mod.value:
+                    new_mods[-1].end_version = end_version
+                elif start_version is not end_version:
+                    mod.start_version = start_version
+                    mod.end_version = end_version
+                    new_mods.append(mod)
+                    continue
+                if isinstance(mod.value, SplitLinearizedFullDnode):
+                    mod.value.backrefs.discard(mod)
+
+            if not new_mods or (len(new_mods) == 1 and new_mods[0].value is deleted_marker):
+                del self.mods_dict[field]
+                del self.starts_dict[field]
+            else:
+                self.mods_dict[field] = new_mods
+                self.starts_dict[field] = [mod.start_version for mod in new_mods]
+
+        if self.start_version is self.end_version:
+            prev_dnode = self.prev() if self.prev is not None else None
+            next_dnode = self.next() if self.next is not None else None
+            if prev_dnode is not None:
+                prev_dnode.next = self.next
+            if next_dnode is not None:
+                next_dnode.prev = self.prev
+            self.prev = None
+            self.next = None
+
+    def _merge(self, other):
+        """ Take over other, the next dnode of our node """
+        assert self.next() is other and self.end_version is other.start_version
+        split_point = other.start_version
+
+        # Point mods at us first, so mods into either of us can merge below
+        for mod in list(other.backrefs):
+            mod.value = self
+            self.backrefs.add(mod)
+        other.backrefs = WeakSet()
+
+        deleted_marker = self._deleted_marker
+        for field in set(self.mods_dict).union(other.mods_dict):
+            mods = self.mods_dict.get(field)
+            if mods is None:
+                mods = [Mod(deleted_marker, self, field, self.start_version, split_point)]
+            other_mods = other.mods_dict.get(field)
+            if other_mods is None:
+                other_mods = [Mod(deleted_marker, self, field, split_point, other.end_version)]
+            for mod in other_mods:
+                mod.source = self
+
+            if mods[-1].value is other_mods[0].value:
+                first = other_mods[0]
+                mods[-1].end_version = first.end_version
+                if isinstance(first.value, SplitLinearizedFullDnode):
+                    first.value.backrefs.discard(first)
+                other_mods = other_mods[1:]
+
+            new_mods = mods + other_mods
+            self.mods_dict[field] = new_mods
+            self.starts_dict[field] = [mod.start_version for mod in new_mods]
+        other.mods_dict = {}
+        other.starts_dict = {}
+        self.end_version = other.end_version
+
+        with self.backend.split_lock:
+            for vnode in other.vnodes:
+                vnode.dnode = self
+                self.vnodes.add(vnode)
+            other.vnodes = WeakSet()
+
+        self.next = other.next
+        next_dnode = other.next() if other.next is not None else None
+        if next_dnode is not None:
+            next_dnode.prev = ref(self)
+        other.prev = None
+        other.next = None
 
-class SplitLinearizedFullVnode(BaseDnodeBackedVnode):
-    __slots__ = ('__weakref__')
+
+class SplitLinearizedFullVnode(BaseLinearizedFullVnode):
+    __slots__ = ()
 
     dnode_cls = SplitLinearizedFullDnode
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.dnode.vnodes.add(self)
+        dnode = self.dnode
+        with self.backend.split_lock:
+            # A reader may have found dnode just before it split away our
+            # version; that read is about to be retried, so don't register
+            if dnode.start_version <= self.version.version_num < dnode.end_version:
+                dnode.vnodes.add(self)
 
 
 class SplitLinearizedFullBackend(BaseLinearizedFullBackend):
-    __slots__ = ()
+    __slots__ = ('split_lock',)
 
     # Set the vnode class of the backend
     vnode_cls = SplitLinearizedFullVnode
+
+    # Neighbouring dnodes with at most this many mods between them get
+    # merged by compaction; well under the 20 mods a dnode may have before
+    # it splits, so they don't split straight back
+    merge_mods = 10
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Guards dnodes' vnode sets, which splits rebuild
+        self.split_lock = threading.Lock()
+
+    def _compact_dnodes(self, survivors):
+        super()._compact_dnodes(survivors)
+
+        # Walk each node's dnodes from its first one still alive, merging
+        # small neighbours
+        for dnode in list(self.dnodes):
+            if dnode.prev is not None and dnode.prev() is not None:
+                continue
+            while dnode.next is not None:
+                next_dnode = dnode.next()
+                if next_dnode is None:
+                    break
+                num_mods = sum(map(len, dnode.mods_dict.values())) + sum(map(len, next_dnode.mods_dict.values()))
+                if num_mods <= self.merge_mods:
+                    dnode._merge(next_dnode)
+                else:
+                    dnode = next_dnode
+
+        # Compaction moved and dropped mods (and backrefs) all over, so
+        # recount every dnode once it's done
+        for dnode in list(self.dnodes):
+            dnode._recount()
@@ -2,22 +2,63 @@ import weakref
 
 from .base_dnode import BaseDnodeBackedVnode
 from .base_partial import BasePartialBackend
-from .base_partial import BasePartialVersion
 from .bsearch_partial import BsearchPartialDnode
 
 
 class SplitPartialDnode(BsearchPartialDnode):
-    __slots__ = ('_field_backrefs', '_vnode_backrefs', '__weakref__')
+    """ Bsearch dnode which moves to a fresh dnode when a field gets too
+    many mods
 
-    def __init__(self, backend):
-        super().__init__(backend)
+    Each dnode weakly references the dnode it split from in `_prev`, so the
+    history of a node can be walked for as long as its old dnodes live.
+    """
+    __slots__ = ('_field_backrefs', '_vnode_backrefs', '_prev', '__weakref__')
+
+    # Mods a field may have before its dnode splits
+    max_mods = 64  # TODO: better split condition
+
+    def __init__(self, backend, identity=None):
+        super().__init__(backend, identity)
         self._field_backrefs = weakref.WeakKeyDictionary()  # This should be a weak key default dict
         self._vnode_backrefs = weakref.WeakSet()
+        self._prev = None
+
+    def history(self, field, version_num):
+        # Walk back to the oldest dnode still alive, then forwards through
+        # each one's mods
+        dnodes = []
+        dnode = self
+        while dnode is not None:
+            dnodes.append(dnode)
+            dnode = dnode._prev() if dnode._prev is not None else None
+        for dnode in reversed(dnodes):
+            yield from BsearchPartialDnode.history(dnode, field, version_num)
 
     def set(self, field, value, version_num):
-        if len(self.mods_dict[field]) > 0:
-            # delete old backref
-            old_value = self.get(field, version_num)
+        self._set_mod(field, value, version_num)
+
+        # split if necessary
+        if len(self.mods_dict[field][0]) > self.max_mods:
+            self._split(version_num)
+
+    def set_many(self, items, version_num):
+        for field, value in items:
+            self._set_mod(field, value, version_num)
+
+        # Check for a split once for the whole batch
+        if any(len(self.mods_dict[field][0]) > self.max_mods for field, _ in items):
+            self._split(version_num)
+
+    def delete_many(self, fields, version_num):
+        self.set_many([(field, self._deleted_marker) for field in fields], version_num)
+
+    def _set_mod(self, field, value, version_num):
+        """ Write a mod to field, keeping backrefs up to date """
+        mods = self.mods_dict.get(field)
+        if mods is not None:
+            # delete old backref; writes are always at the head, so the
+            # current value is the last mod (which may be a deletion)
+            old_value = mods[1][-1]
             if isinstance(old_value, SplitPartialDnode):
                 old_value._field_backrefs[self].remove(field)
 
@@ -28,61 +69,71 @@ class SplitPartialDnode(BsearchPartialDnode):
             value._field_backrefs[self] = value._field_backrefs.get(self, set())
             value._field_backrefs[self].add(field)
 
-        # split if necessary
-        if len(self.mods_dict[field]) > 64:  # TODO: better split condition
-            # print('split', self, field, self.mods_dict['val'][-1])
-            new_dnode = SplitPartialDnode(backend=self.backend)
-
-            # The order of these 3 loops is extremely important. I think I got it right this time, but I'm not 100% sure.
-
-            for field, mod in [(field, mods[-1]) for field, mods in self.mods_dict.items()]:
-                # copy fields
-                new_dnode.mods_dict[field] = [mod]
-
-                # update backreferences to this node
-                value = mod.value
-                if isinstance(value, SplitPartialDnode):
-                    value._field_backrefs[self].remove(field)
-                    value._field_backrefs[new_dnode] = value._field_backrefs.get(new_dnode, set())
-                    value._field_backrefs[new_dnode].add(field)
-
-            # update head vnodes
-            for vnode in set(self._vnode_backrefs):
-                if vnode.version.is_head:
-                    assert vnode.version.version_num == version_num
-                    self._vnode_backrefs.remove(vnode)
-                    vnode.dnode = new_dnode
-                    new_dnode._vnode_backrefs.add(vnode)
-
-            # update forward references to this node, possibly causing chain reactions
-            new_vnode = SplitPartialVnode(InternalPartialHead(version_num), dnode=new_dnode)
-            # construct vnodes which keep tabs on the head dnode
-            for vnode in [SplitPartialVnode(InternalPartialHead(version_num), dnode=dnode) for dnode in self._field_backrefs]:
-                for field in set(self._field_backrefs[vnode.dnode]):
-                    vnode.dnode.set(field, new_vnode.dnode, version_num)
-
-
-class InternalPartialHead(BasePartialVersion):
-    '''For use as a temporary internal head, used to track dnodes across recursive splits.'''
-    __slots__ = ('version_num', )
-
-    def __init__(self, version_num):
-        super().__init__(backend=None, is_head=True)
-        self.version_num = version_num
-
-    def new_node(self):
-        raise NotImplementedError('New node cannot be constructed from an internal version.')
+    def _split(self, version_num):
+        """ Move the current value of every field into a fresh dnode, and
+        point the fields referring to this one at it
+
+        Pointing a field at the new dnode may fill up the field's dnode in
+        turn. Those dnodes go on a worklist rather than being split
+        recursively, which a long chain of pointers would make too deep.
+        """
+        pending = [self]
+        seen = {self}
+        while pending:
+            dnode = pending.pop()
+            new_dnode = dnode._split_off(version_num)
+
+            # No dnode splits while we're writing, so the backrefs are all
+            # to current dnodes
+            for referrer, fields in list(dnode._field_backrefs.items()):
+                for field in list(fields):
+                    referrer._set_mod(field, new_dnode, version_num)
+                    if referrer not in seen and len(referrer.mods_dict[field][0]) > referrer.max_mods:
+                        seen.add(referrer)
+                        pending.append(referrer)
+
+    def _split_off(self, version_num):
+        """ Move the current value of every field, and the head vnodes, into
+        a fresh dnode
+
+        :return: The new dnode
+        """
+        new_dnode = SplitPartialDnode(backend=self.backend, identity=self.identity)
+        new_dnode._prev = weakref.ref(self)
+
+        for field, (versions, values) in list(self.mods_dict.items()):
+            # copy fields
+            value = values[-1]
+            new_dnode.mods_dict[field] = (self._versions_type([versions[-1]]), [value])
+
+            # update backreferences to this node
+            if isinstance(value, SplitPartialDnode):
+                value._field_backrefs[self].remove(field)
+                value._field_backrefs[new_dnode] = value._field_backrefs.get(new_dnode, set())
+                value._field_backrefs[new_dnode].add(field)
+
+        # update head vnodes
+        for vnode in set(self._vnode_backrefs):
+            if vnode.version.is_head:
+                assert vnode.version.version_num == version_num
+                self._vnode_backrefs.remove(vnode)
+                vnode.dnode = new_dnode
+                new_dnode._vnode_backrefs.add(vnode)
+        return new_dnode
 
 
 class SplitPartialVnode(BaseDnodeBackedVnode):
-    __slots__ = ('__weakref__',)
+    __slots__ = ()
 
     dnode_cls = SplitPartialDnode
 
     def __init__(self, version, *, dnode=None):
         super().__init__(version, dnode=dnode)
 
-        self.dnode._vnode_backrefs.add(self)
+        # Splits only re-point head vnodes, so commits (which other threads
+        # may be reading) stay out of the backrefs
+        if version.is_head:
+            self.dnode._vnode_backrefs.add(self)
 
     def __repr__(self):
         return 'SplitPartialVnode<%s, %s>' % (self.version.version_num, self.dnode)
@@ -1,3 +1,6 @@
+from array import array
+from bisect import bisect_left
+
 from .linked_list import LinkedList
 from .linked_list import LinkedNode
 from .linked_list import SizeTrackingList
@@ -5,6 +8,8 @@ from .linked_list import SizeTrackingNode
 
 
 class LabelerNode(LinkedNode):
+    __slots__ = ()
+
     def __lt__(self, other):
         return self.label < other.label
 
@@ -88,6 +93,11 @@ class QuadraticLabelerList(LinkedList):
     __slots__ = ()
 
 
+# The slot holding QuadraticLabelerNode's label, which FastLabelerNode.UpperNode
+# wraps in a property
+_quadratic_label = QuadraticLabelerNode.label
+
+
 class ExponentialLabelerNode(LabelerNode):
     __slots__ = ('label',)
 
@@ -128,22 +138,35 @@ class ExponentialLabelerList(LinkedList):
 
 
 class FastLabelerNode(SizeTrackingNode, LabelerNode):
-    __slots__ = ('lower',)
+    """ Two-level labeler: a QuadraticLabeler list of ExponentialLabeler lists
+
+    Each node's label is a single int combining its upper and lower labels,
+    refreshed whenever either of them changes, so comparisons are plain int
+    comparisons with no allocation.
+    """
+    __slots__ = ('lower', 'label',)
+
+    # Lower labels are less than 2 ** capacity, and capacity is at most
+    # log(list size), so this many bits is plenty for the lower label
+    LOWER_BITS = 64
 
     class LowerNode(ExponentialLabelerNode):
-        __slots__ = ('upper',)
+        __slots__ = ('upper', 'owner',)
 
-        def __init__(self, *args, **kwargs):
+        def __init__(self, owner, *args, **kwargs):
             super().__init__(*args, **kwargs)
             self.upper = None
+            self.owner = owner
 
         def insert_self(self, prev):
             self.upper = prev.upper
             super().insert_self(prev)
+            self.owner._relabel()
 
         def remove_self(self):
             super().remove_self()
             self.upper = None
+            self.owner.label = None
 
     class LowerList(ExponentialLabelerList):
         __slots__ = ('upper',)
@@ -157,15 +180,30 @@ class FastLabelerNode(SizeTrackingNode, LabelerNode):
         __slots__ = ('lower_list')
 
         def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
+            # QuadraticLabelerNode sets our label, so we need lower_list first
             self.lower_list = None
+            super().__init__(*args, **kwargs)
+
+        @property
+        def label(self):
+            return _quadratic_label.__get__(self)
+
+        @label.setter
+        def label(self, label):
+            # QuadraticLabelerNode sets each label exactly once when
+            # relabeling, so this is where we refresh our lower nodes
+            _quadratic_label.__set__(self, label)
+            if self.lower_list is not None:
+                for lower in self.lower_list:
+                    lower.owner._relabel()
 
     class UpperList(QuadraticLabelerList):
         __slots__ = ()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.lower = FastLabelerNode.LowerNode()
+        self.label = None
+        self.lower = FastLabelerNode.LowerNode(self)
 
     def insert_self(self, prev):
         super().insert_self(prev)
@@ -204,20 +242,175 @@ class FastLabelerNode(SizeTrackingNode, LabelerNode):
 
     def remove_self(self):
         super().remove_self()
+        upper = self.lower.upper
         self.lower.remove_self()
+        # Drop emptied upper nodes, except the first, whose lower list the
+        # list inserts at its front through
+        if not upper.lower_list and upper.prev.is_node:
+            upper.remove_self()
 
-    @property
-    def label(self):
-        result = (self.lower.upper.label, self.lower.label)
-        return result
+    def _relabel(self):
+        """ Recompute our combined label from our upper and lower labels """
+        lower = self.lower
+        self.label = (lower.upper.label << self.LOWER_BITS) | lower.label
 
 
 class FastLabelerList(SizeTrackingList):
     __slots__ = ('lower',)
 
+    node_cls = FastLabelerNode
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         upper = FastLabelerNode.UpperList()
         upper_node = FastLabelerNode.UpperNode()
         upper.prepend(upper_node)
         self.lower = FastLabelerNode.LowerList(upper_node, capacity=5)
+
+
+class BucketLabelerNode(LabelerNode):
+    """ Node of a :py:class:`BucketLabelerList`
+
+    Like FastLabelerNode, the label is a single int combining the bucket's
+    label with the node's label within the bucket.
+    """
+    __slots__ = ('bucket', 'label',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bucket = None
+        self.label = None
+
+    def insert_self(self, prev):
+        super().insert_self(prev)
+
+        if prev.is_head:
+            if self.next.is_node:
+                # Go to the front of the first bucket
+                bucket = self.next.bucket
+            else:
+                # This is the only node
+                bucket = BucketLabelerList.Bucket()
+                bucket.insert_self(prev.buckets)
+            index = 0
+        else:
+            bucket = prev.bucket
+            index = bucket.index(prev) + 1
+
+        if len(bucket.nodes) >= BucketLabelerList.BUCKET_SIZE:
+            # Split before inserting, so every node in a bucket is labeled
+            # whenever buckets get relabeled
+            new_bucket = bucket.split()
+            if index > len(bucket.nodes):
+                index -= len(bucket.nodes)
+                bucket = new_bucket
+
+        self.bucket = bucket
+        bucket.nodes.insert(index, self)
+
+        lowers = bucket.lowers
+        prev_lower = lowers[index - 1] if index > 0 else 0
+        next_lower = lowers[index] if index < len(lowers) else (1 << BucketLabelerList.LOWER_BITS)
+
+        if next_lower - prev_lower > 1:
+            lower = (prev_lower + next_lower) // 2
+            lowers.insert(index, lower)
+            self.label = (bucket.label << BucketLabelerList.LOWER_BITS) | lower
+        else:
+            # Out of room in this bucket; respace all of it
+            bucket.relabel_nodes()
+
+    def remove_self(self):
+        super().remove_self()
+
+        bucket = self.bucket
+        index = bucket.index(self)
+        del bucket.nodes[index]
+        del bucket.lowers[index]
+        if not bucket.nodes:
+            bucket.remove_self()
+
+        self.bucket = None
+        self.label = None
+
+
+class BucketLabelerList(LinkedList):
+    """ Order-maintenance list with array-backed buckets
+
+    Nodes are kept in a linked list (so that ``next`` is O(1)), and also in
+    buckets of at most BUCKET_SIZE nodes, each a Python list alongside an
+    ``array`` of the nodes' labels within the bucket. Buckets are labeled by
+    a QuadraticLabelerList, and nodes within a bucket get labels out of
+    2 ** LOWER_BITS. Inserting takes the midpoint of its neighbors' labels;
+    when there is no gap, or the bucket is full, the bucket is respaced or
+    split in bulk, with a single pass over its arrays. That happens at most
+    once per O(BUCKET_SIZE) inserts into a bucket, so apart from relabeling
+    buckets, inserts are amortized O(1).
+    """
+    __slots__ = ('buckets',)
+
+    BUCKET_SIZE = 64
+    LOWER_BITS = 62  # Fits an array('q')
+
+    node_cls = BucketLabelerNode
+
+    class Bucket(QuadraticLabelerNode):
+        __slots__ = ('nodes', 'lowers',)
+
+        def __init__(self, *args, **kwargs):
+            # QuadraticLabelerNode sets our label, so we need nodes first
+            self.nodes = []
+            self.lowers = array('q')
+            super().__init__(*args, **kwargs)
+
+        @property
+        def label(self):
+            return _quadratic_label.__get__(self)
+
+        @label.setter
+        def label(self, label):
+            # QuadraticLabelerNode sets each label exactly once when
+            # relabeling, so this is where we refresh our nodes in bulk
+            _quadratic_label.__set__(self, label)
+            if label is not None:
+                base = label << BucketLabelerList.LOWER_BITS
+                for node, lower in zip(self.nodes, self.lowers):
+                    node.label = base | lower
+
+        def index(self, node):
+            """ Position of node in this bucket """
+            return bisect_left(self.lowers, node.label & ((1 << BucketLabelerList.LOWER_BITS) - 1))
+
+        def relabel_nodes(self):
+            """ Space out the labels of all our nodes evenly """
+            gap = (1 << BucketLabelerList.LOWER_BITS) // (len(self.nodes) + 1)
+            self.lowers = array('q', range(gap, gap * (len(self.nodes) + 1), gap))
+            base = self.label << BucketLabelerList.LOWER_BITS
+            for node, lower in zip(self.nodes, self.lowers):
+                node.label = base | lower
+
+        def split(self):
+            """ Move the back half of our nodes to a new bucket after us
+
+            :return: The new bucket
+            """
+            new_bucket = BucketLabelerList.Bucket()
+            # Insert before moving nodes, so any relabeling of buckets here
+            # doesn't touch the new bucket's nodes
+            new_bucket.insert_self(self)
+
+            half = len(self.nodes) // 2
+            new_bucket.nodes = self.nodes[half:]
+            del self.nodes[half:]
+            del self.lowers[half:]
+            for node in new_bucket.nodes:
+                node.bucket = new_bucket
+
+            self.relabel_nodes()
+            new_bucket.relabel_nodes()
+
+            return new_bucket
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = QuadraticLabelerList()
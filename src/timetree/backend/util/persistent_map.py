@@ -0,0 +1,102 @@
+class PersistentIntMap:
+    """ Persistent map from non-negative ints to values, as a radix trie
+
+    Maps are immutable to everyone but the holder of an `edit` token:
+    :py:meth:`set` copies the path down to its key, but modifies the nodes
+    made under the same token in place, so a run of writes with one token
+    copies each trie node at most once. Keys handed out by a counter keep
+    the trie shallow, since its depth is log_32 of the largest key.
+
+    Values may not be None, which marks empty slots.
+    """
+    __slots__ = ('root', 'shift',)
+
+    BITS = 5
+    WIDTH = 1 << BITS
+    MASK = WIDTH - 1
+
+    class _Node:
+        __slots__ = ('edit', 'children',)
+
+        def __init__(self, edit, children=None):
+            self.edit = edit
+            self.children = [None] * PersistentIntMap.WIDTH if children is None else children
+
+    def __init__(self, root=None, shift=0):
+        self.root = root
+        self.shift = shift
+
+    def get(self, key, default=None):
+        """ The value at key, or default if there is none """
+        shift = self.shift
+        if key >> shift >> self.BITS:
+            return default
+        node = self.root
+        mask = self.MASK
+        while shift and node is not None:
+            node = node.children[(key >> shift) & mask]
+            shift -= self.BITS
+        if node is None:
+            return default
+        value = node.children[key & mask]
+        return default if value is None else value
+
+    def set(self, key, value, edit):
+        """ Map key to value, under the given edit token
+
+        :return: The new map, which is this one if it was modified in place
+        """
+        assert key >= 0 and value is not None
+        node_cls = self._Node
+        bits = self.BITS
+        root = self.root
+        top_shift = self.shift
+
+        # Grow the trie upwards until key fits
+        while key >> top_shift >> bits:
+            if root is not None:
+                new_root = node_cls(edit)
+                new_root.children[0] = root
+                root = new_root
+            top_shift += bits
+
+        if root is None:
+            root = node_cls(edit)
+        elif root.edit is not edit:
+            root = node_cls(edit, list(root.children))
+
+        node = root
+        shift = top_shift
+        mask = self.MASK
+        while shift:
+            index = (key >> shift) & mask
+            child = node.children[index]
+            if child is None:
+                child = node.children[index] = node_cls(edit)
+            elif child.edit is not edit:
+                child = node.children[index] = node_cls(edit, list(child.children))
+            node = child
+            shift -= bits
+        node.children[key & mask] = value
+
+        if root is self.root:
+            return self
+        return PersistentIntMap(root, top_shift)
+
+    def items(self):
+        """ Iterate over (key, value) pairs in key order """
+        if self.root is None:
+            return
+        stack = [(self.root, self.shift, 0)]
+        while stack:
+            node, shift, base = stack.pop()
+            children = node.children
+            if shift:
+                for index in reversed(range(self.WIDTH)):
+                    child = children[index]
+                    if child is not None:
+                        stack.append((child, shift - self.BITS, base | (index << shift)))
+            else:
+                for index, value in enumerate(children):
+                    if value is not None:
+                        yield base | index, value
@@ -1,85 +1,446 @@
-class SplayPredecessorDict:
-    __slots__ = ('root',)
+import random
 
-    class _Node:
-        __slots__ = ('key', 'value', 'ch', 'par',)
+# Treap priorities come from a generator of their own, so seeding or drawing
+# from the global one neither shapes nor is disturbed by the trees
+_priorities = random.Random()
 
-        def __init__(self, key, value):
-            self.key = key
-            self.value = value
-            self.par = None
-            self.ch = [None, None]
 
-        def d(self):
-            return self.par.ch.index(self)
+class BasePredecessorDict:
+    """ Base class for dicts answering predecessor queries over ordered keys
 
-        def rot(self):
-            p = self.par
-            assert p is not None
+    Subclasses keep a binary search tree of nodes with `key`, `value`,
+    `left` and `right` slots under `root`, and the number of keys in `size`.
+    The queries here only walk the tree, without restructuring it. Don't
+    modify a dict while iterating over it.
+    """
+    __slots__ = ('root', 'size',)
 
-            x = self.d()
-            c = self.ch[1-x]
+    def __init__(self):
+        self.root = None
+        self.size = 0
 
-            g = p.par
-            assert g is not None
+    def __len__(self):
+        return self.size
 
-            g.ch[p.d()] = self
-            self.par = g
+    def __iter__(self):
+        for key, _ in self.items_between(None, None):
+            yield key
 
-            self.ch[1-x] = p
-            p.par = self
+    def items(self):
+        """ Iterate over (key, value) pairs in key order """
+        return self.items_between(None, None)
 
-            p.ch[x] = c
-            if c is not None:
-                c.par = p
+    def items_between(self, lo, hi):
+        """ Iterate over (key, value) pairs with lo <= key < hi in key order
 
-        def splay(self, root):
-            assert root is not None
-            while self.par is not root:
-                if self.par.par is not root:
-                    if self.d() == self.par.d():
-                        # Zig-zig
-                        self.par.rot()
-                    else:
-                        # Zig-zag
-                        self.rot()
-                self.rot()
+        Either bound may be None to leave that side unbounded. Takes O(d + k)
+        for a tree of depth d and k pairs returned.
+        """
+        # Push the path down to lo, keeping the nodes not less than lo
+        stack = []
+        cur = self.root
+        while cur is not None:
+            if lo is not None and cur.key < lo:
+                cur = cur.right
+            else:
+                stack.append(cur)
+                cur = cur.left
 
-    def __init__(self):
-        self.root = self._Node(None, None)
+        while stack:
+            node = stack.pop()
+            if hi is not None and not node.key < hi:
+                return
+            yield node.key, node.value
+            cur = node.right
+            while cur is not None:
+                stack.append(cur)
+                cur = cur.left
 
-    def get_pred(self, key):
-        cur = self.root.ch[1]
+    def peek_pred(self, key):
+        """ Like get_pred, but never restructures the tree
+
+        So any number of readers can share it (while no one writes).
+        """
+        cur = self.root
         pred = None
         while cur is not None:
-            if cur.key == key:
-                cur.splay(self.root)
+            if cur.key is key:
                 return cur.value
+            if key < cur.key:
+                cur = cur.left
             elif cur.key < key:
                 pred = cur
-                cur = cur.ch[1]
+                cur = cur.right
             else:
-                cur = cur.ch[0]
+                return cur.value
         if pred is None:
             raise KeyError('No such element')
-        pred.splay(self.root)
         return pred.value
 
+    def successor(self, key):
+        """ The (key, value) pair with the smallest key greater than `key` """
+        cur = self.root
+        succ = None
+        while cur is not None:
+            if key < cur.key:
+                succ = cur
+                cur = cur.left
+            else:
+                cur = cur.right
+        if succ is None:
+            raise KeyError('No such element')
+        return succ.key, succ.value
+
+    def get_pred(self, key):
+        """ The value of the largest key at most `key` """
+        raise NotImplementedError()
+
+    @classmethod
+    def peeking_cls(cls):
+        """ A class of dicts like these whose reads never restructure the
+        tree, so any number of readers can share one while no one writes
+        """
+        return cls
+
+    def set(self, key, value):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+
+class SplayPredecessorDict(BasePredecessorDict):
+    """ Predecessor dict backed by a splay tree
+
+    Splaying is top-down, so nodes need no parent pointers.
+    """
+    __slots__ = ()
+
+    class _Node:
+        __slots__ = ('key', 'value', 'left', 'right',)
+
+        def __init__(self, key, value):
+            self.key = key
+            self.value = value
+            self.left = None
+            self.right = None
+
+    @classmethod
+    def build_from_sorted(cls, items):
+        """ Build a balanced dict from (key, value) pairs in increasing key order """
+        nodes = [cls._Node(key, value) for key, value in items]
+        assert all(a.key < b.key for a, b in zip(nodes, nodes[1:]))
+
+        def build(lo, hi):
+            if lo == hi:
+                return None
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            node.left = build(lo, mid)
+            node.right = build(mid + 1, hi)
+            return node
+
+        result = cls()
+        result.root = build(0, len(nodes))
+        result.size = len(nodes)
+        return result
+
+    @staticmethod
+    def _splay(t, key):
+        """ Top-down splay of the subtree rooted at t, returning its new root
+
+        The new root is key's node if it is present, and otherwise the last
+        node on key's search path (its predecessor or successor).
+        """
+        # OPTIMIZATION: The left and right trees being assembled are kept as
+        # (root, tail) locals rather than under an allocated header node
+        left_root = left_tail = right_root = right_tail = None
+        while True:
+            # OPTIMIZATION: Keys are usually version nodes, which compare
+            # with Python-level methods, so check identity first
+            if t.key is key:
+                break
+            if key < t.key:
+                child = t.left
+                if child is None:
+                    break
+                if key < child.key:
+                    # Rotate right
+                    t.left = child.right
+                    child.right = t
+                    t = child
+                    if t.left is None:
+                        break
+                # Link right
+                if right_tail is None:
+                    right_root = t
+                else:
+                    right_tail.left = t
+                right_tail = t
+                t = t.left
+            elif t.key < key:
+                child = t.right
+                if child is None:
+                    break
+                if child.key < key:
+                    # Rotate left
+                    t.right = child.left
+                    child.left = t
+                    t = child
+                    if t.right is None:
+                        break
+                # Link left
+                if left_tail is None:
+                    left_root = t
+                else:
+                    left_tail.right = t
+                left_tail = t
+                t = t.right
+            else:
+                break
+
+        # Assemble
+        if left_tail is not None:
+            left_tail.right = t.left
+            t.left = left_root
+        if right_tail is not None:
+            right_tail.left = t.right
+            t.right = right_root
+        return t
+
+    @classmethod
+    def peeking_cls(cls):
+        return PeekingSplayPredecessorDict
+
+    def items_between(self, lo, hi):
+        # Splay lo up first, so the walk down to it is amortized O(log n)
+        if lo is not None and self.root is not None:
+            self.root = self._splay(self.root, lo)
+        return super().items_between(lo, hi)
+
+    def get_pred(self, key):
+        if self.root is None:
+            raise KeyError('No such element')
+        t = self.root = self._splay(self.root, key)
+        if t.key is key or not key < t.key:
+            return t.value
+
+        # t is key's successor, so its left subtree holds only smaller keys;
+        # splay their maximum up and rotate it to the root
+        if t.left is None:
+            raise KeyError('No such element')
+        pred = self._splay(t.left, key)
+        t.left = pred.right
+        pred.right = t
+        self.root = pred
+        return pred.value
+
+    def successor(self, key):
+        if self.root is None:
+            raise KeyError('No such element')
+        t = self.root = self._splay(self.root, key)
+        if t.key is not key and key < t.key:
+            return t.key, t.value
+
+        # Mirroring get_pred, rotate the minimum of the right subtree up
+        if t.right is None:
+            raise KeyError('No such element')
+        succ = self._splay(t.right, key)
+        t.right = succ.left
+        succ.left = t
+        self.root = succ
+        return succ.key, succ.value
+
     def set(self, key, value):
-        par = self.root
-        d = 1
-        while par.ch[d] is not None:
-            par = par.ch[d]
-            if par.key == key:
-                par.value = value
-                par.splay(self.root)
+        if self.root is None:
+            self.root = self._Node(key, value)
+            self.size = 1
+            return
+
+        t = self._splay(self.root, key)
+        if t.key is not key and key < t.key:
+            node = self._Node(key, value)
+            node.left = t.left
+            node.right = t
+            t.left = None
+            self.size += 1
+        elif t.key is not key and t.key < key:
+            node = self._Node(key, value)
+            node.right = t.right
+            node.left = t
+            t.right = None
+            self.size += 1
+        else:
+            t.value = value
+            node = t
+        self.root = node
+
+    def delete(self, key):
+        if self.root is None:
+            raise KeyError(key)
+        t = self.root = self._splay(self.root, key)
+        if t.key is not key and (key < t.key or t.key < key):
+            raise KeyError(key)
+
+        # Join the subtrees under the maximum of the left one
+        if t.left is None:
+            self.root = t.right
+        else:
+            pred = self._splay(t.left, key)
+            pred.right = t.right
+            self.root = pred
+        self.size -= 1
+
+
+class PeekingSplayPredecessorDict(SplayPredecessorDict):
+    """ Splay tree predecessor dict whose reads only walk the tree
+
+    Writes still splay, but every read leaves the tree as it is.
+    """
+    __slots__ = ()
+
+    get_pred = BasePredecessorDict.peek_pred
+    items_between = BasePredecessorDict.items_between
+    successor = BasePredecessorDict.successor
+
+
+class TreapPredecessorDict(BasePredecessorDict):
+    """ Predecessor dict backed by a treap
+
+    A drop-in alternative to :py:class:`SplayPredecessorDict`. Reads never
+    restructure the tree, and it stays balanced in expectation whatever
+    order keys are inserted in, so it suits uniformly spread reads (and
+    threads sharing it) better, while the splay tree wins on skewed reads.
+    """
+    __slots__ = ()
+
+    class _Node:
+        __slots__ = ('key', 'value', 'priority', 'left', 'right',)
+
+        def __init__(self, key, value, priority):
+            self.key = key
+            self.value = value
+            self.priority = priority
+            self.left = None
+            self.right = None
+
+    @classmethod
+    def build_from_sorted(cls, items):
+        """ Build a dict from (key, value) pairs in increasing key order
+
+        Takes O(n), building the tree along its right spine: each node
+        takes the nodes of lower priority at the end of the spine as its
+        left subtree.
+        """
+        spine = []
+        size = 0
+        for key, value in items:
+            node = cls._Node(key, value, _priorities.random())
+            assert not spine or spine[-1].key < key
+            child = None
+            while spine and spine[-1].priority < node.priority:
+                child = spine.pop()
+            node.left = child
+            if spine:
+                spine[-1].right = node
+            spine.append(node)
+            size += 1
+
+        result = cls()
+        result.root = spine[0] if spine else None
+        result.size = size
+        return result
+
+    # Reads never restructure the tree anyway
+    get_pred = BasePredecessorDict.peek_pred
+
+    def set(self, key, value):
+        # Overwrite the key if it's already present
+        cur = self.root
+        while cur is not None:
+            if cur.key == key:
+                cur.value = value
                 return
-            elif par.key < key:
-                d = 1
+            cur = cur.right if cur.key < key else cur.left
+
+        # Descend to where the new node's priority puts it
+        node = self._Node(key, value, _priorities.random())
+        par = None
+        cur = self.root
+        while cur is not None and cur.priority > node.priority:
+            par = cur
+            cur = cur.right if cur.key < key else cur.left
+
+        if par is None:
+            self.root = node
+        elif par.key < key:
+            par.right = node
+        else:
+            par.left = node
+        self.size += 1
+
+        # Split the subtree that was there around the key to make the new
+        # node's children
+        left_tail = right_tail = None
+        while cur is not None:
+            if cur.key < key:
+                if left_tail is None:
+                    node.left = cur
+                else:
+                    left_tail.right = cur
+                left_tail = cur
+                cur = cur.right
+            else:
+                if right_tail is None:
+                    node.right = cur
+                else:
+                    right_tail.left = cur
+                right_tail = cur
+                cur = cur.left
+        if left_tail is not None:
+            left_tail.right = None
+        if right_tail is not None:
+            right_tail.left = None
+
+    def delete(self, key):
+        par = None
+        cur = self.root
+        while cur is not None and cur.key != key:
+            par = cur
+            cur = cur.right if cur.key < key else cur.left
+        if cur is None:
+            raise KeyError(key)
+
+        # Merge the node's subtrees by priority into its place
+        left, right = cur.left, cur.right
+        merged = tail = None
+        tail_right = False
+        while left is not None and right is not None:
+            if left.priority > right.priority:
+                top, top_right = left, True
+                left = left.right
+            else:
+                top, top_right = right, False
+                right = right.left
+            if tail is None:
+                merged = top
+            elif tail_right:
+                tail.right = top
             else:
-                d = 0
+                tail.left = top
+            tail, tail_right = top, top_right
+        rest = left if left is not None else right
+        if tail is None:
+            merged = rest
+        elif tail_right:
+            tail.right = rest
+        else:
+            tail.left = rest
 
-        node = self._Node(key, value)
-        node.par = par
-        par.ch[d] = node
-        node.splay(self.root)
+        if par is None:
+            self.root = merged
+        elif par.left is cur:
+            par.left = merged
+        else:
+            par.right = merged
+        self.size -= 1
@@ -0,0 +1,28 @@
+""" Benchmarks for timetree backends
+
+Drives every backend through the same parameterized workloads and reports
+throughput, per-operation latency percentiles and peak memory as JSON. Run
+it with ``python -m timetree.bench``; see ``--help`` for options, including
+saving a report and comparing against a saved baseline.
+
+Microbenchmarks of the supporting data structures, which time alternative
+code paths against each other, are run with ``--micro``.
+"""
+
+from .micro import MICROBENCHMARKS
+from .micro import run_micro
+from .runner import BACKENDS
+from .runner import compare
+from .runner import run
+from .runner import run_one
+from .workloads import WORKLOADS
+
+__all__ = [
+    'BACKENDS',
+    'MICROBENCHMARKS',
+    'WORKLOADS',
+    'compare',
+    'run',
+    'run_micro',
+    'run_one',
+]
@@ -0,0 +1,106 @@
+""" Command line entry point: ``python -m timetree.bench`` """
+
+import argparse
+import json
+import sys
+
+from .micro import MICROBENCHMARKS
+from .micro import run_micro
+from .runner import BACKENDS
+from .runner import compare
+from .runner import run
+from .workloads import WORKLOADS
+
+
+def _parse_param(text):
+    """ Parse WORKLOAD.NAME=VALUE into (workload, name, value)
+
+    WORKLOAD may also name a microbenchmark.
+    """
+    try:
+        target, value = text.split('=', 1)
+        workload_name, name = target.split('.', 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected WORKLOAD.NAME=VALUE, got %r' % text)
+    registry = WORKLOADS if workload_name in WORKLOADS else MICROBENCHMARKS
+    if workload_name not in registry:
+        raise argparse.ArgumentTypeError('unknown workload %r' % workload_name)
+    if name not in registry[workload_name].defaults:
+        raise argparse.ArgumentTypeError('unknown parameter %r for %s' % (name, workload_name))
+    default = registry[workload_name].defaults[name]
+    return workload_name, name, type(default)(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m timetree.bench',
+        description='Benchmark timetree backends and report results as JSON.',
+    )
+    parser.add_argument('-b', '--backend', action='append', choices=sorted(BACKENDS),
+                        help='backend to run (repeatable; default: all)')
+    parser.add_argument('-w', '--workload', action='append', choices=sorted(WORKLOADS),
+                        help='workload to run (repeatable; default: all)')
+    parser.add_argument('-m', '--micro', action='append', choices=sorted(MICROBENCHMARKS),
+                        help='microbenchmark to run (repeatable); workloads are then only run if '
+                             '--backend or --workload is also given')
+    parser.add_argument('-p', '--param', action='append', type=_parse_param, default=[],
+                        metavar='WORKLOAD.NAME=VALUE', help='override a workload parameter')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timings per microbenchmark variant, keeping the best (default: 3)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip the traced run that measures peak memory')
+    parser.add_argument('-o', '--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change counted as a regression (default: 0.1)')
+    parser.add_argument('--list', action='store_true', help='list workloads and their parameters')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for workload in WORKLOADS.values():
+            params = ', '.join('%s=%s' % item for item in sorted(workload.defaults.items()))
+            print('%s [persistence_%s] (%s)\n    %s' % (workload.name, workload.level, params, workload.doc))
+        for micro in MICROBENCHMARKS.values():
+            params = ', '.join('%s=%s' % item for item in sorted(micro.defaults.items()))
+            print('%s [micro] (%s)\n    %s' % (micro.name, params, micro.doc))
+        return 0
+
+    params = {}
+    for workload_name, name, value in args.param:
+        params.setdefault(workload_name, {})[name] = value
+
+    if args.micro and not (args.backend or args.workload):
+        report = run([], [], seed=args.seed)
+    else:
+        report = run(args.backend, args.workload, params, seed=args.seed, memory=args.memory)
+    if args.micro:
+        report['micro'] = [run_micro(name, params.get(name), seed=args.seed, repeat=args.repeat) for name in args.micro]
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['comparison'] = compare(report, baseline, threshold=args.threshold)
+        for entry in report['comparison']:
+            if entry['regressed']:
+                status = 1
+            print('%-30s %-18s speed x%.2f  memory x%.2f%s' % (
+                entry['backend'], entry['workload'],
+                entry.get('speed_ratio', float('nan')),
+                entry.get('memory_ratio', float('nan')),
+                '  REGRESSED' if entry['regressed'] else '',
+            ), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
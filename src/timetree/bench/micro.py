@@ -0,0 +1,362 @@
+""" Microbenchmarks for the data structures underneath the backends
+
+Each microbenchmark is a function taking a :py:class:`random.Random` and its
+keyword parameters. It does its setup and returns a dict mapping variant
+names to ``(fn, num_ops)``, where calling ``fn()`` performs ``num_ops``
+operations. The runner times each variant, so variants of one microbenchmark
+can be compared directly (e.g. a new code path against the old one).
+"""
+
+import functools
+import random
+import threading
+import time
+from collections import namedtuple
+
+from ..backend.bsearch_linearized_full import BsearchLinearizedFullBackend
+from ..backend.bsearch_partial import BsearchPartialBackend
+from ..backend.bst_linearized_full import BSTLinearizedFullBackend
+from ..backend.util.order_maintenance import BucketLabelerList
+from ..backend.util.order_maintenance import FastLabelerList
+from ..backend.util.order_maintenance import FastLabelerNode
+from ..backend.util.predecessor import SplayPredecessorDict
+from ..backend.util.predecessor import TreapPredecessorDict
+from ..frontend import make_persistent
+from ..frontend import use_proxy_version
+from .runner import BACKENDS
+
+__all__ = ['Microbenchmark', 'MICROBENCHMARKS', 'run_micro']
+
+Microbenchmark = namedtuple('Microbenchmark', ['name', 'fn', 'defaults', 'doc'])
+
+MICROBENCHMARKS = {}
+
+
+def microbenchmark(**defaults):
+    """ Register a microbenchmark with its default parameters """
+    def decorator(fn):
+        MICROBENCHMARKS[fn.__name__] = Microbenchmark(
+            fn.__name__, fn, defaults, (fn.__doc__ or '').strip())
+        return fn
+    return decorator
+
+
+def run_micro(name, params=None, *, seed=0, repeat=3):
+    """ Run one microbenchmark, keeping the best of `repeat` timings per variant
+
+    :return: JSON-serializable dict of results
+    """
+    micro = MICROBENCHMARKS[name]
+    kwargs = dict(micro.defaults)
+    kwargs.update(params or {})
+    unknown = set(kwargs) - set(micro.defaults)
+    if unknown:
+        raise TypeError('Unknown parameters for %s: %s' % (name, ', '.join(sorted(unknown))))
+
+    variants = {}
+    for variant, (fn, num_ops) in micro.fn(random.Random(seed), **kwargs).items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        variants[variant] = {
+            'ops': num_ops,
+            'seconds': best,
+            'ops_per_sec': num_ops / best if best > 0 else None,
+        }
+
+    return {'micro': name, 'params': kwargs, 'variants': variants}
+
+
+def _random_labeler_list(rng, size):
+    """ FastLabelerList of `size` nodes inserted at random positions """
+    lst = FastLabelerList()
+    nodes = []
+    for _ in range(size):
+        node = FastLabelerNode()
+        node.insert_self(rng.choice(nodes) if nodes else lst)
+        nodes.append(node)
+    return nodes
+
+
+@microbenchmark(size=10000, comparisons=200000)
+def labeler_compare(rng, *, size, comparisons):
+    """ Compare FastLabelerNodes by combined int label vs (upper, lower) tuples """
+    nodes = _random_labeler_list(rng, size)
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(comparisons)]
+
+    def int_label():
+        for a, b in pairs:
+            a <= b
+
+    def tuple_label():
+        # What comparisons cost when label was built from the two levels
+        for a, b in pairs:
+            (a.lower.upper.label, a.lower.label) <= (b.lower.upper.label, b.lower.label)
+
+    return {
+        'int_label': (int_label, comparisons),
+        'tuple_label': (tuple_label, comparisons),
+    }
+
+
+@microbenchmark(size=1000000, pattern='same')
+def labeler_insert(rng, *, size, pattern):
+    """ Insert into order-maintenance lists at adversarial positions
+
+    pattern is one of 'same' (always right after the first node), 'front',
+    'back' or 'random'.
+    """
+    if pattern not in ('same', 'front', 'back', 'random'):
+        raise ValueError('Unknown insert pattern %r' % pattern)
+    positions = [rng.random() for _ in range(size)] if pattern == 'random' else None
+
+    def make_variant(list_cls):
+        node_cls = list_cls.node_cls
+
+        def fn():
+            lst = list_cls()
+            first = node_cls()
+            first.insert_self(lst)
+            nodes = [first]
+            for i in range(size):
+                if pattern == 'same':
+                    prev = first
+                elif pattern == 'front':
+                    prev = lst
+                elif pattern == 'back':
+                    prev = lst.prev
+                else:
+                    prev = nodes[int(positions[i] * len(nodes))]
+                node = node_cls()
+                node.insert_self(prev)
+                nodes.append(node)
+        return fn, size
+
+    return {
+        'fast': make_variant(FastLabelerList),
+        'bucket': make_variant(BucketLabelerList),
+    }
+
+
+def _loop_get(mods, version_num):
+    """ The bsearch dnodes' get before they used bisect, over (version, value) tuples """
+    # OPTIMIZATION: Fast-path for present-time queries
+    if mods[-1][0] <= version_num:
+        return mods[-1][1]
+
+    mi = -1
+    ma = len(mods)
+    while ma - mi > 1:
+        md = (mi + ma) // 2
+        if mods[md][0] <= version_num:
+            mi = md
+        else:
+            ma = md
+
+    if mi == -1:
+        raise KeyError('Not created yet')
+
+    assert mods[mi][0] <= version_num
+    assert ma == len(mods) or mods[ma][0] > version_num
+
+    return mods[mi][1]
+
+
+@microbenchmark(mods=100000, reads=100000)
+def bsearch_historical_get(rng, *, mods, reads):
+    """ Historical reads of a field with many mods: bisect vs the old Python loop
+
+    Measures both the partial and the linearized full bsearch dnodes, reading
+    random committed versions of a field written once per commit.
+    """
+    variants = {}
+    for name, backend_cls in [
+        ('partial', BsearchPartialBackend),
+        ('linearized_full', BsearchLinearizedFullBackend),
+    ]:
+        backend = backend_cls()
+        vnode = backend.branch().new_node()
+        # Hold on to the commits, so they aren't garbage collected
+        commits = []
+        for i in range(mods):
+            vnode.set('val', i)
+            commits.append(vnode.commit())
+        version_nums = [commit.version.version_num for commit in commits]
+        queries = [rng.choice(version_nums) for _ in range(reads)]
+
+        dnode = vnode.dnode
+        old_mods = list(zip(*dnode.mods_dict['val']))
+
+        def bisect_get(dnode=dnode, queries=queries, commits=commits):
+            for version_num in queries:
+                dnode.get('val', version_num)
+
+        def loop_get(old_mods=old_mods, queries=queries):
+            for version_num in queries:
+                _loop_get(old_mods, version_num)
+
+        variants[name + '_bisect'] = (bisect_get, reads)
+        variants[name + '_loop'] = (loop_get, reads)
+    return variants
+
+
+class _Point(object):
+    scale = 2
+
+    def __init__(self, x):
+        self.x = x
+
+    def scaled(self):
+        return self.x * self.scale
+
+
+_PersistentPoint = make_persistent(_Point)
+
+
+@microbenchmark(keys=10000, reads=10000, hot=32)
+def predecessor_reads(rng, *, keys, reads, hot):
+    """ Predecessor queries: splaying and non-splaying splay tree reads vs a treap
+
+    Keys are inserted in increasing order, like a field written once per
+    commit. The uniform variants query random keys; the skewed ones send
+    nine in ten queries to `hot` keys. Each variant gets its own dict, since
+    splaying reads reshape the tree that later reads see.
+    """
+    def make_dct(dct_cls):
+        dct = dct_cls()
+        for key in range(keys):
+            dct.set(key, key)
+        return dct
+
+    hot_keys = [rng.randrange(keys) for _ in range(hot)]
+    queries = {
+        'uniform': [rng.randrange(keys) for _ in range(reads)],
+        'skewed': [
+            rng.choice(hot_keys) if rng.random() < 0.9 else rng.randrange(keys)
+            for _ in range(reads)
+        ],
+    }
+
+    def make_variant(get_pred, dist_queries):
+        def fn():
+            for key in dist_queries:
+                get_pred(key)
+        return fn
+
+    variants = {}
+    for dist, dist_queries in queries.items():
+        for name, get_pred in [
+            ('splay_get', make_dct(SplayPredecessorDict).get_pred),
+            ('splay_peek', make_dct(SplayPredecessorDict).peek_pred),
+            ('treap', make_dct(TreapPredecessorDict).get_pred),
+        ]:
+            variants['%s_%s' % (name, dist)] = (make_variant(get_pred, dist_queries), reads)
+    return variants
+
+
+@microbenchmark(calls=100000)
+def proxy_access(rng, *, calls):
+    """ Method calls, class attribute reads, pointer reads and attribute
+    writes on a persistent object vs a plain one """
+    proxy = _PersistentPoint(rng.random(), timetree_backend=BsearchPartialBackend())
+    with use_proxy_version(proxy):
+        proxy.other = _PersistentPoint(rng.random())
+    plain = _Point(rng.random())
+    plain.other = _Point(rng.random())
+
+    def call(obj):
+        def fn():
+            for _ in range(calls):
+                obj.scaled()
+        return fn
+
+    def class_attr(obj):
+        def fn():
+            for _ in range(calls):
+                obj.scale
+        return fn
+
+    def pointer(obj):
+        def fn():
+            for _ in range(calls):
+                obj.other
+        return fn
+
+    def set_attr(obj):
+        def fn():
+            for i in range(calls):
+                obj.x = i
+        return fn
+
+    return {
+        'proxy_method': (call(proxy), calls),
+        'plain_method': (call(plain), calls),
+        'proxy_class_attr': (class_attr(proxy), calls),
+        'plain_class_attr': (class_attr(plain), calls),
+        'proxy_pointer': (pointer(proxy), calls),
+        'plain_pointer': (pointer(plain), calls),
+        'proxy_set': (set_attr(proxy), calls),
+        'plain_set': (set_attr(plain), calls),
+    }
+
+
+@microbenchmark(backend='BSTLinearizedFullBackend', readers=8, nodes=32, commits=500, reads=20000)
+def concurrent_reads(rng, *, backend, readers, nodes, commits, reads):
+    """ Reader threads reading random commits while one thread keeps writing
+
+    Has a variant per number of reader threads, in powers of two up to
+    `readers`, each thread doing `reads` reads, so ops/sec is the total read
+    throughput across threads.
+    """
+    backend_cls, _ = BACKENDS[backend]
+    if issubclass(getattr(backend_cls, 'func', backend_cls), BSTLinearizedFullBackend):
+        # Splaying reads restructure the tree, so they aren't thread-safe
+        backend_cls = functools.partial(backend_cls, splay_reads=False)
+
+    def variant(num_readers):
+        instance = backend_cls()
+        head = instance.branch()
+        vnodes = [head.new_node() for _ in range(nodes)]
+        history = []
+        for c in range(commits):
+            for vnode in vnodes:
+                vnode.set('val', c)
+            history.append(instance.commit(vnodes)[1])
+        queries = [
+            [(rng.randrange(commits), rng.randrange(nodes)) for _ in range(reads)]
+            for _ in range(num_readers)
+        ]
+
+        def read(thread_queries):
+            for c, n in thread_queries:
+                history[c][n].get('val')
+
+        def fn():
+            done = threading.Event()
+
+            def write():
+                i = 0
+                while not done.is_set():
+                    vnodes[i % nodes].set('val', i)
+                    i += 1
+
+            writer = threading.Thread(target=write)
+            threads = [threading.Thread(target=read, args=(q,)) for q in queries]
+            writer.start()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            done.set()
+            writer.join()
+        return fn
+
+    variants = {}
+    num_readers = 1
+    while num_readers <= readers:
+        variants['readers_%d' % num_readers] = (variant(num_readers), num_readers * reads)
+        num_readers *= 2
+    return variants
@@ -0,0 +1,210 @@
+""" Timing, memory measurement and baseline comparison for benchmarks """
+
+import functools
+import gc
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import timetree.backend
+
+from ..backend.util.order_maintenance import BucketLabelerList
+from ..backend.util.predecessor import TreapPredecessorDict
+from .workloads import PERSISTENCE_LEVELS
+from .workloads import WORKLOADS
+
+__all__ = ['BACKENDS', 'run_one', 'run', 'compare']
+
+# Backends with the persistence level they support, matching tests/conftest.py
+BACKENDS = {
+    backend_cls.__name__: (backend_cls, level)
+    for backend_cls, level in [
+        (timetree.backend.NopBackend, 'none'),
+        (timetree.backend.CopyBackend, 'confluent'),
+        (timetree.backend.CopyOnWriteBackend, 'confluent'),
+        (timetree.backend.BsearchPartialBackend, 'partial'),
+        (timetree.backend.CompactBsearchPartialBackend, 'partial'),
+        (timetree.backend.SplitPartialBackend, 'partial'),
+        (timetree.backend.BsearchLinearizedFullBackend, 'full'),
+        (timetree.backend.BSTLinearizedFullBackend, 'full'),
+        (timetree.backend.SplitLinearizedFullBackend, 'full'),
+    ]
+}
+
+# Linearized full backends using the bucket order-maintenance list
+for _backend_cls in [
+    timetree.backend.BsearchLinearizedFullBackend,
+    timetree.backend.BSTLinearizedFullBackend,
+    timetree.backend.SplitLinearizedFullBackend,
+]:
+    BACKENDS[_backend_cls.__name__ + '[bucket]'] = (
+        functools.partial(_backend_cls, version_list_cls=BucketLabelerList), 'full')
+del _backend_cls
+
+BACKENDS['BSTLinearizedFullBackend[treap]'] = (
+    functools.partial(timetree.backend.BSTLinearizedFullBackend, mods_cls=TreapPredecessorDict), 'full')
+
+PERCENTILES = (50, 90, 99)
+
+
+def supports(backend_name, workload_name):
+    """ Whether a backend has the persistence level a workload needs """
+    _, level = BACKENDS[backend_name]
+    needed = WORKLOADS[workload_name].level
+    return PERSISTENCE_LEVELS.index(level) >= PERSISTENCE_LEVELS.index(needed)
+
+
+def _percentile(sorted_samples, pct):
+    """ Nearest-rank percentile of an already sorted list """
+    index = max(0, -(-len(sorted_samples) * pct // 100) - 1)
+    return sorted_samples[index]
+
+
+def _summarize(samples):
+    samples.sort()
+    result = {'count': len(samples), 'mean': sum(samples) / len(samples)}
+    for pct in PERCENTILES:
+        result['p%d' % pct] = _percentile(samples, pct)
+    result['max'] = samples[-1]
+    return result
+
+
+def _time_workload(gen):
+    """ Drive a workload generator, timing the gap before each yield """
+    next(gen)  # Setup
+
+    samples = defaultdict(list)
+    clock = time.perf_counter
+    start = last = clock()
+    for op in gen:
+        now = clock()
+        samples[op].append(now - last)
+        last = now
+    return last - start, samples
+
+
+def _peak_memory(gen):
+    """ Drive a workload generator, returning traced peak memory in bytes
+
+    Setup allocations count towards the peak, since they are part of what
+    the backend is holding on to while the workload runs.
+    """
+    tracemalloc.start()
+    try:
+        for _ in gen:
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_one(backend_name, workload_name, params=None, *, seed=0, memory=True):
+    """ Run one workload against one backend
+
+    :param backend_name: Key of :py:data:`BACKENDS`
+    :param workload_name: Key of :py:data:`~timetree.bench.workloads.WORKLOADS`
+    :param params: Overrides for the workload's default parameters
+    :param seed: Seed for the workload's random choices
+    :param memory: Whether to do a second, traced run to measure peak memory
+    :return: JSON-serializable dict of results
+    """
+    backend_cls, _ = BACKENDS[backend_name]
+    workload = WORKLOADS[workload_name]
+
+    kwargs = dict(workload.defaults)
+    kwargs.update(params or {})
+    unknown = set(kwargs) - set(workload.defaults)
+    if unknown:
+        raise TypeError('Unknown parameters for %s: %s' % (workload_name, ', '.join(sorted(unknown))))
+
+    result = {
+        'backend': backend_name,
+        'workload': workload_name,
+        'params': kwargs,
+    }
+
+    if not supports(backend_name, workload_name):
+        result['skipped'] = 'needs persistence_%s' % workload.level
+        return result
+
+    gc.collect()
+    elapsed, samples = _time_workload(workload.fn(backend_cls(), random.Random(seed), **kwargs))
+    num_ops = sum(map(len, samples.values()))
+
+    result['ops'] = num_ops
+    result['seconds'] = elapsed
+    result['ops_per_sec'] = num_ops / elapsed if elapsed > 0 else None
+    result['latency'] = {op: _summarize(op_samples) for op, op_samples in sorted(samples.items())}
+
+    if memory:
+        gc.collect()
+        result['peak_memory'] = _peak_memory(workload.fn(backend_cls(), random.Random(seed), **kwargs))
+
+    return result
+
+
+def run(backends=None, workloads=None, params=None, *, seed=0, memory=True):
+    """ Run every requested workload against every requested backend
+
+    :param backends: Backend names, defaulting to all of :py:data:`BACKENDS`
+    :param workloads: Workload names, defaulting to all workloads
+    :param params: Mapping of workload name to parameter overrides
+    :return: JSON-serializable report
+    """
+    backends = list(BACKENDS) if backends is None else list(backends)
+    workloads = list(WORKLOADS) if workloads is None else list(workloads)
+    params = params or {}
+
+    results = [
+        run_one(backend_name, workload_name, params.get(workload_name), seed=seed, memory=memory)
+        for workload_name in workloads
+        for backend_name in backends
+    ]
+
+    return {
+        'meta': {
+            'timetree': timetree.__version__,
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, *, threshold=0.1):
+    """ Compare a report against a baseline report
+
+    Runs are matched on (backend, workload, params). A run regresses if its
+    throughput dropped or its peak memory grew by more than `threshold`.
+
+    :return: List of dicts, one per matched run, with the ratios of new to
+        old throughput and peak memory and a `regressed` flag
+    """
+    def key(result):
+        return (result['backend'], result['workload'], tuple(sorted(result['params'].items())))
+
+    old_results = {key(result): result for result in baseline['results'] if 'skipped' not in result}
+
+    comparisons = []
+    for result in report['results']:
+        old = old_results.get(key(result))
+        if old is None or 'skipped' in result:
+            continue
+
+        entry = {'backend': result['backend'], 'workload': result['workload'], 'regressed': False}
+        if result.get('ops_per_sec') and old.get('ops_per_sec'):
+            entry['speed_ratio'] = result['ops_per_sec'] / old['ops_per_sec']
+            if entry['speed_ratio'] < 1 - threshold:
+                entry['regressed'] = True
+        if result.get('peak_memory') and old.get('peak_memory'):
+            entry['memory_ratio'] = result['peak_memory'] / old['peak_memory']
+            if entry['memory_ratio'] > 1 + threshold:
+                entry['regressed'] = True
+        comparisons.append(entry)
+    return comparisons
@@ -0,0 +1,239 @@
+""" Parameterized workloads for benchmarking backends
+
+Each workload is a generator function taking a backend instance, a
+:py:class:`random.Random` and its keyword parameters. It does its setup,
+yields ``None`` once to mark the end of setup, and then yields the name of
+each operation right after performing it. The runner times the gaps between
+yields, so a workload's body reads like ordinary backend code.
+
+Workloads are registered in :py:data:`WORKLOADS` along with the persistence
+level they need and their default parameters.
+"""
+
+from collections import deque
+from collections import namedtuple
+
+__all__ = ['Workload', 'WORKLOADS', 'PERSISTENCE_LEVELS']
+
+# Persistence levels from lowest to highest, matching tests/conftest.py
+PERSISTENCE_LEVELS = ['none', 'partial', 'full', 'confluent']
+
+Workload = namedtuple('Workload', ['name', 'fn', 'level', 'defaults', 'doc'])
+
+WORKLOADS = {}
+
+
+def workload(level, **defaults):
+    """ Register a workload generator requiring the given persistence level """
+    assert level in PERSISTENCE_LEVELS
+
+    def decorator(fn):
+        WORKLOADS[fn.__name__] = Workload(
+            fn.__name__, fn, level, defaults, (fn.__doc__ or '').strip())
+        return fn
+    return decorator
+
+
+@workload('none', nodes=64, sets=20000)
+def head_writes(backend, rng, *, nodes, sets):
+    """ Random field writes and reads on a single head, with no commits """
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(nodes)]
+    yield
+
+    for i in range(sets):
+        vnode = vnodes[rng.randrange(nodes)]
+        vnode.set('f%d' % (i % 4), i)
+        yield 'set'
+        vnode.get('f%d' % (i % 4))
+        yield 'get'
+
+
+@workload('partial', nodes=64, commits=500, sets_per_commit=20)
+def small_sets(backend, rng, *, nodes, commits, sets_per_commit):
+    """ Many small field writes between each commit """
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(nodes)]
+    yield
+
+    for c in range(commits):
+        for i in range(sets_per_commit):
+            vnodes[rng.randrange(nodes)].set('f%d' % (i % 4), c)
+            yield 'set'
+        backend.commit(vnodes[:1])
+        yield 'commit'
+
+
+@workload('partial', length=2000)
+def commit_chain(backend, rng, *, length):
+    """ Grow a linked list by one node per commit, keeping every commit """
+    head = backend.branch()
+    tail = head.new_node()
+    tail.set('val', 0)
+    yield
+
+    for i in range(1, length):
+        vnode = head.new_node()
+        vnode.set('val', i)
+        vnode.set('prev', tail)
+        yield 'set'
+        tail = vnode
+        backend.commit([tail])
+        yield 'commit'
+
+
+@workload('partial', commits=20000, fields=4)
+def hot_counter(backend, rng, *, commits, fields):
+    """ Bump one of a node's counters and commit, keeping every commit """
+    head = backend.branch()
+    vnode = head.new_node()
+    for i in range(fields):
+        vnode.set('c%d' % i, 0)
+    yield
+
+    for c in range(commits):
+        field = 'c%d' % (c % fields)
+        vnode.set(field, vnode.get(field) + 1)
+        yield 'set'
+        backend.commit([vnode])
+        yield 'commit'
+
+
+@workload('full', branches=400, nodes=4)
+def branch_tree(backend, rng, *, branches, nodes):
+    """ Build a binary tree of branches, rewriting a small pointer cycle in each """
+    head = backend.branch()
+    tips = [[head.new_node() for _ in range(nodes)]]
+    yield
+
+    for i in range(branches):
+        _, vnodes = backend.branch(tips[i // 2])
+        yield 'branch'
+        for j, vnode in enumerate(vnodes):
+            vnode.set('val', i)
+            vnode.set('next', vnodes[(j + 1) % nodes])
+            yield 'set'
+        tips.append(vnodes)
+
+
+@workload('partial', nodes=32, commits=1000, reads=20000, write_ratio=0.05)
+def historical_reads(backend, rng, *, nodes, commits, reads, write_ratio):
+    """ Read random fields at random old commits, with occasional head writes """
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(nodes)]
+    history = []
+    for c in range(commits):
+        for vnode in vnodes:
+            if rng.random() < 0.5:
+                vnode.set('val', c)
+        history.append(backend.commit(vnodes)[1])
+    for vnode in vnodes:
+        vnode.set('val', commits)
+    yield
+
+    for i in range(reads):
+        if rng.random() < write_ratio:
+            vnodes[rng.randrange(nodes)].set('val', i)
+            yield 'set'
+        else:
+            old_vnodes = history[rng.randrange(len(history))]
+            try:
+                old_vnodes[rng.randrange(nodes)].get('val')
+            except KeyError:
+                pass
+            yield 'get'
+
+
+@workload('partial', nodes=32, commits=200, reads=20000, write_ratio=0.05)
+def present_reads(backend, rng, *, nodes, commits, reads, write_ratio):
+    """ Read the head of a long history, with occasional writes and commits """
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(nodes)]
+    for c in range(commits):
+        for vnode in vnodes:
+            vnode.set('val', c)
+        backend.commit(vnodes)
+    yield
+
+    for i in range(reads):
+        if rng.random() < write_ratio:
+            vnodes[rng.randrange(nodes)].set('val', i)
+            yield 'set'
+            backend.commit(vnodes[:1])
+            yield 'commit'
+        else:
+            vnodes[rng.randrange(nodes)].get('val')
+            yield 'get'
+
+
+@workload('partial', nodes=32, commits=5000, window=16, sets_per_commit=4)
+def sliding_window(backend, rng, *, nodes, commits, window, sets_per_commit):
+    """ Commit continually, keeping only the latest `window` commits to read """
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(nodes)]
+    recent = deque(maxlen=window)
+    yield
+
+    for c in range(commits):
+        for i in range(sets_per_commit):
+            vnodes[rng.randrange(nodes)].set('val', c)
+            yield 'set'
+        recent.append(backend.commit(vnodes)[1])
+        yield 'commit'
+        try:
+            rng.choice(recent)[rng.randrange(nodes)].get('val')
+        except KeyError:
+            pass
+        yield 'get'
+
+
+@workload('full', nodes=32, requests=5000, sets_per_request=4, window=16)
+def branch_requests(backend, rng, *, nodes, requests, sets_per_request, window):
+    """ Serve requests on short-lived branches off a main line of commits,
+    keeping only the latest `window` commits """
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(nodes)]
+    recent = deque([backend.commit(vnodes)[1]], maxlen=window)
+    yield
+
+    for r in range(requests):
+        request = backend.branch(rng.choice(recent))[1]
+        yield 'branch'
+        for i in range(sets_per_request):
+            request[rng.randrange(nodes)].set('val', r)
+            yield 'set'
+
+        vnodes[rng.randrange(nodes)].set('val', r)
+        yield 'set'
+        recent.append(backend.commit(vnodes)[1])
+        yield 'commit'
+
+
+@workload('confluent', nodes=2000, merges=200, handles=4)
+def merge_commits(backend, rng, *, nodes, merges, handles):
+    """ Repeatedly merge a small commit into a large ring of nodes, writing
+    to a few of the ring's nodes after each merge """
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(nodes)]
+    for i, vnode in enumerate(vnodes):
+        vnode.set('next', vnodes[(i + 1) % nodes])
+    ring = backend.commit(vnodes[:handles])[1]
+    patch_head = backend.branch()
+    patch = patch_head.new_node()
+    yield
+
+    for m in range(merges):
+        patch.set('val', m)
+        yield 'set'
+        patch_commit = backend.commit([patch])[1]
+        yield 'commit'
+
+        merged = backend.branch(ring + patch_commit)[1]
+        yield 'branch'
+        for vnode in merged[:handles]:
+            vnode.set('val', m)
+            yield 'set'
+        merged[0].set('patch', merged[handles])
+        yield 'set'
+        ring = backend.commit(merged[:handles])[1]
+        yield 'commit'
@@ -1,6 +1,8 @@
 import contextlib
 import types
+from contextvars import ContextVar
 from functools import wraps
+from weakref import WeakKeyDictionary
 from weakref import WeakValueDictionary
 
 from .backend.base import BaseVersion
@@ -15,23 +17,37 @@ __all__ = [
     'branch', 'commit',
 ]
 
-_global_version = None
+# The version new persistent objects are created in, per thread and per
+# asyncio task
+_current_version = ContextVar('timetree_version', default=None)
+
+# Proxy bookkeeping lives in side tables rather than in vnode fields, so
+# persistent objects carry only their own fields
+# Proxy class of each node, keyed by the node's identity
+_proxy_classes = WeakKeyDictionary()
+# The live proxy of each vnode, keyed by the vnode (i.e. version and node)
+_proxies = WeakValueDictionary()
 
 
 # Version-setting context managers
 @contextlib.contextmanager
 def use_version(version):
-    global _global_version
+    """ Create persistent objects at `version` within the block
 
+    The version is kept in a context variable, so each thread and asyncio
+    task has its own. Backends themselves allow a single writer: threads
+    sharing a backend must take turns writing to it (including creating
+    objects, branches and commits), though any number may read its commits
+    meanwhile.
+    """
     if not isinstance(version, BaseVersion):
         raise TypeError('not a valid Version')
 
-    old_version = _global_version
-    _global_version = version
-
-    yield
-
-    _global_version = old_version
+    token = _current_version.set(version)
+    try:
+        yield
+    finally:
+        _current_version.reset(token)
 
 
 def use_backend(backend):
@@ -47,8 +63,127 @@ class TimetreeProxy:
     __slots__ = ()
 
 
+# Sentinel for names that aren't defined on the class
+_missing = object()
+
+# Kinds of class-level names, as cached by _class_attr
+_ATTR_NONE = 0
+_ATTR_METHOD = 1
+_ATTR_OTHER = 2
+_ATTR_DATA = 3
+
+# Type flag of classes defined in Python, rather than built in
+_TPFLAGS_HEAPTYPE = 1 << 9
+
+_proxy_metaclasses = {}
+
+
+def _proxy_metaclass(meta):
+    """ Get the metaclass for proxies of classes whose metaclass is `meta`
+
+    It gives every proxy class its own cache of class-level names, and drops
+    the cache whenever the class or one of its proxy bases is mutated. The
+    other classes in the MRO are listed too, for checking cache entries
+    against, since mutations of those can't be hooked.
+    """
+    if meta in _proxy_metaclasses:
+        return _proxy_metaclasses[meta]
+
+    class TimetreeProxyMeta(meta):
+        def __init__(cls, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            type.__setattr__(cls, '_timetree_class_attrs', {})
+            # Names which have been assigned on an instance, so need to be
+            # looked up in the vnode first if they're also on the class
+            type.__setattr__(cls, '_timetree_shadowed', set())
+            _refresh_class_caches(cls)
+
+        def __setattr__(cls, name, value):
+            super().__setattr__(name, value)
+            _refresh_class_caches(cls)
+
+        def __delattr__(cls, name):
+            super().__delattr__(name)
+            _refresh_class_caches(cls)
+
+    TimetreeProxyMeta.__name__ = meta.__name__ + 'TimetreeProxyMeta'
+    _proxy_metaclasses[meta] = TimetreeProxyMeta
+    return TimetreeProxyMeta
+
+
+def _refresh_class_caches(cls):
+    """ Drop cached lookups of `cls` and its subclasses """
+    cls._timetree_class_attrs.clear()
+    # Proxy classes are hooked, and built-in types can't be mutated
+    type.__setattr__(cls, '_timetree_unhooked', tuple(
+        base for base in cls.__mro__
+        if '_timetree_class_attrs' not in base.__dict__
+        and base.__flags__ & _TPFLAGS_HEAPTYPE and base is not TimetreeProxy
+    ))
+    for subclass in cls.__subclasses__():
+        _refresh_class_caches(subclass)
+
+
+def _class_attr(cls, name):
+    """ Look up and cache what `name` is on the proxy class `cls`
+
+    Only the proxy classes hear about their own mutations, so entries also
+    remember what the other classes in the MRO, up to the one defining the
+    name, held under the name, and are looked up again once that changes,
+    say because a non-persistent base was monkeypatched.
+
+    :return: A pair of the kind of the name and either the versioned wrapper
+        for a method or the raw class attribute
+    """
+    attrs = cls._timetree_class_attrs
+    entry = attrs.get(name)
+    if entry is not None:
+        kind, attr, checks = entry
+        # OPTIMIZATION: These are dict lookups in the classes' (live)
+        # namespaces, rather than a walk of the MRO or a read from the class,
+        # which would call descriptors
+        for namespace, raw in checks:
+            if namespace.get(name, _missing) is not raw:
+                break
+        else:
+            return kind, attr
+
+    kind, attr, checks = _ATTR_NONE, _missing, []
+    unhooked = cls._timetree_unhooked
+    for base in cls.__mro__:
+        namespace = base.__dict__
+        raw = namespace.get(name, _missing)
+        if base in unhooked:
+            checks.append((namespace, raw))
+        if raw is not _missing:
+            attr = raw
+            if isinstance(attr, types.FunctionType):
+                kind, attr = _ATTR_METHOD, _versioned_method(attr)
+            elif hasattr(type(attr), '__set__') or hasattr(type(attr), '__delete__'):
+                kind = _ATTR_DATA
+            else:
+                kind = _ATTR_OTHER
+            break
+
+    attrs[name] = (kind, attr, tuple(checks))
+    return kind, attr
+
+
+def _versioned_method(fn):
+    """ Wrap a method to run at the version of the proxy it is bound to """
+    @wraps(fn)
+    def versioned(self, *args, **kwargs):
+        # OPTIMIZATION: Equivalent to use_version, without the generator
+        token = _current_version.set(object.__getattribute__(self, '_timetree_vnode').version)
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            _current_version.reset(token)
+    return versioned
+
+
 def make_persistent(klass):
-    class KlassTimetreeProxy(klass, TimetreeProxy):
+    class KlassTimetreeProxy(klass, TimetreeProxy, metaclass=_proxy_metaclass(type(klass))):
         __slots__ = ('_timetree_vnode',)
 
         def __new__(cls, *args,
@@ -56,13 +191,11 @@ def make_persistent(klass):
                     timetree_version=None,
                     timetree_backend=None,
                     **kwargs):
-            global _global_version
-
             if \
                     timetree_vnode is not None or\
                     timetree_version is not None or\
                     timetree_backend is not None or\
-                    _global_version is not None:
+                    _current_version.get() is not None:
                 return object.__new__(cls)
 
             return klass(*args, **kwargs)
@@ -74,32 +207,37 @@ def make_persistent(klass):
                      **kwargs):
             if timetree_vnode is not None:
                 object.__setattr__(self, '_timetree_vnode', timetree_vnode)
-                version = timetree_vnode.version
-                proxy_set = timetree_vnode.get('_timetree_proxy_set')
-                assert version not in proxy_set
-                proxy_set[version] = self
                 return
 
             if timetree_version is None:
                 # Get the version
                 if timetree_backend is not None:
                     timetree_version = timetree_backend.branch()
-                elif _global_version is not None:
-                    timetree_version = _global_version
+                elif _current_version.get() is not None:
+                    timetree_version = _current_version.get()
                 else:
                     assert False, "No version to use; __new__ should check that"
 
             vnode = timetree_version.new_node()
             object.__setattr__(self, '_timetree_vnode', vnode)
-            vnode.set('_timetree_proxy_class', self.__class__)
-            vnode.set('_timetree_proxy_set', WeakValueDictionary({
-                timetree_version: self,
-            }))
+            _proxy_classes[vnode.identity] = type(self)
+            _proxies[vnode] = self
 
             with use_version(vnode.version):
                 super().__init__(*args, **kwargs)
 
         def __getattribute__(self, name):
+            cls = type(self)
+            kind, attr = _class_attr(cls, name)
+
+            # OPTIMIZATION: Names defined on the class skip the vnode, unless
+            # an instance has shadowed them, and methods reuse their wrapper.
+            # Data descriptors can't be shadowed
+            if kind != _ATTR_NONE and (kind == _ATTR_DATA or name not in cls._timetree_shadowed):
+                if kind == _ATTR_METHOD:
+                    return types.MethodType(attr, self)
+                return super().__getattribute__(name)
+
             vnode = object.__getattribute__(self, '_timetree_vnode')
             try:
                 result = vnode.get(name)
@@ -107,31 +245,25 @@ def make_persistent(klass):
                     result = _vnode_to_proxy(result)
                 return result
             except KeyError:
-                result = super().__getattribute__(name)
-
-                # Wrap instance methods
-                if isinstance(result, types.MethodType) \
-                        and result.__self__ is self:
-                    fn = result
-                    version = vnode.version
-
-                    @wraps(fn)
-                    def wrapped_fn(*args, **kwargs):
-                        with use_version(version):
-                            return fn(*args, **kwargs)
-
-                    result = wrapped_fn
-                return result
+                # A shadowed method whose field is gone; reuse its wrapper
+                if kind == _ATTR_METHOD:
+                    return types.MethodType(attr, self)
+                return super().__getattribute__(name)
 
         def __setattr__(self, name, value):
             vnode = object.__getattribute__(self, '_timetree_vnode')
+            cls = type(self)
 
             # Handle data descriptors, which get priority
-            for cls in self.__class__.__mro__:
-                if name in cls.__dict__:
-                    obj = cls.__dict__[name]
-                    if hasattr(obj, '__set__'):
-                        return obj.__set__(self, value)
+            # OPTIMIZATION: They come from the class's cache, so plain
+            # attributes go straight to the vnode
+            kind, attr = _class_attr(cls, name)
+            if kind == _ATTR_DATA and hasattr(type(attr), '__set__'):
+                return attr.__set__(self, value)
+
+            # Any name set on an instance has to be looked up in the vnode
+            # first from now on, even if it's only added to the class later
+            cls._timetree_shadowed.add(name)
 
             if isinstance(value, TimetreeProxy):
                 o_vnode = object.__getattribute__(value, '_timetree_vnode')
@@ -144,11 +276,9 @@ def make_persistent(klass):
             vnode = object.__getattribute__(self, '_timetree_vnode')
 
             # Handle data descriptors, which get priority
-            for cls in self.__class__.__mro__:
-                if name in cls.__dict__:
-                    obj = cls.__dict__[name]
-                    if hasattr(obj, '__delete__'):
-                        return obj.__delete__(self)
+            kind, attr = _class_attr(type(self), name)
+            if kind == _ATTR_DATA and hasattr(type(attr), '__delete__'):
+                return attr.__delete__(self)
 
             return vnode.delete(name)
 
@@ -158,10 +288,12 @@ def make_persistent(klass):
 
 
 def _vnode_to_proxy(vnode):
-    result = vnode.get('_timetree_proxy_set').get(vnode.version, None)
+    result = _proxies.get(vnode)
     if result is not None:
         return result
-    return vnode.get('_timetree_proxy_class')(timetree_vnode=vnode)
+    result = _proxy_classes[vnode.identity](timetree_vnode=vnode)
+    # Another thread may have raced us to make one
+    return _proxies.setdefault(vnode, result)
 
 
 def _proxy_to_vnode(proxy):
@@ -215,12 +347,10 @@ def commit(*args):
 
 def _create_version(args, *, is_branch=False, is_commit=False):
     """ Internal implementation of branch and commit """
-    global _global_version
-
     assert int(is_branch) + int(is_commit) == 1,\
         "Exactly one of is_branch and is_commit should be true"
 
-    backend = get_proxy_backend(args[0]) if args else _global_version.backend
+    backend = get_proxy_backend(args[0]) if args else _current_version.get().backend
     make_version = backend.branch if is_branch else backend.commit
 
     if not args:
@@ -1,6 +1,9 @@
+import functools
+
 import pytest
 
 import timetree.backend
+from timetree.backend.util.predecessor import TreapPredecessorDict
 
 # Persistence levels from lowest to highest
 persistence_levels = [
@@ -13,17 +16,31 @@ persistence_levels = [
 backend_info = [
     (timetree.backend.NopBackend, pytest.mark.persistence_none),
     (timetree.backend.CopyBackend, pytest.mark.persistence_confluent),
+    (timetree.backend.CopyOnWriteBackend, pytest.mark.persistence_confluent),
     (timetree.backend.BsearchPartialBackend, pytest.mark.persistence_partial),
+    (timetree.backend.CompactBsearchPartialBackend, pytest.mark.persistence_partial),
     (timetree.backend.SplitPartialBackend, pytest.mark.persistence_partial),
     (timetree.backend.BsearchLinearizedFullBackend, pytest.mark.persistence_full),
     (timetree.backend.BSTLinearizedFullBackend, pytest.mark.persistence_full),
+    (functools.partial(timetree.backend.BSTLinearizedFullBackend, mods_cls=TreapPredecessorDict),
+     pytest.mark.persistence_full),
     (timetree.backend.SplitLinearizedFullBackend, pytest.mark.persistence_full),
 ]
 
 
+def backend_id(backend_cls):
+    """ Test id of a backend class, or of a partial setting its options """
+    if isinstance(backend_cls, functools.partial):
+        options = ','.join(
+            '{}={}'.format(key, getattr(value, '__name__', value))
+            for key, value in sorted(backend_cls.keywords.items()))
+        return '{}[{}]'.format(backend_cls.func.__name__, options)
+    return backend_cls.__name__
+
+
 @pytest.fixture(
     params=backend_info,
-    ids=[backend_cls.__name__ for backend_cls, *_ in backend_info],
+    ids=[backend_id(backend_cls) for backend_cls, *_ in backend_info],
 )
 def backend(request):
     """ Fixture to get a backend object """
@@ -1,5 +1,14 @@
+import random
+import sys
+import threading
+
 import pytest
 
+import timetree.backend
+from timetree.backend.util.order_maintenance import BucketLabelerList
+from timetree.backend.util.predecessor import SplayPredecessorDict
+from timetree.backend.util.predecessor import TreapPredecessorDict
+
 
 @pytest.mark.persistence_none
 def test_any_backend(backend):
@@ -98,6 +107,38 @@ def test_partial_backend_chain_split(backend):
             assert vnode.get('d') == vnode_d
 
 
+def test_split_partial_backend_long_cascade(monkeypatch):
+    # Fill every dnode of a long chain up to just short of splitting, so
+    # splitting the tail splits every dnode before it
+    monkeypatch.setattr(timetree.backend.split_partial.SplitPartialDnode, 'max_mods', 2)
+    backend = timetree.backend.SplitPartialBackend()
+    head = backend.branch()
+    chain = [head.new_node() for _ in range(100000)]
+    commits = []
+    for i in range(2):
+        for vnode, next_vnode in zip(chain, chain[1:]):
+            vnode.set('next', next_vnode)
+        commits.append(backend.commit(chain[:1])[1][0])
+
+    tail = chain[-1]
+    old_dnode = chain[0].dnode
+    for i in range(4):
+        tail.set('val', i)
+        commits.append(backend.commit(chain[:1])[1][0])
+    assert chain[0].dnode is not old_dnode
+
+    for i in [0, 2, len(commits) - 1]:
+        vnode = commits[i]
+        for _ in range(len(chain) - 1):
+            vnode = vnode.get('next')
+        assert vnode.identity is tail.identity
+        if i >= 2:
+            assert vnode.get('val') == i - 2
+        else:
+            with pytest.raises(KeyError):
+                vnode.get('val')
+
+
 @pytest.mark.persistence_full
 def test_full_backend_binary_tree_split(backend):
     head = backend.branch()
@@ -211,3 +252,718 @@ def test_confluent_backend(backend):
     head, [new_vnode, new_vnode3] = backend.branch([old_vnode, vnode3])
     assert new_vnode.get('f') == 5
     assert new_vnode3.get('f') == 8
+
+
+@pytest.mark.persistence_none
+def test_set_many(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    vnode2 = head.new_node()
+    vnode.set('a', 1)
+    vnode.set_many({'a': 2, 'b': 3, 'ptr': vnode2})
+    assert vnode.get('a') == 2
+    assert vnode.get('b') == 3
+    assert vnode.get('ptr') == vnode2
+    vnode.set_many([('c', 4), ('c', 5)])
+    assert vnode.get('c') == 5
+
+    vnode.delete_many(['a', 'b'])
+    with pytest.raises(KeyError):
+        vnode.get('a')
+    with pytest.raises(KeyError):
+        vnode.get('b')
+    assert vnode.get('c') == 5
+
+    # Fields can be set again after being deleted
+    vnode.set_many({'a': 6})
+    assert vnode.get('a') == 6
+
+
+@pytest.mark.persistence_partial
+def test_set_many_commits(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    vnode2 = head.new_node()
+
+    commits = []
+    for i in range(200):
+        vnode.set_many({'val': i, 'ptr': vnode2, 'other': -i})
+        vnode2.set_many({'val': -i, 'ptr': vnode})
+        if i % 3 == 0:
+            vnode.delete_many(['other'])
+        commits.append(backend.commit([vnode, vnode2])[1])
+
+    for i, (old_vnode, old_vnode2) in enumerate(commits):
+        assert old_vnode.get('val') == i
+        assert old_vnode.get('ptr') == old_vnode2
+        assert old_vnode2.get('ptr') == old_vnode
+        assert old_vnode.get('ptr').get('val') == -i
+        if i % 3 == 0:
+            with pytest.raises(KeyError):
+                old_vnode.get('other')
+        else:
+            assert old_vnode.get('other') == -i
+
+    commit, [old_vnode] = backend.commit([vnode])
+    with pytest.raises(ValueError):
+        old_vnode.set_many({'val': 0})
+    with pytest.raises(ValueError):
+        old_vnode.delete_many(['val'])
+
+
+@pytest.mark.persistence_none
+def test_get_many(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    vnode2 = head.new_node()
+    vnode.set_many({'a': 1, 'b': 2, 'ptr': vnode2})
+    vnode.set('c', 3)
+    vnode.delete('c')
+
+    assert vnode.get_many(['a', 'ptr']) == {'a': 1, 'ptr': vnode2}
+    assert vnode.get_many([]) == {}
+    with pytest.raises(KeyError):
+        vnode.get_many(['a', 'c'])
+    with pytest.raises(KeyError):
+        vnode.get_many(['never'])
+
+    assert sorted(vnode.items(), key=lambda item: item[0]) == [('a', 1), ('b', 2), ('ptr', vnode2)]
+    assert vnode2.items() == []
+
+
+@pytest.mark.persistence_partial
+def test_get_many_commits(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    vnode2 = head.new_node()
+
+    commits = []
+    for i in range(200):
+        vnode.set('val', i)
+        if i % 2 == 0:
+            vnode.set('ptr', vnode2)
+        else:
+            vnode.delete('ptr')
+        if i == 100:
+            vnode.set('late', i)
+        commits.append(backend.commit([vnode, vnode2])[1])
+
+    for i, (old_vnode, old_vnode2) in enumerate(commits):
+        expected = {'val': i}
+        if i % 2 == 0:
+            expected['ptr'] = old_vnode2
+        if i >= 100:
+            expected['late'] = 100
+        assert dict(old_vnode.items()) == expected
+        assert old_vnode.get_many(expected) == expected
+        if i < 100:
+            with pytest.raises(KeyError):
+                old_vnode.get_many(['val', 'late'])
+
+
+@pytest.mark.persistence_full
+def test_full_backend_hot_field(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    vnode.set('val', -1)
+    base = vnode.commit()
+
+    # Interleave many versions of a single field in one node's history
+    heads = []
+    for i in range(300):
+        new_vnode = backend.branch([base])[1][0] if i % 2 else vnode
+        new_vnode.set('val', i)
+        heads.append((new_vnode, new_vnode.commit(), i))
+
+    assert base.get('val') == -1
+    for new_vnode, old_vnode, i in heads:
+        assert old_vnode.get('val') == i
+
+
+def history_values(vnode, field):
+    return [value for _, value in vnode.history(field)]
+
+
+@pytest.mark.persistence_none
+def test_history_head(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    assert history_values(vnode, 'f') == []
+
+    vnode.set('f', 1)
+    vnode.set('f', 2)
+    assert list(vnode.history('f')) == [(head, 2)]
+
+    vnode.delete('f')
+    assert history_values(vnode, 'f') == []
+
+
+@pytest.mark.persistence_partial
+def test_partial_backend_history(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    other = head.new_node()
+    other.set('x', 7)
+
+    vnode.set('f', 1)
+    c1 = vnode.commit()
+    vnode.set('f', 2)
+    vnode.set('g', 0)
+    vnode.commit()
+    c3 = vnode.commit()
+    vnode.delete('f')
+    c4 = vnode.commit()
+    vnode.set('f', other)
+
+    assert history_values(c1, 'f') == [1]
+    assert history_values(c3, 'f') == [1, 2]
+    assert history_values(c4, 'f') == [1, 2, timetree.backend.DELETED]
+    assert history_values(c4, 'g') == [0]
+    assert history_values(c4, 'missing') == []
+
+    changes = list(vnode.history('f'))
+    assert [value for _, value in changes[:3]] == [1, 2, timetree.backend.DELETED]
+    version, value = changes[-1]
+    assert version == head
+    assert value == other
+    assert value.get('x') == 7
+
+    # Pointers come bound to the version they were set at
+    c5 = vnode.commit()
+    version, value = list(c5.history('f'))[-1]
+    assert version.is_commit
+    assert value.version == version
+    assert value.get('x') == 7
+
+    # Enough writes for splitting backends to split
+    commits = []
+    for i in range(300):
+        vnode.set('f', i)
+        other.set('x', i)
+        commits.append(vnode.commit())
+    assert history_values(vnode, 'f')[-300:] == list(range(300))
+    assert history_values(commits[100], 'f')[-101:] == list(range(101))
+    assert history_values(commits[100], 'f')[-1] == 100
+
+
+@pytest.mark.persistence_full
+def test_full_backend_history(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    vnode.set('f', 'a')
+    c1 = vnode.commit()
+    vnode.set('f', 'b')
+    vnode.commit()
+
+    branch = c1.branch()
+    assert history_values(branch, 'f') == ['a']
+    branch.set('f', 'c')
+    assert history_values(branch, 'f') == ['a', 'c']
+    assert history_values(vnode, 'f') == ['a', 'b']
+    assert history_values(c1, 'f') == ['a']
+
+    # A random tree of versions, each writing the field with some chance
+    rng = random.Random(0)
+    versions = [(c1, ['a'])]
+    for i in range(300):
+        parent, expected = rng.choice(versions)
+        new_vnode = parent.branch()
+        value = expected[-1]
+        for j in range(rng.randrange(3)):
+            value = (i, j)
+            new_vnode.set('f', value)
+            new_vnode.set('g', i)
+        if value is not timetree.backend.DELETED and rng.random() < 0.2:
+            new_vnode.delete('f')
+            value = timetree.backend.DELETED
+        new_expected = expected if value == expected[-1] else expected + [value]
+        versions.append((new_vnode.commit(), new_expected))
+
+    for commit, expected in versions:
+        assert history_values(commit, 'f') == expected
+
+
+@pytest.mark.persistence_confluent
+def test_confluent_backend_history(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    vnode.set('f', 1)
+    _, [c1] = backend.commit([vnode])
+    vnode.set('f', 2)
+    _, [c2] = backend.commit([vnode])
+
+    # A merge can hold several versions of a node, which share its identity
+    # but each have their own history
+    _, [m1, m2] = backend.branch([c1, c2])
+    m2.set('f', 3)
+    assert m1.identity is m2.identity
+    assert history_values(m1, 'f') == [1]
+    assert history_values(m2, 'f') == [1, 2, 3]
+    _, [n1, n2] = backend.commit([m1, m2])
+    assert history_values(n1, 'f') == [1]
+    assert history_values(n2, 'f') == [1, 2, 3]
+
+    # Pointing at another version of the same node is a change too, while
+    # pointing at later copies of the same version isn't
+    pointer = m1.version.new_node()
+    pointer.set('p', m1)
+    _, [pointer_commit] = backend.commit([pointer])
+    assert len(list(pointer.history('p'))) == 1
+    assert len(list(pointer_commit.history('p'))) == 1
+    pointer.set('p', m2)
+    history = [value for _, value in pointer.history('p')]
+    assert len(history) == 2 and history[-1] == m2
+
+
+@pytest.mark.parametrize('backend_cls', [
+    timetree.backend.BsearchLinearizedFullBackend,
+    timetree.backend.BSTLinearizedFullBackend,
+    timetree.backend.SplitLinearizedFullBackend,
+])
+def test_full_backend_history_mods_only(backend_cls):
+    backend = backend_cls()
+    head = backend.branch()
+    vnode = head.new_node()
+    other = head.new_node()
+    vnode.set('f', 0)
+    commits = []
+    for i in range(1000):
+        other.set('g', i)
+        commits.append(backend.commit([other])[1][0])
+    vnode.set('f', 1)
+
+    # Only versions with mods of the field are looked at, not every
+    # ancestor in between
+    version = vnode.version
+    pairs = list(version._history(vnode.dnode.history('f', version.version_num)))
+    assert len(pairs) <= 3
+    assert pairs[-1] == (version.version_num, 1)
+    assert history_values(vnode, 'f') == [0, 1]
+
+    # History hands back the live commits rather than making new ones
+    num_versions = len(backend.versions)
+    assert next(vnode.history('f'))[0] is commits[0].version
+    assert len(backend.versions) == num_versions
+
+    # A head which keeps writing after being branched from leaves mods on
+    # other branches, which count at the branch's first ancestor after them
+    _, (branch,) = backend.branch([vnode])
+    _, (sibling,) = backend.branch([vnode])
+    vnode.set('f', 2)
+    sibling.set('f', 3)
+    assert history_values(vnode, 'f') == [0, 1, 2]
+    assert history_values(sibling, 'f') == [0, 1, 3]
+    assert history_values(branch, 'f') == [0, 1]
+    version = branch.version
+    pairs = list(version._history(branch.dnode.history('f', version.version_num)))
+    assert len(pairs) <= 4
+    assert pairs[-1][1] == 1
+
+
+@pytest.mark.parametrize('backend_cls', [
+    timetree.backend.BsearchPartialBackend,
+    timetree.backend.CompactBsearchPartialBackend,
+    timetree.backend.SplitPartialBackend,
+])
+def test_partial_backend_compact(backend_cls):
+    backend = backend_cls()
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(4)]
+    for vnode in vnodes:
+        vnode.set('next', vnodes[0])
+    first = backend.commit(vnodes)[1]
+
+    # Keep a sliding window of commits, plus the first one
+    window = []
+    for i in range(1000):
+        vnodes[i % 4].set('val', i)
+        vnodes[i % 4].set('next', vnodes[(i + 1) % 4])
+        window.append((i, backend.commit(vnodes)[1]))
+        window = window[-10:]
+    backend.compact()
+    assert backend.collected_before == first[0].version.version_num
+
+    for i, commit_vnodes in window:
+        assert commit_vnodes[i % 4].get('val') == i
+        assert commit_vnodes[i % 4].get('next') == commit_vnodes[(i + 1) % 4]
+    assert first[0].get('next') == first[0]
+
+    # Once the first commit is gone, mods older than the window go as
+    # they're written over
+    del first
+    backend.compact()
+    oldest = window[0][1][0].version.version_num
+    assert backend.collected_before == oldest
+    for i in range(1000, 1100):
+        vnodes[i % 4].set('val', i)
+        window.append((i, backend.commit(vnodes)[1]))
+        window = window[-10:]
+    for vnode in vnodes:
+        assert len(vnode.dnode.mods_dict['val'][0]) <= 64
+
+    for i, commit_vnodes in window:
+        assert commit_vnodes[i % 4].get('val') == i
+
+    # History starts at the oldest version left
+    changes = list(window[-1][1][0].history('val'))
+    assert changes[0][0].version_num >= oldest
+    assert changes[-1][1] == window[-1][0] - 3
+
+
+def num_mods(dnode):
+    """ Total number of mods stored in a linearized full dnode """
+    return sum(len(mods[0]) if isinstance(mods, tuple) else len(mods) for mods in dnode.mods_dict.values())
+
+
+@pytest.mark.parametrize('backend_cls', [
+    timetree.backend.BsearchLinearizedFullBackend,
+    timetree.backend.BSTLinearizedFullBackend,
+    timetree.backend.SplitLinearizedFullBackend,
+])
+def test_full_backend_compact(backend_cls):
+    backend = backend_cls()
+    head = backend.branch()
+    main = [head.new_node() for _ in range(4)]
+    for i, vnode in enumerate(main):
+        vnode.set('val', -1)
+        vnode.set('next', main[(i + 1) % 4])
+    vals = [-1] * 4
+
+    # Each request branches off the main line and is dropped, except for a
+    # few commits kept around
+    rng = random.Random(0)
+    kept = []
+    for i in range(1000):
+        request = backend.branch(main)[1]
+        request_vals = list(vals)
+        for j in range(rng.randrange(4)):
+            k = rng.randrange(4)
+            request[k].set('val', (i, j))
+            request_vals[k] = (i, j)
+        if rng.random() < 0.05:
+            kept.append((backend.commit(request)[1], request_vals))
+
+        main[i % 4].set('val', i)
+        vals[i % 4] = i
+        if i % 3 == 0:
+            kept.append((backend.commit(main)[1], list(vals)))
+        kept = kept[-20:]
+    backend.compact()
+    assert len(backend.parents) <= 1 + len(kept) + 1
+
+    for commit_vnodes, commit_vals in kept + [(main, vals)]:
+        for k, vnode in enumerate(commit_vnodes):
+            assert vnode.get('val') == commit_vals[k]
+            assert vnode.get('next') == commit_vnodes[(k + 1) % 4]
+            assert history_values(vnode, 'val')[-1] == commit_vals[k]
+
+    # Once only the main head is left, so are just its values
+    commit_vnodes = kept[-1][0]
+    del kept, commit_vnodes, request
+    backend.compact()
+    assert len(backend.parents) == 1
+    assert len(backend.dnodes) == 4
+    assert sum(num_mods(dnode) for dnode in backend.dnodes) <= 3 * 2 * 4
+    for k, vnode in enumerate(main):
+        assert vnode.get('val') == vals[k]
+        assert vnode.get('next') == main[(k + 1) % 4]
+        assert history_values(vnode, 'val') == [vals[k]]
+
+    # And the versions left work as before
+    _, branch = backend.branch(main)
+    branch[0].set('val', 'branch')
+    main[0].set('val', 'main')
+    assert branch[0].get('val') == 'branch'
+    assert main[0].get('val') == 'main'
+    assert branch[1].get('val') == main[1].get('val') == vals[1]
+
+
+def test_copy_backend_clones_reachable():
+    backend = timetree.backend.CopyBackend()
+    head = backend.branch()
+
+    # A long chain, which cloning mustn't recurse down
+    first = vnode = head.new_node()
+    for i in range(20000):
+        next_vnode = head.new_node()
+        vnode.set('next', next_vnode)
+        vnode = next_vnode
+    vnode.set('next', first)
+    temps = [head.new_node() for _ in range(1000)]
+    temps[0].set('next', first)
+    del temps
+
+    commit, (commit_first,) = backend.commit([first])
+    assert len(commit.vnodes) == 20001
+    vnode = commit_first
+    for i in range(20001):
+        assert vnode.version is commit
+        vnode = vnode.get('next')
+    assert vnode == commit_first
+
+    # Nodes dropped from the structure aren't copied again
+    first.set('next', first)
+    commit, (commit_first,) = backend.commit([first])
+    assert commit.vnodes == [commit_first]
+    assert commit_first.get('next') == commit_first
+
+
+def test_copy_on_write_backend_merges():
+    # Randomly write, commit and merge versions in both a CopyOnWriteBackend
+    # and the reference CopyBackend, checking they always agree
+    rng = random.Random(0)
+    backends = [timetree.backend.CopyBackend(), timetree.backend.CopyOnWriteBackend()]
+    heads = []
+    for backend in backends:
+        head = backend.branch()
+        heads.append([head.new_node() for _ in range(3)])
+    commits = []
+
+    def read(vnodes):
+        """ Values of every field, with pointers as indexes into vnodes """
+        result = []
+        for vnode in vnodes:
+            values = {}
+            for field, value in vnode.items():
+                values[field] = ('ptr', vnodes.index(value)) if isinstance(value, timetree.backend.base.BaseVnode) else value
+            result.append(values)
+        return result
+
+    for step in range(300):
+        op = rng.random()
+        if op < 0.6:
+            i = rng.randrange(len(heads[0]))
+            field = rng.choice('abc')
+            if rng.random() < 0.4:
+                j = rng.randrange(len(heads[0]))
+                for vnodes in heads:
+                    vnodes[i].set(field, vnodes[j])
+            else:
+                for vnodes in heads:
+                    vnodes[i].set(field, step)
+        elif op < 0.7:
+            for vnodes in heads:
+                vnodes.append(vnodes[0].version.new_node())
+        elif op < 0.85:
+            commits.append([backend.commit(vnodes)[1] for backend, vnodes in zip(backends, heads)])
+        elif commits:
+            # Branch from a few commits at once, keeping all their vnodes
+            merged = rng.sample(commits, min(len(commits), rng.randint(1, 3)))
+            for k, backend in enumerate(backends):
+                heads[k] = backend.branch([vnode for commit in merged for vnode in commit[k]])[1]
+
+        for commit in commits:
+            assert read(commit[0]) == read(commit[1])
+        assert read(heads[0]) == read(heads[1])
+
+
+def test_copy_on_write_backend_collects_mounts():
+    backend = timetree.backend.CopyOnWriteBackend()
+    head = backend.branch()
+    ring = [head.new_node() for _ in range(10)]
+    for i, vnode in enumerate(ring):
+        vnode.set('next', ring[(i + 1) % 10])
+    _, ring = backend.commit(ring[:1])
+    patch = backend.branch().new_node()
+
+    # Each merge mounts a new patch and drops the link to the last one
+    for m in range(1000):
+        patch.set('val', m)
+        _, patch_commit = backend.commit([patch])
+        merged, [first, new_patch] = backend.branch(ring + patch_commit)
+        first.set('patch', new_patch)
+        _, ring = backend.commit([first])
+        mounts = sum(1 for _ in merged.root.mounts.items())
+        assert mounts == merged.mounts <= 2 * backend.collection_interval
+        assert ring[0].get('patch').get('val') == m
+
+
+@pytest.mark.parametrize('backend_cls', [
+    timetree.backend.BsearchPartialBackend,
+    timetree.backend.CompactBsearchPartialBackend,
+    timetree.backend.SplitPartialBackend,
+    timetree.backend.BsearchLinearizedFullBackend,
+    timetree.backend.BSTLinearizedFullBackend,
+    timetree.backend.SplitLinearizedFullBackend,
+])
+def test_vnode_interning(backend_cls):
+    backend = backend_cls()
+    head = backend.branch()
+    vnodes = [head.new_node() for _ in range(100)]
+    for i, vnode in enumerate(vnodes):
+        vnode.set('next', vnodes[(i + 1) % 100])
+        vnode.set('val', i)
+
+    # Dereferences give back the handles still alive, even across splits
+    for j in range(70):
+        for i, vnode in enumerate(vnodes):
+            assert vnode.get('next') is vnodes[(i + 1) % 100]
+            assert dict(vnode.items())['next'] is vnodes[(i + 1) % 100]
+            vnode.set('val', (i, j))
+        backend.commit(vnodes[:1])
+
+    commit, commit_vnodes = backend.commit(vnodes)
+    for i, vnode in enumerate(commit_vnodes):
+        assert vnode.get('next') is commit_vnodes[(i + 1) % 100]
+        assert vnode.get_many(['next'])['next'] is commit_vnodes[(i + 1) % 100]
+    assert len({vnode: None for vnode in commit_vnodes + vnodes}) == 200
+
+    # Handles dropped while walking are swept from the cache
+    del commit_vnodes
+    vnode = backend.commit([vnodes[0]])[1][0]
+    for i in range(1000):
+        vnode = vnode.get('next')
+        assert vnode.get('val') == ((i + 1) % 100, 69)
+    assert len(vnode.version.vnode_cache) <= 128
+
+
+def test_split_linearized_full_split_points():
+    # Write pointers and values over a few branches, checking each dnode's
+    # running counts against counting from scratch
+    backend = timetree.backend.SplitLinearizedFullBackend()
+    rng = random.Random(0)
+    head = backend.branch()
+    heads = [[head.new_node() for _ in range(5)]]
+    kept = []
+    for step in range(3000):
+        vnodes = rng.choice(heads)
+        vnode = rng.choice(vnodes)
+        if rng.random() < 0.5:
+            vnode.set(rng.choice('ab'), rng.choice(vnodes))
+        else:
+            vnode.set('val', step)
+        if rng.random() < 0.05:
+            commit = backend.commit(vnodes)[1]
+            kept.append(commit)
+            if rng.random() < 0.5:
+                heads.append(backend.branch(commit)[1])
+        if step % 1000 == 999:
+            del kept[:len(kept) // 2]
+            backend.compact()
+
+        for dnode in list(backend.dnodes):
+            counts = {}
+            for mods in dnode.mods_dict.values():
+                for mod in mods:
+                    counts[mod.start_version] = counts.get(mod.start_version, 0) + 1
+            assert dnode.num_mods == sum(counts.values())
+            for mod in dnode.backrefs:
+                counts[mod.start_version] = counts.get(mod.start_version, 0) + 1
+            assert dnode.split_counts == counts
+            assert dnode.split_points == sorted(counts)
+
+
+@pytest.mark.persistence_partial
+def test_node_identity(backend):
+    head = backend.branch()
+    vnode = head.new_node()
+    other = head.new_node()
+    assert vnode.identity is not other.identity
+
+    commits = []
+    for i in range(200):
+        vnode.set('val', i)
+        vnode.set('other', other)
+        commits.append(backend.commit([vnode])[1][0])
+
+    # Every version of a node shares its identity, even after splits
+    for old_vnode in commits:
+        assert old_vnode.identity is vnode.identity
+        assert old_vnode.get('other').identity is other.identity
+    assert head.new_node().identity is not vnode.identity
+
+
+@pytest.mark.parametrize('mods_cls', [SplayPredecessorDict, TreapPredecessorDict])
+def test_bst_backend_reads_without_splaying(mods_cls):
+    backend = timetree.backend.BSTLinearizedFullBackend(splay_reads=False, mods_cls=mods_cls)
+    head = backend.branch()
+    vnode = head.new_node()
+    commits = []
+    for i in range(100):
+        vnode.set('val', i)
+        commits.append(backend.commit([vnode])[1][0])
+
+    def shape(node):
+        return None if node is None else (node.key, shape(node.left), shape(node.right))
+
+    # Neither gets nor history restructure the trees
+    mods = vnode.dnode.mods_dict['val']
+    before = shape(mods.root)
+    for i, commit in enumerate(commits):
+        assert commit.get('val') == i
+        assert history_values(commit, 'val')[-1] == i
+    assert shape(mods.root) == before
+
+
+@pytest.mark.persistence_partial
+def test_concurrent_committed_reads(backend):
+    if isinstance(backend, timetree.backend.BSTLinearizedFullBackend):
+        # Splaying reads restructure the tree, so can't run concurrently
+        backend = timetree.backend.BSTLinearizedFullBackend(
+            splay_reads=False, mods_cls=backend.mods_cls)
+
+    num_nodes = 8
+    num_readers = 4
+    head = backend.branch()
+    nodes = [head.new_node() for _ in range(num_nodes)]
+    for vnode, next_vnode in zip(nodes, nodes[1:]):
+        vnode.set('next', next_vnode)
+
+    commits = []
+    done = threading.Event()
+    errors = []
+
+    def write():
+        try:
+            for i in range(300):
+                for vnode in nodes:
+                    vnode.set('val', i)
+                # Churn through fields so split backends split
+                nodes[i % num_nodes].set('extra%d' % (i % 5), i)
+                commits.append((i, backend.commit(nodes[:1])[1][0]))
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+        finally:
+            done.set()
+
+    def read(seed):
+        rng = random.Random(seed)
+        try:
+            while not done.is_set():
+                if not commits:
+                    continue
+                i, vnode = commits[rng.randrange(len(commits))]
+                for _ in range(num_nodes - 1):
+                    assert vnode.get('val') == i
+                    vnode = vnode.get('next')
+                assert vnode.get('val') == i
+                assert history_values(vnode, 'val')[-1] == i
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=write)]
+    threads.extend(threading.Thread(target=read, args=(n,)) for n in range(num_readers))
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    if errors:
+        raise errors[0]
+
+
+@pytest.mark.parametrize('backend_cls', [
+    timetree.backend.BsearchLinearizedFullBackend,
+    timetree.backend.BSTLinearizedFullBackend,
+    timetree.backend.SplitLinearizedFullBackend,
+])
+def test_full_backend_bucket_labeler(backend_cls):
+    test_full_backend(backend_cls(version_list_cls=BucketLabelerList))
+    test_full_backend_binary_tree_split(backend_cls(version_list_cls=BucketLabelerList))
+    test_full_backend_hot_field(backend_cls(version_list_cls=BucketLabelerList))
+    test_full_backend_history(backend_cls(version_list_cls=BucketLabelerList))
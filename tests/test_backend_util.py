@@ -2,13 +2,18 @@ import random
 
 import pytest
 
+from timetree.backend.util.order_maintenance import BucketLabelerList
+from timetree.backend.util.order_maintenance import BucketLabelerNode
 from timetree.backend.util.order_maintenance import ExponentialLabelerList
 from timetree.backend.util.order_maintenance import ExponentialLabelerNode
 from timetree.backend.util.order_maintenance import FastLabelerList
 from timetree.backend.util.order_maintenance import FastLabelerNode
 from timetree.backend.util.order_maintenance import QuadraticLabelerList
 from timetree.backend.util.order_maintenance import QuadraticLabelerNode
+from timetree.backend.util.persistent_map import PersistentIntMap
+from timetree.backend.util.predecessor import PeekingSplayPredecessorDict
 from timetree.backend.util.predecessor import SplayPredecessorDict
+from timetree.backend.util.predecessor import TreapPredecessorDict
 
 
 @pytest.mark.parametrize("lst_fn,node_fn", [
@@ -25,7 +30,11 @@ from timetree.backend.util.predecessor import SplayPredecessorDict
         lambda: FastLabelerList(),
         lambda: FastLabelerNode(),
     ),
-], ids=['ExponentialLabeler', 'QuadraticLabeler', 'FastLabeler'])
+    pytest.param(
+        lambda: BucketLabelerList(),
+        lambda: BucketLabelerNode(),
+    ),
+], ids=['ExponentialLabeler', 'QuadraticLabeler', 'FastLabeler', 'BucketLabeler'])
 def test_labeler(lst_fn, node_fn):
     lst = lst_fn()
 
@@ -57,8 +66,9 @@ def test_labeler(lst_fn, node_fn):
         assert all(l1 < l2 for l1, l2 in zip(labels, labels[1:]))
 
 
-def test_predecessor():
-    dct = SplayPredecessorDict()
+@pytest.mark.parametrize('dct_cls', [SplayPredecessorDict, PeekingSplayPredecessorDict, TreapPredecessorDict])
+def test_predecessor(dct_cls):
+    dct = dct_cls()
 
     with pytest.raises(KeyError):
         dct.get_pred(-1)
@@ -82,3 +92,188 @@ def test_predecessor():
     assert dct.get_pred(-1) == 'val 2'
     with pytest.raises(KeyError):
         dct.get_pred(-2)
+
+
+@pytest.mark.parametrize('dct_cls', [SplayPredecessorDict, PeekingSplayPredecessorDict, TreapPredecessorDict])
+def test_predecessor_random(dct_cls):
+    dct = dct_cls()
+    expected = {}
+    for _ in range(2000):
+        key = random.randrange(500)
+        value = random.random()
+        dct.set(key, value)
+        expected[key] = value
+
+        query = random.randrange(-1, 501)
+        keys = [k for k in expected if k <= query]
+        if keys:
+            assert dct.peek_pred(query) == expected[max(keys)]
+            assert dct.get_pred(query) == expected[max(keys)]
+        else:
+            with pytest.raises(KeyError):
+                dct.peek_pred(query)
+
+
+@pytest.mark.parametrize('dct_cls', [SplayPredecessorDict, PeekingSplayPredecessorDict, TreapPredecessorDict])
+def test_predecessor_build_from_sorted(dct_cls):
+    dct = dct_cls.build_from_sorted((i * 2, 'val %d' % i) for i in range(100))
+
+    with pytest.raises(KeyError):
+        dct.get_pred(-1)
+    for key in range(200):
+        assert dct.peek_pred(key) == 'val %d' % (key // 2)
+        assert dct.get_pred(key) == 'val %d' % (key // 2)
+
+    dct.set(201, 'val 201')
+    assert dct.get_pred(300) == 'val 201'
+    assert dct.get_pred(199) == 'val 99'
+
+    assert dct_cls.build_from_sorted([]).root is None
+
+
+@pytest.mark.parametrize('dct_cls', [SplayPredecessorDict, TreapPredecessorDict])
+def test_predecessor_peeking_reads(dct_cls):
+    dct = dct_cls.peeking_cls().build_from_sorted((i, 'val %d' % i) for i in range(100))
+
+    def shape(node):
+        return None if node is None else (node.key, shape(node.left), shape(node.right))
+
+    # No read restructures the tree
+    before = shape(dct.root)
+    for key in random.sample(range(100), 20):
+        assert dct.get_pred(key) == 'val %d' % key
+        assert dct.successor(key - 1) == (key, 'val %d' % key)
+        assert list(dct.items_between(key, key + 2))[0] == (key, 'val %d' % key)
+    assert shape(dct.root) == before
+
+
+def test_treap_build_from_sorted():
+    # The tree is a heap on priorities, built without touching the global
+    # random state
+    state = random.getstate()
+    dct = TreapPredecessorDict.build_from_sorted((i, i) for i in range(1000))
+    assert random.getstate() == state
+    assert len(dct) == 1000
+    assert list(dct) == list(range(1000))
+
+    stack = [dct.root]
+    while stack:
+        node = stack.pop()
+        for child in (node.left, node.right):
+            if child is not None:
+                assert child.priority <= node.priority
+                stack.append(child)
+
+
+@pytest.mark.parametrize('dct_cls', [SplayPredecessorDict, PeekingSplayPredecessorDict, TreapPredecessorDict])
+def test_predecessor_range_queries(dct_cls):
+    dct = dct_cls()
+    assert len(dct) == 0
+    assert list(dct) == []
+    with pytest.raises(KeyError):
+        dct.successor(0)
+    with pytest.raises(KeyError):
+        dct.delete(0)
+
+    keys = list(range(0, 100, 3))
+    random.shuffle(keys)
+    for key in keys:
+        dct.set(key, 'val %d' % key)
+    dct.set(3, 'other val 3')
+    assert len(dct) == len(keys)
+    assert list(dct) == sorted(keys)
+    assert list(dct.items())[:2] == [(0, 'val 0'), (3, 'other val 3')]
+
+    assert list(dct.items_between(10, 20)) == [(12, 'val 12'), (15, 'val 15'), (18, 'val 18')]
+    assert list(dct.items_between(12, 13)) == [(12, 'val 12')]
+    assert list(dct.items_between(13, 15)) == []
+    assert [key for key, _ in dct.items_between(None, 7)] == [0, 3, 6]
+    assert [key for key, _ in dct.items_between(92, None)] == [93, 96, 99]
+
+    assert dct.successor(-1) == (0, 'val 0')
+    assert dct.successor(12) == (15, 'val 15')
+    assert dct.successor(13) == (15, 'val 15')
+    with pytest.raises(KeyError):
+        dct.successor(99)
+
+    dct.delete(15)
+    with pytest.raises(KeyError):
+        dct.delete(15)
+    assert len(dct) == len(keys) - 1
+    assert dct.successor(12) == (18, 'val 18')
+    assert dct.get_pred(16) == 'val 12'
+    for key in sorted(keys):
+        if key != 15:
+            dct.delete(key)
+    assert len(dct) == 0
+    assert dct.root is None
+
+
+def test_fast_labeler_int_label():
+    lst = FastLabelerList()
+    nodes = []
+    for i in range(2000):
+        node = FastLabelerNode()
+        node.insert_self(random.choice(nodes) if nodes and i % 3 else lst)
+        nodes.append(node)
+
+    # Labels are plain ints matching the (upper, lower) label order
+    for node in nodes:
+        assert isinstance(node.label, int)
+    in_order = list(lst)
+    assert sorted(nodes, key=lambda node: node.label) == in_order
+    assert sorted(nodes, key=lambda node: (node.lower.upper.label, node.lower.label)) == in_order
+
+    node = in_order[5]
+    node.remove_self()
+    assert node.label is None
+
+
+@pytest.mark.parametrize("lst_cls", [FastLabelerList, BucketLabelerList])
+def test_labeler_remove(lst_cls):
+    lst = lst_cls()
+    first = lst_cls.node_cls()
+    first.insert_self(lst)
+    nodes = [first]
+    for i in range(1000):
+        node = lst_cls.node_cls()
+        # Hammer one spot to force relabeling
+        node.insert_self(first if i % 2 else random.choice(nodes))
+        nodes.append(node)
+
+    random.shuffle(nodes)
+    for node in nodes[:900]:
+        node.remove_self()
+        assert node.label is None
+    for i in range(500):
+        node = lst_cls.node_cls()
+        node.insert_self(random.choice([lst] + list(lst)))
+
+    labels = [node.label for node in lst]
+    assert len(labels) == 601
+    assert all(l1 < l2 for l1, l2 in zip(labels, labels[1:]))
+
+
+def test_persistent_int_map():
+    edit = object()
+    maps = [PersistentIntMap()]
+    dcts = [{}]
+    for i in range(3000):
+        # Occasionally start a new epoch, freezing the maps made so far
+        if i % 100 == 0:
+            edit = object()
+            maps.append(maps[-1])
+            dcts.append(dict(dcts[-1]))
+        key = random.randrange(5000)
+        maps[-1] = maps[-1].set(key, 'val %d' % i, edit)
+        dcts[-1][key] = 'val %d' % i
+
+    for mp, dct in zip(maps, dcts):
+        assert list(mp.items()) == sorted(dct.items())
+        for key in range(5000):
+            assert mp.get(key) == dct.get(key)
+        assert mp.get(1 << 40, 'default') == 'default'
+
+    # Writes under the same token modify the map in place
+    assert maps[-1].set(0, 'zero', edit) is maps[-1]
+    assert maps[-2].set(0, 'zero', edit) is not maps[-2]
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import timetree.bench
+from timetree.bench.__main__ import main
+
+tiny_params = {
+    'head_writes': {'nodes': 4, 'sets': 20},
+    'small_sets': {'nodes': 4, 'commits': 5, 'sets_per_commit': 3},
+    'commit_chain': {'length': 10},
+    'hot_counter': {'commits': 10},
+    'branch_tree': {'branches': 10},
+    'historical_reads': {'nodes': 4, 'commits': 10, 'reads': 50},
+    'present_reads': {'nodes': 4, 'commits': 10, 'reads': 50},
+    'sliding_window': {'nodes': 4, 'commits': 10, 'window': 3},
+    'branch_requests': {'nodes': 4, 'requests': 10, 'window': 3},
+    'merge_commits': {'nodes': 4, 'merges': 3, 'handles': 2},
+}
+
+
+@pytest.mark.parametrize('workload_name', sorted(timetree.bench.WORKLOADS))
+@pytest.mark.parametrize('backend_name', sorted(timetree.bench.BACKENDS))
+def test_workload(backend_name, workload_name):
+    result = timetree.bench.run_one(backend_name, workload_name, tiny_params[workload_name])
+    if 'skipped' in result:
+        return
+    assert result['ops'] == sum(latency['count'] for latency in result['latency'].values())
+    for latency in result['latency'].values():
+        assert latency['p50'] <= latency['p90'] <= latency['p99'] <= latency['max']
+    assert result['peak_memory'] > 0
+
+
+def test_compare_baseline(tmpdir):
+    baseline = tmpdir.join('baseline.json')
+    args = ['-b', 'BsearchPartialBackend', '-w', 'commit_chain', '-p', 'commit_chain.length=10', '--no-memory']
+
+    assert main(args + ['-o', str(baseline)]) == 0
+    report = json.loads(baseline.read())
+    assert [result['workload'] for result in report['results']] == ['commit_chain']
+
+    # Compare against a baseline claiming to be infinitely fast
+    report['results'][0]['ops_per_sec'] = float('inf')
+    baseline.write(json.dumps(report))
+    assert main(args + ['--baseline', str(baseline), '-o', str(tmpdir.join('new.json'))]) == 1
+
+
+tiny_micro_params = {
+    'labeler_compare': {'size': 50, 'comparisons': 100},
+    'labeler_insert': {'size': 300, 'pattern': 'random'},
+    'bsearch_historical_get': {'mods': 100, 'reads': 100},
+    'proxy_access': {'calls': 100},
+    'predecessor_reads': {'keys': 50, 'reads': 100, 'hot': 4},
+    'concurrent_reads': {'readers': 2, 'nodes': 4, 'commits': 10, 'reads': 100},
+}
+
+
+@pytest.mark.parametrize('micro_name', sorted(timetree.bench.MICROBENCHMARKS))
+def test_micro(micro_name):
+    result = timetree.bench.run_micro(micro_name, tiny_micro_params[micro_name], repeat=1)
+    assert len(result['variants']) >= 2
+    for variant in result['variants'].values():
+        assert variant['ops'] > 0
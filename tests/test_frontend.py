@@ -1,3 +1,6 @@
+import asyncio
+import threading
+
 import pytest
 
 import timetree
@@ -52,3 +55,373 @@ def test_frontend_branch(backend):
     a.num = 4
     assert a.num == 4
     assert b.num == 5
+
+
+@timetree.make_persistent
+class Counter(object):
+    step = 1
+
+    def __init__(self):
+        self.count = 0
+
+    def bump(self):
+        self.count += self.step
+        return self.count
+
+
+@pytest.mark.persistence_partial
+def test_frontend_method_version(backend):
+    a = Counter(timetree_backend=backend)
+    a.bump()
+    old_a = timetree.commit(a)
+    assert a.bump() == 2
+    assert old_a.count == 1
+    # The method wrapper is shared, and reads the version from its proxy
+    assert a.bump.__func__ is old_a.bump.__func__
+    assert a.bump.__self__ is a
+
+
+@pytest.mark.persistence_none
+def test_frontend_shadow_class_attr(backend):
+    with timetree.use_backend(backend):
+        a = Counter()
+        b = Counter()
+    assert a.step == 1
+    a.step = 5
+    assert a.step == 5
+    assert b.step == 1
+    assert a.bump() == 5
+    a.bump = 'not a method'
+    assert a.bump == 'not a method'
+    assert b.bump() == 1
+
+
+@pytest.mark.persistence_none
+def test_frontend_class_mutation(backend):
+    @timetree.make_persistent
+    class Greeter(object):
+        def greet(self):
+            return 'hello'
+
+    a = Greeter(timetree_backend=backend)
+    assert a.greet() == 'hello'
+    Greeter.greet = lambda self: 'goodbye'
+    assert a.greet() == 'goodbye'
+    Greeter.name = 'greeter'
+    assert a.name == 'greeter'
+    # The proxy class's override is gone, uncovering the original method
+    del Greeter.greet
+    assert a.greet() == 'hello'
+
+
+@pytest.mark.persistence_none
+def test_frontend_base_class_mutation(backend):
+    class Base(object):
+        def greet(self):
+            return 'old'
+
+    @timetree.make_persistent
+    class Greeter(Base):
+        pass
+
+    a = Greeter(timetree_backend=backend)
+    assert a.greet() == 'old'
+    Base.greet = lambda self: 'new'
+    assert a.greet() == 'new'
+    del Base.greet
+    with pytest.raises(AttributeError):
+        a.greet()
+
+    # Class attributes added after an instance set the name don't hide it
+    a.x = 1
+    Greeter.x = 5
+    assert a.x == 1
+    a.y = 2
+    Base.y = 6
+    assert a.y == 2
+    assert (Greeter.x, Greeter.y) == (5, 6)
+    del a.x
+    assert a.x == 5
+
+
+@pytest.mark.persistence_none
+def test_frontend_class_attr_cache(backend):
+    class Base(object):
+        @classmethod
+        def name(cls):
+            return cls.__name__
+
+        @staticmethod
+        def double(x):
+            return 2 * x
+
+    @timetree.make_persistent
+    class Thing(Base):
+        pass
+
+    a = Thing(timetree_backend=backend)
+    assert a.name() == 'ThingTimetreeProxy'
+    assert a.double(2) == 4
+
+    # Descriptors which make a new object on each read from the class are
+    # still cached
+    entries = dict(Thing._timetree_class_attrs)
+    assert a.name() == 'ThingTimetreeProxy'
+    assert a.double(3) == 6
+    assert Thing._timetree_class_attrs['name'] is entries['name']
+    assert Thing._timetree_class_attrs['double'] is entries['double']
+
+    Base.double = staticmethod(lambda x: 3 * x)
+    assert a.double(2) == 6
+    Base.triple = staticmethod(lambda x: 3 * x)
+    assert a.triple(2) == 6
+
+
+@pytest.mark.persistence_none
+def test_frontend_data_descriptors(backend):
+    @timetree.make_persistent
+    class Temperature(object):
+        @property
+        def fahrenheit(self):
+            return self.celsius * 9 / 5 + 32
+
+        @fahrenheit.setter
+        def fahrenheit(self, value):
+            self.celsius = (value - 32) * 5 / 9
+
+        @fahrenheit.deleter
+        def fahrenheit(self):
+            del self.celsius
+
+    t = Temperature(timetree_backend=backend)
+    t.fahrenheit = 212
+    assert t.celsius == 100
+    assert 'fahrenheit' not in dict(timetree.frontend._proxy_to_vnode(t).items())
+    del t.fahrenheit
+    with pytest.raises(AttributeError):
+        t.celsius
+
+    # Descriptors added after make_persistent are picked up too
+    Temperature.kelvin = property(
+        lambda self: self.celsius + 273,
+        lambda self, value: setattr(self, 'celsius', value - 273))
+    t.kelvin = 373
+    assert t.celsius == 100
+    assert t.fahrenheit == 212
+
+
+@pytest.mark.persistence_none
+def test_frontend_base_data_descriptors(backend):
+    class Base(object):
+        pass
+
+    @timetree.make_persistent
+    class Thermometer(Base):
+        pass
+
+    # Descriptors added to non-persistent bases win over instance fields
+    m = Thermometer(timetree_backend=backend)
+    m.temp = 10
+    assert m.temp == 10
+    Base.temp = property(
+        lambda self: self.reading,
+        lambda self, value: setattr(self, 'reading', value))
+    m.temp = 42
+    assert m.reading == 42
+    assert m.temp == 42
+    assert dict(timetree.frontend._proxy_to_vnode(m).items())['temp'] == 10
+    del Base.temp
+    assert m.temp == 10
+
+
+@pytest.mark.persistence_none
+def test_frontend_class_hidden_data_descriptors(backend):
+    class InstanceOnly(object):
+        """ Data descriptor which can't be read from the class """
+        def __get__(self, instance, owner):
+            if instance is None:
+                raise AttributeError('instance only')
+            return instance.raw
+
+        def __set__(self, instance, value):
+            instance.raw = value * 2
+
+        def __delete__(self, instance):
+            del instance.raw
+
+    @timetree.make_persistent
+    class Doubler(object):
+        value = InstanceOnly()
+
+    d = Doubler(timetree_backend=backend)
+    d.value = 2
+    assert d.raw == 4
+    assert d.value == 4
+    assert 'value' not in dict(timetree.frontend._proxy_to_vnode(d).items())
+    del d.value
+    with pytest.raises(AttributeError):
+        d.raw
+
+
+@pytest.mark.persistence_partial
+def test_frontend_proxy_bookkeeping(backend):
+    with timetree.use_backend(backend):
+        a = PersistentObject()
+        a.b = PersistentObject()
+    a.num = 0
+    # Vnodes hold only user fields; proxies are reused for the same vnode
+    assert sorted(dict(timetree.frontend._proxy_to_vnode(a).items())) == ['b', 'num']
+    assert a.b is a.b
+
+    commits = []
+    for i in range(200):
+        a.num = i
+        commits.append(timetree.commit(a))
+    for i, old_a in enumerate(commits):
+        assert isinstance(old_a.b, PersistentObject)
+        assert old_a.b is old_a.b
+        assert old_a.num == i
+
+
+@timetree.make_persistent
+class Stack(object):
+    def __init__(self, val=None, below=None):
+        self.val = val
+        self.below = below
+
+    def push(self, val):
+        # Creates the new node at the current version, i.e. this stack's
+        self.below = Stack(self.val, self.below)
+        self.val = val
+
+    def to_list(self):
+        result = []
+        node = self
+        while node is not None:
+            result.append(node.val)
+            node = node.below
+        return result
+
+
+@pytest.mark.persistence_none
+def test_frontend_use_version_exception(backend):
+    with pytest.raises(RuntimeError):
+        with timetree.use_backend(backend):
+            raise RuntimeError
+    # The version was reset, so this isn't persistent
+    assert not isinstance(PersistentObject(), timetree.frontend.TimetreeProxy)
+
+
+@pytest.mark.persistence_none
+def test_frontend_threads(backend):
+    num_threads = 8
+    pushes = 200
+    barrier = threading.Barrier(num_threads)
+    results = [None] * num_threads
+    errors = []
+
+    def worker(n):
+        try:
+            # Each thread writes concurrently, so has its own backend, as
+            # well as its own version context
+            backend_n = type(backend)()
+            version = backend_n.branch()
+            with timetree.use_version(version):
+                stack = Stack()
+                barrier.wait()
+                for i in range(pushes):
+                    stack.push((n, i))
+                    assert timetree.get_proxy_version(stack.below) is version
+                results[n] = stack.to_list()
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    for n, result in enumerate(results):
+        assert result == [(n, i) for i in reversed(range(pushes))] + [None]
+
+
+@pytest.mark.persistence_partial
+def test_frontend_threads_shared_backend(backend):
+    if isinstance(backend, timetree.backend.BSTLinearizedFullBackend):
+        # Splaying reads restructure the tree, so can't run concurrently
+        backend = timetree.backend.BSTLinearizedFullBackend(
+            splay_reads=False, mods_cls=backend.mods_cls)
+
+    num_threads = 8
+    pushes = 200
+    # Threads sharing a backend take turns writing to it, as use_version
+    # requires, while reading its commits at the same time
+    write_lock = threading.Lock()
+    barrier = threading.Barrier(num_threads)
+    results = [None] * num_threads
+    errors = []
+
+    def expected(n, pushed):
+        return [(n, i) for i in reversed(range(pushed))] + [None]
+
+    def worker(n, version):
+        try:
+            with timetree.use_version(version):
+                with write_lock:
+                    stack = Stack()
+                barrier.wait()
+                commits = []
+                for i in range(pushes):
+                    with write_lock:
+                        stack.push((n, i))
+                        if i % 20 == 0:
+                            commits.append((i + 1, timetree.commit(stack)))
+                    if i % 20 == 10:
+                        pushed, commit = commits[-1]
+                        assert commit.to_list() == expected(n, pushed)
+                with write_lock:
+                    results[n] = stack.to_list()
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    # Each thread has its own version context (though partially persistent
+    # backends only have the one head to give out)
+    threads = [
+        threading.Thread(target=worker, args=(n, backend.branch()))
+        for n in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    for n, result in enumerate(results):
+        assert result == expected(n, pushes)
+
+
+@pytest.mark.persistence_partial
+def test_frontend_asyncio_tasks(backend):
+    num_tasks = 16
+    pushes = 50
+
+    async def worker(n):
+        # Each task has its own version context, and its own branch (though
+        # partially persistent backends only have the one head to give out)
+        version = backend.branch()
+        with timetree.use_version(version):
+            stack = Stack()
+            for i in range(pushes):
+                stack.push((n, i))
+                await asyncio.sleep(0)
+                assert timetree.get_proxy_version(stack.below) is version
+            return stack.to_list()
+
+    async def main():
+        return await asyncio.gather(*(worker(n) for n in range(num_tasks)))
+
+    results = asyncio.run(main())
+    for n, result in enumerate(results):
+        assert result == [(n, i) for i in reversed(range(pushes))] + [None]